@@ -0,0 +1,6 @@
+"""Serving utilities shared by the cost estimation and worker safety services.
+
+Each service lists this directory in its requirements.txt (``-e ../common``),
+so ``pip install -r requirements.txt`` from the service directory makes the
+package importable from anywhere, worker processes included.
+"""
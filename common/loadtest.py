@@ -0,0 +1,350 @@
+"""HTTP load testing against a locally started server, with no dependencies.
+
+A workload is an iterator of request factories; :func:`run_load` sends them
+from ``concurrency`` threads and reports latency percentiles, throughput and
+errors. :class:`LocalServer` starts ``app.py`` of a service in a subprocess
+on a free port, and :class:`MemorySampler` follows the resident memory of it
+and its worker processes, so a result carries the peak memory of the whole
+service.
+
+Results are written as JSON with the environment they were measured in, and
+two result files can be compared with:
+
+    python -m common.loadtest compare BASELINE.json CANDIDATE.json
+
+The workloads and server settings of each service are its ``benchmark.py
+http`` subcommand.
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SERVE = (
+    "import os\n"
+    "from app import app\n"
+    "app.run(host='127.0.0.1', port=int(os.environ['PORT']), threaded=True, debug=False)\n"
+)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _descendants(pid):
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        return []
+    return children + [grandchild for child in children for grandchild in _descendants(child)]
+
+
+def tree_rss_bytes(pid):
+    """Resident memory of ``pid`` and all of its descendants, from /proc."""
+    return sum(_rss_bytes(p) for p in [pid] + _descendants(pid))
+
+
+class MemorySampler:
+    """Samples the resident memory of a process tree on a thread and keeps the peak.
+
+    ``read`` returns the current value in bytes; it is tree_rss_bytes for a
+    local server, or a scrape of ``/metrics`` for one started elsewhere.
+    """
+
+    def __init__(self, read, interval=0.2):
+        self.read = read
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reset(self):
+        self.peak = self.read() or 0
+
+    def start(self):
+        def run():
+            while not self._stop.is_set():
+                self.peak = max(self.peak, self.read() or 0)
+                self._stop.wait(self.interval)
+
+        self.reset()
+        self._thread = threading.Thread(target=run, name='memory-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def metrics_rss_bytes(base_url):
+    """The process_resident_memory_bytes gauge from a server's /metrics, or None."""
+    try:
+        with urllib.request.urlopen(f"{base_url}/metrics", timeout=5) as response:
+            for line in response.read().decode().splitlines():
+                if line.startswith('process_resident_memory_bytes'):
+                    return float(line.split()[-1])
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+class LocalServer:
+    """``app.py`` of the service in ``directory``, served on a free port in a subprocess.
+
+    ``env`` is added to the current environment. The server counts as up once
+    ``ready_path`` answers 200; its output goes to ``log_path``.
+    """
+
+    def __init__(self, directory, ready_path, env=None, log_path=os.devnull, startup_timeout=600):
+        self.directory = directory
+        self.ready_path = ready_path
+        self.env = dict(env or {})
+        self.log_path = log_path
+        self.startup_timeout = startup_timeout
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+        self.startup_seconds = None
+
+    def __enter__(self):
+        env = {**os.environ, **self.env, 'PORT': str(self.port)}
+        self._log = open(self.log_path, 'ab')
+        start = time.perf_counter()
+        # A new session, so the server and its worker processes are stopped together
+        self.process = subprocess.Popen([sys.executable, '-c', SERVE], cwd=self.directory, env=env,
+                                        stdout=self._log, stderr=subprocess.STDOUT, start_new_session=True)
+        while True:
+            if self.process.poll() is not None:
+                self._close()
+                raise RuntimeError(f"Server in {self.directory} exited with {self.process.returncode}, see {self.log_path}")
+            if time.perf_counter() - start > self.startup_timeout:
+                self._close()
+                raise RuntimeError(f"Server in {self.directory} not ready after {self.startup_timeout}s")
+            try:
+                with urllib.request.urlopen(self.url + self.ready_path, timeout=5) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                pass
+            time.sleep(0.5)
+        self.startup_seconds = time.perf_counter() - start
+        return self
+
+    def rss_bytes(self):
+        return tree_rss_bytes(self.process.pid)
+
+    def _close(self):
+        if self.process.poll() is None:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+        self._log.close()
+
+    def __exit__(self, *exc):
+        self._close()
+
+
+def multipart(fields=(), files=()):
+    """Encode form ``fields`` (name, value) and ``files`` (name, filename, bytes, mimetype); returns (body, content type)."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data, mimetype in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {mimetype}\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def json_request(path, payload):
+    body = json.dumps(payload).encode()
+    return lambda base_url: urllib.request.Request(base_url + path, data=body, method='POST',
+                                                   headers={'Content-Type': 'application/json'})
+
+
+def multipart_request(path, fields=(), files=()):
+    body, content_type = multipart(fields, files)
+    return lambda base_url: urllib.request.Request(base_url + path, data=body, method='POST',
+                                                   headers={'Content-Type': content_type})
+
+
+def send(request, timeout):
+    """Send ``request``; returns (seconds, HTTP status or None on a connection error)."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except OSError:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def percentiles(latencies):
+    """p50/p95/p99, mean and max of ``latencies`` (seconds) in milliseconds."""
+    if not latencies:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    cuts = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else [latencies[0]] * 99
+    return {
+        'p50_ms': round(cuts[49] * 1e3, 3),
+        'p95_ms': round(cuts[94] * 1e3, 3),
+        'p99_ms': round(cuts[98] * 1e3, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1e3, 3),
+        'max_ms': round(max(latencies) * 1e3, 3),
+    }
+
+
+def run_load(base_url, requests, concurrency, count, warmup=0, timeout=120, memory=None):
+    """Send the next ``count`` requests built from the iterator ``requests`` from ``concurrency`` threads.
+
+    The first ``warmup`` requests are sent one at a time and not measured.
+    Pass the same iterator to successive runs to keep replaying new rows.
+    With a :class:`MemorySampler` the result includes the peak memory during
+    the measured requests.
+    """
+    for _ in range(warmup):
+        send(next(requests)(base_url), timeout)
+
+    lock = threading.Lock()
+    remaining = [count]
+    latencies, statuses = [], {}
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+                request = next(requests)(base_url)
+            elapsed, status = send(request, timeout)
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status is not None and status < 400:
+                    latencies.append(elapsed)
+
+    if memory is not None:
+        memory.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'requests': count,
+        'ok': len(latencies),
+        'errors': count - len(latencies),
+        'statuses': {str(status): n for status, n in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        **percentiles(latencies),
+        'peak_rss_bytes': int(memory.peak) if memory is not None else None,
+    }
+
+
+def get_json(url, timeout=30):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
+
+
+def git_revision(directory):
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=directory, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment(directory, server_env=None):
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_revision': git_revision(directory),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'server_env': dict(server_env or {}),
+    }
+
+
+def print_result(name, result):
+    print(f"{name:28s} c={result['concurrency']:<3d} {result['throughput_rps'] or 0:9.1f} req/s  "
+          f"p50 {result['p50_ms'] or 0:9.2f}  p95 {result['p95_ms'] or 0:9.2f}  p99 {result['p99_ms'] or 0:9.2f} ms  "
+          f"errors {result['errors']:<4d} peak {(result['peak_rss_bytes'] or 0) / 2 ** 20:8.1f} MiB")
+
+
+def write_results(path, document):
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+        f.write('\n')
+    print(f"Wrote {path}")
+
+
+def compare(args):
+    """Print the change of each metric between two result files for the runs they share."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    before = {(r['workload'], r['concurrency']): r for r in baseline['results']}
+    print(f"{'workload':28s} {'c':>3s} {'metric':>15s} {'baseline':>12s} {'candidate':>12s} {'change':>8s}")
+    for result in candidate['results']:
+        old = before.get((result['workload'], result['concurrency']))
+        if old is None:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_bytes'):
+            a, b = old.get(metric), result.get(metric)
+            change = f"{(b - a) / a:+.1%}" if a and b is not None else 'n/a'
+            print(f"{result['workload']:28s} {result['concurrency']:3d} {metric:>15s} {a or 0:12.2f} {b or 0:12.2f} {change:>8s}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('compare', help='compare two result files')
+    command.add_argument('baseline')
+    command.add_argument('candidate')
+    command.set_defaults(func=compare)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
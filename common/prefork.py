@@ -0,0 +1,272 @@
+"""A pre-forking WSGI server for production, built on werkzeug's threaded server.
+
+The master process opens the listening socket and, with ``preload``, loads
+the app (and so the models) once before forking ``workers`` processes that
+serve it. Forked workers share the master's memory copy-on-write, so the
+model weights are held once however many workers run. Each worker runs
+``worker_init`` (to size its thread pools) and ``warmup`` before it takes
+its first connection, so requests only ever reach a warm worker.
+
+Workers are recycled gracefully: after ``max_requests`` requests (plus a
+random ``max_requests_jitter`` so they don't all restart at once) or once
+their resident memory passes ``max_rss_bytes``, a worker stops accepting,
+finishes its in-flight requests within ``graceful_timeout`` and exits, and
+the master forks a replacement. SIGHUP to the master replaces every worker
+in turn, starting each replacement before the worker it replaces stops.
+SIGTERM or SIGINT stop the master and its workers gracefully.
+
+The hooks that load and warm up each service live in its serve.py.
+"""
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+from .metrics import process_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class _Worker:
+    def __init__(self, pid, ready_fd, replaces=None):
+        self.pid = pid
+        self.ready_fd = ready_fd
+        self.ready = False
+        self.retiring = False
+        self.replaces = replaces
+
+
+class PreforkServer:
+    """Serve the WSGI app returned by ``load_app()`` from ``workers`` forked processes."""
+
+    def __init__(self, load_app, host='0.0.0.0', port=5000, workers=2, preload=True, worker_init=None,
+                 warmup=None, max_requests=0, max_requests_jitter=0, max_rss_bytes=0, graceful_timeout=30,
+                 backlog=128):
+        self.load_app = load_app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.preload = preload
+        self.worker_init = worker_init
+        self.warmup = warmup
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss_bytes = max_rss_bytes
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self._app = None
+        self._socket = None
+        self._workers = {}
+        self._outdated = []
+        self._stopping = False
+        self._reload = False
+        self._respawn_after = 0.0
+
+    # Master
+
+    def run(self):
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self._socket = socket.create_server((self.host, self.port), family=family, backlog=self.backlog)
+        self._socket.set_inheritable(True)
+        if self.preload:
+            start = time.perf_counter()
+            self._app = self.load_app()
+            logger.info(f"Loaded the app in the master in {time.perf_counter() - start:.1f}s")
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        logger.info(f"Master {os.getpid()} listening on {self.host}:{self.port} with {self.workers} workers")
+        try:
+            while not self._stopping:
+                self._tick()
+                time.sleep(0.1)
+        finally:
+            self._stop_workers()
+            self._socket.close()
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+    def _spawn(self, replaces=None):
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_read)
+            code = 1
+            try:
+                code = self._serve(ready_write)
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} failed")
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        os.close(ready_write)
+        os.set_blocking(ready_read, False)
+        self._workers[pid] = _Worker(pid, ready_read, replaces)
+        logger.info(f"Started worker {pid}" + (f" to replace {replaces}" if replaces else ''))
+
+    def _tick(self):
+        self._reap()
+        for worker in list(self._workers.values()):
+            if not worker.ready:
+                try:
+                    worker.ready = os.read(worker.ready_fd, 1) == b'1'
+                except BlockingIOError:
+                    continue
+                if worker.ready:
+                    logger.info(f"Worker {worker.pid} is ready")
+            # A replacement takes over once it is warm
+            if worker.ready and worker.replaces is not None:
+                self._retire(worker.replaces)
+                worker.replaces = None
+
+        if self._reload:
+            self._reload = False
+            self._outdated = [pid for pid, worker in self._workers.items() if not worker.retiring]
+            logger.info(f"Replacing {len(self._outdated)} workers")
+        replacing = {worker.replaces for worker in self._workers.values() if worker.replaces is not None}
+        if self._outdated and not replacing:
+            old = self._outdated.pop()
+            if old in self._workers:
+                self._spawn(replaces=old)
+                replacing.add(old)
+
+        serving = [pid for pid, worker in self._workers.items() if not worker.retiring and pid not in replacing]
+        if time.monotonic() >= self._respawn_after:
+            for _ in range(self.workers - len(serving)):
+                self._spawn()
+
+    def _retire(self, pid):
+        worker = self._workers.get(pid)
+        if worker is not None and not worker.retiring:
+            worker.retiring = True
+            self._signal(pid, signal.SIGTERM)
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+            code = os.waitstatus_to_exitcode(status)
+            if not worker.ready:
+                # Don't fork in a tight loop while workers fail to start
+                self._respawn_after = time.monotonic() + 1.0
+                logger.error(f"Worker {pid} exited with {code} before it was ready")
+            else:
+                logger.info(f"Worker {pid} exited with {code}")
+
+    def _stop_workers(self):
+        for pid in self._workers:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._workers):
+            logger.warning(f"Killing worker {pid}, still running after {self.graceful_timeout}s")
+            self._signal(pid, signal.SIGKILL)
+        while self._workers:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            worker = self._workers.pop(pid, None)
+            if worker is not None:
+                os.close(worker.ready_fd)
+
+    # Worker
+
+    def _serve(self, ready_fd):
+        """The body of a worker process; returns its exit code."""
+        for worker in self._workers.values():
+            os.close(worker.ready_fd)
+        self._workers = {}
+        self._server = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._served = 0
+        self._limit = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else 0
+        # A SIGTERM caught by the master's handler before this point still set _stopping
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._shutdown('SIGTERM'))
+
+        if self.worker_init is not None:
+            self.worker_init()
+        app = self._app if self._app is not None else self.load_app()
+        if self.warmup is not None:
+            start = time.perf_counter()
+            self.warmup()
+            logger.info(f"Worker {os.getpid()} warmed up in {time.perf_counter() - start:.2f}s")
+
+        self._server = make_server(self.host, self.port, self._track(app), threaded=True,
+                                   fd=self._socket.fileno())
+        if self._stopping:
+            return 0
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+        self._server.serve_forever()
+
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._active and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self._active:
+            logger.warning(f"Worker {os.getpid()} exiting with {self._active} requests in flight")
+        return 0
+
+    def _track(self, app):
+        """Wrap ``app`` to count requests in flight and recycle the worker at its limits."""
+        def tracked(environ, start_response):
+            with self._lock:
+                self._active += 1
+            try:
+                return ClosingIterator(app(environ, start_response), self._finished)
+            except BaseException:
+                self._finished()
+                raise
+
+        return tracked
+
+    def _finished(self):
+        with self._lock:
+            self._active -= 1
+            self._served += 1
+            served = self._served
+        if self._limit and served >= self._limit:
+            self._shutdown(f"served {served} requests")
+        elif self.max_rss_bytes and process_rss_bytes() > self.max_rss_bytes:
+            self._shutdown(f"resident memory over {self.max_rss_bytes} bytes")
+
+    def _shutdown(self, reason):
+        """Stop accepting connections; called from a request thread or a signal handler."""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        logger.info(f"Worker {os.getpid()} stopping: {reason}")
+        if self._server is not None:
+            # shutdown() waits for serve_forever, which may be running on this very thread
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
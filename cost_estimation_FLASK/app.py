@@ -1,114 +1,294 @@
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_cors import CORS
 import numpy as np
-import pandas as pd
-from tensorflow.keras.models import load_model
-from sklearn.preprocessing import StandardScaler
+import json
 import os
 
+from batching import MicroBatcher
+from cache import PredictionCache
+from common.metrics import instrument, queue_depth
+from preprocessing import load_preprocessing
+from registry import ModelRegistry
+from stage_grid import StageGrid
+
 app = Flask(__name__)
 CORS(app)  
-
-print("hello")
+instrument(app)
 
 # Define base directories - adjust these paths as needed
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, "models")
-DATA_DIR = os.path.join(BASE_DIR, "data")
+PREPROCESSING_DIR = os.path.join(MODEL_DIR, "preprocessing")
+STAGE_GRID_PATH = os.path.join(MODEL_DIR, "stage_grid.npz")
+
+# 'fused' runs each input schema's heads as one graph, 'per_model' calls every model
+# separately, 'numpy' evaluates exported .npz bundles without importing TensorFlow
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'fused')
+
+# Concurrent requests are coalesced into one forward pass per schema
+MICRO_BATCHING = os.environ.get('MICRO_BATCHING', '1') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 64))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 2))
+
+# Predictions are cached per encoded input; a size of 0 disables the cache
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_TTL = float(os.environ.get('PREDICTION_CACHE_TTL', 600))
+
+# 'grid' answers stage predictions from the table built by 'python stage_grid.py build'
+STAGE_LOOKUP = os.environ.get('STAGE_LOOKUP', 'model')
+
+# Model versions are reloaded from MODEL_DIR while serving (see registry.py), checked
+# every MODEL_WATCH_INTERVAL seconds (0 disables). Unpinned requests use MODEL_VERSION:
+# 'default' for the files in MODEL_DIR, a directory under MODEL_DIR/versions, or 'latest'
+MODEL_VERSION = os.environ.get('MODEL_VERSION', 'default')
+MODEL_WATCH_INTERVAL = float(os.environ.get('MODEL_WATCH_INTERVAL', 5))
+
+# A SHADOW_SAMPLE_RATE fraction of unpinned predictions is repeated on SHADOW_MODEL_VERSION
+# in the background and the output drift is reported on /api/stats and /metrics
+SHADOW_MODEL_VERSION = os.environ.get('SHADOW_MODEL_VERSION') or None
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))
+
+# serve.py sets this in a master that loads the models before forking: the model
+# watcher and batcher threads then only start in the workers (init_worker_process)
+DEFER_THREADS = os.environ.get('DEFER_THREADS', '0') == '1'
 
 # Global variables to store models and data
-model_materials_stage = None
-model_days_stage = None
-model_cost_stage = None
-model_days_building = None
-model_cost_building = None
-scaler_stage = None
-scaler_building = None
-X_cols_stage = None
-X_cols_building = None
+registry = None
+encoder_stage = None
+encoder_building = None
+stage_batcher = None
+building_batcher = None
+prediction_cache = None
+stage_grid = None
+stage_grid_model = None
+warmed_up = False
 
 def load_models_and_data():
-    global model_materials_stage, model_days_stage, model_cost_stage
-    global model_days_building, model_cost_building
-    global scaler_stage, scaler_building
-    global X_cols_stage, X_cols_building
+    global registry
+    global encoder_stage, encoder_building
+    global stage_batcher, building_batcher
+    global prediction_cache
+    global stage_grid, stage_grid_model
     
-    # Load neural network models
-    model_materials_stage = load_model(os.path.join(MODEL_DIR, 'stage_material.h5'), compile=False)
-    model_days_stage = load_model(os.path.join(MODEL_DIR, 'stage_time.h5'), compile=False)
-    model_cost_stage = load_model(os.path.join(MODEL_DIR, 'stage_cost.h5'), compile=False)
+    # Load the column layouts and scaler statistics written by 'python preprocessing.py rebuild'
+    encoders = load_preprocessing(PREPROCESSING_DIR)
+    encoder_stage = encoders['stage']
+    encoder_building = encoders['building']
     
-    model_days_building = load_model(os.path.join(MODEL_DIR, 'building_time.h5'), compile=False)
-    model_cost_building = load_model(os.path.join(MODEL_DIR, 'building_cost.h5'), compile=False)
+    # Load neural network models; later versions are picked up by the registry's watcher
+    if registry is None:
+        registry = ModelRegistry(MODEL_DIR, INFERENCE_MODE, warmup_engine, MODEL_VERSION, SHADOW_MODEL_VERSION,
+                                 SHADOW_SAMPLE_RATE, MODEL_WATCH_INTERVAL)
+        if not DEFER_THREADS:
+            registry.start()
     
-    # Load and prepare scalers and columns for neural network models
-    # For stage models
-    df_stage = pd.read_csv(os.path.join(DATA_DIR, 'construction_data.csv'))
-    features_stage = df_stage.drop(columns=[
-        'cement_bags', 'sand_cubic_meters', 'steel_kg', 'bricks_units',
-        'aggregates_cubic_meters', 'estimated_days', 'estimated_cost_inr'
-    ])
-    X_full_stage = pd.get_dummies(features_stage, drop_first=True)
-    X_cols_stage = X_full_stage.columns
+    # Every request hands the batchers its model version, so they survive a reload
+    if MICRO_BATCHING and stage_batcher is None and not DEFER_THREADS:
+        start_batchers()
     
-    scaler_stage = StandardScaler()
-    scaler_stage.fit(X_full_stage)
+    # Cached predictions are dropped whenever a file under MODEL_DIR changes
+    if PREDICTION_CACHE_SIZE > 0:
+        prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, MODEL_DIR)
     
-    # For building models
-    df_building = pd.read_csv(os.path.join(DATA_DIR, 'construction_dataset_with_stage.csv'))
-    df_building['StartDate'] = pd.to_datetime(df_building['StartDate'], dayfirst=True)
-    df_building['EndDate'] = pd.to_datetime(df_building['EndDate'], dayfirst=True)
-    df_building['TotalDays'] = (df_building['EndDate'] - df_building['StartDate']).dt.days
-    df_building.drop(columns=['StartDate', 'EndDate'], inplace=True)
-    X_building = df_building.drop(columns=['TotalDays', 'ConstructionCost'])
-    X_full_building = pd.get_dummies(X_building, drop_first=True)
-    X_cols_building = X_full_building.columns
-    
-    scaler_building = StandardScaler()
-    scaler_building.fit(X_full_building)
+    # Rows outside the grid bounds still go through the models, and so do all rows
+    # once the served version is no longer the one the grid was built from
+    if STAGE_LOOKUP == 'grid':
+        if not os.path.exists(STAGE_GRID_PATH):
+            raise FileNotFoundError(f"Missing {STAGE_GRID_PATH}; run 'python stage_grid.py build'")
+        stage_grid = StageGrid(STAGE_GRID_PATH)
+        stage_grid_model = registry.get().key
+
+def warmup_engine(engine):
+    """Run one row per schema through a newly loaded engine before it can serve."""
+    engine.predict_stage(np.zeros((1, encoder_stage.n_features), dtype=np.float32))
+    engine.predict_building(np.zeros((1, encoder_building.n_features), dtype=np.float32))
+
+def start_batchers():
+    global stage_batcher, building_batcher
+
+    # Requests pass the model version they resolved, and only share a batch with the same one
+    stage_batcher = MicroBatcher(registry.predict_stage, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, name='stage-batcher')
+    building_batcher = MicroBatcher(registry.predict_building, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+                                    name='building-batcher')
+    queue_depth.set_function(lambda: stage_batcher.stats()['queue_depth'], queue='stage_batcher')
+    queue_depth.set_function(lambda: building_batcher.stats()['queue_depth'], queue='building_batcher')
+
+def init_worker_process():
+    """Runs in each serving worker forked by serve.py from a master that loaded the models."""
+    # Threads don't survive a fork, so every worker starts batchers and a model watcher of its own
+    registry.start()
+    if MICRO_BATCHING:
+        start_batchers()
+
+def warmup():
+    """Run one prediction per schema through the serving path, then report ready on /ready."""
+    global warmed_up
+    model = registry.get()
+    run_stage_models(np.zeros((1, encoder_stage.n_features), dtype=np.float32), model)
+    run_building_models(np.zeros((1, encoder_building.n_features), dtype=np.float32), model)
+    warmed_up = True
 
 # Initialize models and data
 load_models_and_data()
 
+def format_stage_prediction(materials_pred, days_pred, cost_pred):
+    return {
+        "materials": {
+            "cement_bags": float(materials_pred[0]),
+            "sand_cubic_meters": float(materials_pred[1]),
+            "steel_kg": float(materials_pred[2]),
+            "bricks_units": float(materials_pred[3]),
+            "aggregates_cubic_meters": float(materials_pred[4])
+        },
+        "estimated_stage_days": float(days_pred),
+        "estimated_stage_cost_inr": float(cost_pred)
+    }
+
+def format_building_prediction(days_pred, cost_pred):
+    return {
+        "estimated_days": float(days_pred),
+        "estimated_cost_inr": float(cost_pred)
+    }
+
+def read_batch_rows():
+    """Return (rows, errors) from a JSON array or NDJSON request body.
+
+    NDJSON lines that fail to parse are kept as ``None`` placeholders so that
+    row indexes in the response line up with the request; their messages are
+    returned in ``errors`` keyed by row index.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        return data, {}
+    if data is not None:
+        raise ValueError("Batch body must be a JSON array or NDJSON")
+
+    rows, errors = [], {}
+    for line in request.get_data(as_text=True).splitlines():
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError as e:
+            errors[len(rows)] = f"Invalid JSON: {e}"
+            rows.append(None)
+    if not rows:
+        raise ValueError("Batch body must be a JSON array or NDJSON")
+    return rows, errors
+
+def requested_model():
+    """The version pinned by the X-Model-Version header or ``model_version`` parameter, else the active one.
+
+    It is resolved once, so a reload during the request can't change which
+    version predicts, fills the cache or is named in the response.
+    """
+    g.model = registry.get(request.headers.get('X-Model-Version') or request.args.get('model_version') or None)
+    return g.model
+
+def cached_predictions(schema, scaled, predict, model):
+    """Return ``predict(scaled)``, running the models only for rows missing from the cache."""
+    if prediction_cache is None:
+        return predict(scaled)
+
+    # Keyed by the version's files too, so pinned versions and reloads never share entries
+    schema = f"{schema}@{model.key}"
+    keys = [prediction_cache.key(schema, row) for row in scaled]
+    results = [prediction_cache.get(key) for key in keys]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        for i, prediction in zip(misses, predict(scaled[misses])):
+            results[i] = prediction
+            prediction_cache.put(keys[i], prediction)
+    return results
+
+def predict_stage_matrix(scaled, model, rows=None):
+    """Stage predictions for ``scaled``; ``rows`` are the matching raw inputs used by the lookup grid."""
+    predict = lambda X: run_stage_models(X, model)
+    if stage_grid is None or rows is None or model.key != stage_grid_model:
+        return cached_predictions('stage', scaled, predict, model)
+
+    outputs, hit = stage_grid.lookup(rows)
+    results = [format_stage_prediction(out[:5], out[5], out[6]) if ok else None for out, ok in zip(outputs, hit)]
+    misses = np.flatnonzero(~hit)
+    if len(misses):
+        for i, prediction in zip(misses, cached_predictions('stage', scaled[misses], predict, model)):
+            results[i] = prediction
+    return results
+
+def predict_building_matrix(scaled, model):
+    return cached_predictions('building', scaled, lambda X: run_building_models(X, model), model)
+
+def run_stage_models(scaled, model):
+    if stage_batcher:
+        materials_pred, days_pred, cost_pred = stage_batcher.predict(scaled, model)
+    else:
+        materials_pred, days_pred, cost_pred = registry.predict_stage(scaled, model)
+    return [format_stage_prediction(m, d, c) for m, d, c in zip(materials_pred, days_pred, cost_pred)]
+
+def run_building_models(scaled, model):
+    if building_batcher:
+        days_pred, cost_pred = building_batcher.predict(scaled, model)
+    else:
+        days_pred, cost_pred = registry.predict_building(scaled, model)
+    return [format_building_prediction(d, c) for d, c in zip(days_pred, cost_pred)]
+
+def batch_response(n_rows, predictions, errors):
+    results = []
+    for i in range(n_rows):
+        if i in errors:
+            results.append({"index": i, "status": "error", "error": errors[i]})
+        else:
+            results.append({"index": i, "status": "success", **predictions[i]})
+    return {"results": results}
+
+# Predictions name the model version that served them, for unpinned requests too
+@app.after_request
+def add_model_version(response):
+    if 'model' in g:
+        response.headers['X-Model-Version'] = g.model.key
+    return response
+
 # Health check endpoint
 @app.route('/test', methods=['GET'])
 def health_check():
     return jsonify({"status": "ok", "message": "API is running"})
 
+# Readiness probe for load balancers: fails until warmup() has run in this process
+@app.route('/ready', methods=['GET'])
+def ready():
+    if not warmed_up:
+        return jsonify({"ready": False}), 503
+    return jsonify({"ready": True, "pid": os.getpid()})
+
+# Runtime statistics for tuning the serving layer
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    response = {
+        "inference_mode": registry.mode,
+        "models": registry.stats(),
+        "batching": None,
+        "cache": prediction_cache.stats() if prediction_cache else None,
+        "stage_grid": stage_grid.stats() if stage_grid else None
+    }
+    if stage_batcher:
+        response["batching"] = {
+            "stage": stage_batcher.stats(),
+            "building": building_batcher.stats()
+        }
+    return jsonify(response)
+
 # Stage-based prediction endpoint (Neural Network)
 @app.route('/api/predict/stage', methods=['POST'])
 def predict_stage():
     try:
         data = request.json
+        model = requested_model()
         
-        sample_df = pd.DataFrame([data])
-        
-        # Encode categorical features
-        sample_encoded = pd.get_dummies(sample_df, drop_first=True)
-        
-        # Align with training columns
-        sample_encoded = sample_encoded.reindex(columns=X_cols_stage, fill_value=0)
-        
-        # Scale input
-        sample_scaled = scaler_stage.transform(sample_encoded)
+        # Encode and scale input
+        sample_scaled = encoder_stage.encode_row(data)
         
         # Make predictions
-        materials_pred = model_materials_stage.predict(sample_scaled)[0]
-        days_pred = model_days_stage.predict(sample_scaled)[0][0]
-        cost_pred = model_cost_stage.predict(sample_scaled)[0][0]
-        
-        # Format response
-        response = {
-            "materials": {
-                "cement_bags": float(materials_pred[0]),
-                "sand_cubic_meters": float(materials_pred[1]),
-                "steel_kg": float(materials_pred[2]),
-                "bricks_units": float(materials_pred[3]),
-                "aggregates_cubic_meters": float(materials_pred[4])
-            },
-            "estimated_stage_days": float(days_pred),
-            "estimated_stage_cost_inr": float(cost_pred)
-        }
+        response = predict_stage_matrix(sample_scaled, model, [data])[0]
         
         return jsonify(response)
     
@@ -120,28 +300,13 @@ def predict_stage():
 def predict_building():
     try:
         data = request.json
+        model = requested_model()
         
-        # Create DataFrame
-        sample_df = pd.DataFrame([data])
-        
-        # Encode categorical features
-        sample_encoded = pd.get_dummies(sample_df, drop_first=True)
-        
-        # Align with training columns
-        sample_encoded = sample_encoded.reindex(columns=X_cols_building, fill_value=0)
-        
-        # Scale input
-        sample_scaled = scaler_building.transform(sample_encoded)
+        # Encode and scale input
+        sample_scaled = encoder_building.encode_row(data)
         
         # Make predictions
-        predicted_days = model_days_building.predict(sample_scaled)[0][0]
-        predicted_cost = model_cost_building.predict(sample_scaled)[0][0]
-        
-        # Format response
-        response = {
-            "estimated_days": float(predicted_days),
-            "estimated_cost_inr": float(predicted_cost)
-        }
+        response = predict_building_matrix(sample_scaled, model)[0]
         
         return jsonify(response)
     
@@ -153,51 +318,24 @@ def predict_building():
 def predict_all():
     try:
         data = request.json
-        
-        # Create common DataFrame
-        sample_df = pd.DataFrame([data])
+        model = requested_model()
         
         # Prepare data for stage model
-        sample_encoded_stage = pd.get_dummies(sample_df, drop_first=True)
-        sample_encoded_stage = sample_encoded_stage.reindex(columns=X_cols_stage, fill_value=0)
-        sample_scaled_stage = scaler_stage.transform(sample_encoded_stage)
+        sample_scaled_stage = encoder_stage.encode_row(data)
         
         # Prepare data for building model if applicable
         building_prediction = None
         try:
-            sample_encoded_building = pd.get_dummies(sample_df, drop_first=True)
-            sample_encoded_building = sample_encoded_building.reindex(columns=X_cols_building, fill_value=0)
-            sample_scaled_building = scaler_building.transform(sample_encoded_building)
+            sample_scaled_building = encoder_building.encode_row(data)
             
             # Building model predictions
-            predicted_days_building = model_days_building.predict(sample_scaled_building)[0][0]
-            predicted_cost_building = model_cost_building.predict(sample_scaled_building)[0][0]
-            
-            building_prediction = {
-                "estimated_days": float(predicted_days_building),
-                "estimated_cost_inr": float(predicted_cost_building)
-            }
-        except:
+            building_prediction = predict_building_matrix(sample_scaled_building, model)[0]
+        except ValueError:
             pass
         
-        # Stage model predictions
-        materials_pred = model_materials_stage.predict(sample_scaled_stage)[0]
-        days_pred = model_days_stage.predict(sample_scaled_stage)[0][0]
-        cost_pred = model_cost_stage.predict(sample_scaled_stage)[0][0]
-        
         # Combine results
         response = {
-            "stage_model": {
-                "materials": {
-                    "cement_bags": float(materials_pred[0]),
-                    "sand_cubic_meters": float(materials_pred[1]),
-                    "steel_kg": float(materials_pred[2]),
-                    "bricks_units": float(materials_pred[3]),
-                    "aggregates_cubic_meters": float(materials_pred[4])
-                },
-                "estimated_stage_days": float(days_pred),
-                "estimated_stage_cost_inr": float(cost_pred)
-            }
+            "stage_model": predict_stage_matrix(sample_scaled_stage, model, [data])[0]
         }
         
         if building_prediction:
@@ -208,6 +346,65 @@ def predict_all():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+# Batch endpoints - accept a JSON array or NDJSON body and report errors per row
+@app.route('/api/predict/stage/batch', methods=['POST'])
+def predict_stage_batch():
+    try:
+        model = requested_model()
+        rows, errors = read_batch_rows()
+        indexes, scaled, errors = encoder_stage.encode_rows(rows, errors)
+
+        predictions = {}
+        if indexes:
+            predictions = dict(zip(indexes, predict_stage_matrix(scaled, model, [rows[i] for i in indexes])))
+
+        return jsonify(batch_response(len(rows), predictions, errors))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/predict/building/batch', methods=['POST'])
+def predict_building_batch():
+    try:
+        model = requested_model()
+        rows, errors = read_batch_rows()
+        indexes, scaled, errors = encoder_building.encode_rows(rows, errors)
+
+        predictions = {}
+        if indexes:
+            predictions = dict(zip(indexes, predict_building_matrix(scaled, model)))
+
+        return jsonify(batch_response(len(rows), predictions, errors))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/predict/all/batch', methods=['POST'])
+def predict_all_batch():
+    try:
+        model = requested_model()
+        rows, errors = read_batch_rows()
+        indexes, scaled_stage, errors = encoder_stage.encode_rows(rows, errors)
+
+        predictions = {}
+        if indexes:
+            stage_predictions = predict_stage_matrix(scaled_stage, model, [rows[i] for i in indexes])
+            for i, stage_prediction in zip(indexes, stage_predictions):
+                predictions[i] = {"stage_model": stage_prediction}
+
+            # Building predictions are optional per row, as in predict_all
+            building_rows = [rows[i] for i in indexes]
+            building_indexes, scaled_building, _ = encoder_building.encode_rows(building_rows)
+            if building_indexes:
+                for k, building_prediction in zip(building_indexes, predict_building_matrix(scaled_building, model)):
+                    predictions[indexes[k]]["building_model"] = building_prediction
+
+        return jsonify(batch_response(len(rows), predictions, errors))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
 if __name__ == '__main__':
+    warmup()
     port = int(os.environ.get('PORT', 5001))
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
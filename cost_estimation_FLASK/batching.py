@@ -0,0 +1,134 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ('X', 'args', 'future')
+
+    def __init__(self, X, args):
+        self.X = X
+        self.args = args
+        self.future = Future()
+
+
+class MicroBatcher:
+    """Coalesces concurrent prediction calls into a single forward pass.
+
+    Request threads call :meth:`predict` with their own scaled feature matrix.
+    A worker thread takes the first queued request, keeps collecting more
+    until ``max_batch_size`` rows are gathered or ``max_wait_ms`` has passed,
+    runs ``predict_fn`` once on the stacked rows and hands each caller back
+    its own slice of every output array. A single request larger than
+    ``max_batch_size`` is run on its own rather than split. Extra ``args``
+    given to :meth:`predict` are passed on as ``predict_fn(X, *args)``, and
+    only requests with equal ``args`` share a batch.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=2.0, name='batcher'):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        # A request with other args that ended the last batch; it starts the next one
+        self._carry = None
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._rows = 0
+        self._batches = 0
+        self._max_queue_depth = 0
+        self._histogram = {}
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, X, *args):
+        """Queue ``X`` for the next batch and return a Future of its output arrays."""
+        request = _Request(X, args)
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, X, *args):
+        return self.submit(X, *args).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        batch, rows = [first], len(first.X)
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            if request.args != first.args:
+                self._carry = request
+                break
+            batch.append(request)
+            rows += len(request.X)
+        return batch, rows
+
+    def _run(self):
+        while True:
+            first, self._carry = self._carry, None
+            if first is None:
+                first = self._queue.get()
+            if first is None:
+                return
+            depth = self._queue.qsize() + 1
+            batch, rows = self._collect(first)
+            self._record(len(batch), rows, depth)
+
+            try:
+                X = batch[0].X if len(batch) == 1 else np.concatenate([r.X for r in batch])
+                outputs = self.predict_fn(X, *first.args)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            start = 0
+            for request in batch:
+                end = start + len(request.X)
+                request.future.set_result(tuple(output[start:end] for output in outputs))
+                start = end
+
+    def _record(self, n_requests, rows, depth):
+        bucket = 1
+        while bucket < rows:
+            bucket *= 2
+        with self._lock:
+            self._requests += n_requests
+            self._rows += rows
+            self._batches += 1
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+            self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "requests": self._requests,
+                "rows": self._rows,
+                "batches": self._batches,
+                "avg_batch_rows": self._rows / self._batches if self._batches else 0.0,
+                "avg_batch_requests": self._requests / self._batches if self._batches else 0.0,
+                # Batch row counts rounded up to the next power of two
+                "batch_rows_histogram": {str(k): v for k, v in sorted(self._histogram.items())},
+            }
@@ -0,0 +1,217 @@
+"""Offline benchmarks for the cost estimation service.
+
+Usage:
+    python benchmark.py encode [--rows 2000]
+    python benchmark.py engines [--rows 256] [--repeat 50]
+    python benchmark.py grid [--rows 1000] [--engine numpy]
+    python benchmark.py http [--concurrency 1 4 16] [--requests 500] [--url URL] [--output FILE]
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from preprocessing import PREPROCESSING_DIR, load_preprocessing, read_stage_features, read_building_features
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def load_encoded_samples(n_rows):
+    """Return {schema: scaled sample matrix} drawn from the training CSVs, encoded as the service does."""
+    encoders = load_preprocessing(PREPROCESSING_DIR)
+    samples = {}
+    for name, features in (("stage", read_stage_features(DATA_DIR)),
+                           ("building", read_building_features(DATA_DIR))):
+        rows = features.sample(n=min(n_rows, len(features)), random_state=0).to_dict(orient='records')
+        samples[name] = encoders[name].encode_rows(rows)[1]
+    return samples
+
+
+def bench_encode(args):
+    encoders = load_preprocessing(PREPROCESSING_DIR)
+    for name, features in (("stage", read_stage_features(DATA_DIR)),
+                           ("building", read_building_features(DATA_DIR))):
+        X_full = pd.get_dummies(features, drop_first=True)
+        X_cols = X_full.columns
+        # The legacy path and the reference refit the scaler; the encoder is the saved artifact the service loads
+        scaler = StandardScaler().fit(X_full)
+        encoder = encoders[name]
+
+        sample = features.sample(n=min(args.rows, len(features)), random_state=0)
+        rows = sample.to_dict(orient='records')
+
+        def legacy_row(row):
+            # The per-request path app.py used before FeatureEncoder
+            encoded = pd.get_dummies(pd.DataFrame([row]), drop_first=True)
+            return scaler.transform(encoded.reindex(columns=X_cols, fill_value=0))
+
+        legacy = timed(lambda: [legacy_row(row) for row in rows], 1) / len(rows)
+        compiled = timed(lambda: [encoder.encode_row(row) for row in rows], 1) / len(rows)
+        batched = timed(lambda: encoder.encode_rows(rows), 5) / len(rows)
+
+        # Reference encoding: dummies over the whole sample keep every category
+        expected = scaler.transform(pd.get_dummies(sample).reindex(columns=X_cols, fill_value=0))
+        _, encoded, _ = encoder.encode_rows(rows)
+        max_error = float(np.max(np.abs(encoded - expected)))
+        legacy_wrong = sum(
+            not np.allclose(legacy_row(row), expected[i:i + 1], atol=1e-5)
+            for i, row in enumerate(rows)
+        )
+
+        print(f"[{name}] {len(rows)} rows, {len(X_cols)} features")
+        print(f"  legacy get_dummies+reindex+transform: {legacy * 1e6:9.1f} us/row")
+        print(f"  FeatureEncoder.encode_row:            {compiled * 1e6:9.1f} us/row ({legacy / compiled:.0f}x)")
+        print(f"  FeatureEncoder.encode_rows (batched): {batched * 1e6:9.1f} us/row ({legacy / batched:.0f}x)")
+        print(f"  max |encoder - reference|:            {max_error:.2e}")
+        print(f"  legacy rows mis-encoded by drop_first: {legacy_wrong}/{len(rows)}")
+
+
+def bench_engines(args):
+    from inference import INFERENCE_MODES, load_engine
+
+    samples = load_encoded_samples(args.rows)
+    engines = {mode: load_engine(MODEL_DIR, mode) for mode in INFERENCE_MODES}
+    reference = None
+    for mode, engine in engines.items():
+        calls = {"stage": engine.predict_stage, "building": engine.predict_building}
+        outputs = {}
+        for name, X in samples.items():
+            predict = calls[name]
+            predict(X[:1])  # trace / warm up
+            single = timed(lambda: predict(X[:1]), args.repeat)
+            batch = timed(lambda: predict(X), max(1, args.repeat // 5))
+            outputs[name] = np.concatenate([np.atleast_2d(out.T).T for out in predict(X)], axis=1)
+            print(f"[{mode:9s}] {name:8s} 1 row: {single * 1e3:7.2f} ms   "
+                  f"{len(X)} rows: {batch * 1e3:7.2f} ms ({batch / len(X) * 1e6:.1f} us/row)")
+        if reference is None:
+            reference = outputs
+        else:
+            for name in samples:
+                diff = np.max(np.abs(outputs[name] - reference[name]) / (np.abs(reference[name]) + 1e-6))
+                print(f"[{mode:9s}] {name:8s} max relative difference vs {INFERENCE_MODES[0]}: {diff:.2e}")
+
+
+def bench_grid(args):
+    from inference import load_engine
+    from stage_grid import GRID_PATH, StageGrid
+
+    grid = StageGrid(GRID_PATH)
+    engine = load_engine(MODEL_DIR, args.engine)
+    encoder = load_preprocessing(PREPROCESSING_DIR)['stage']
+    rows = read_stage_features(DATA_DIR).sample(n=args.rows, random_state=0).to_dict(orient='records')
+
+    def model_row(row):
+        return engine.predict_stage(encoder.encode_row(row))
+
+    model_row(rows[0])
+    lookup = timed(lambda: [grid.lookup([row]) for row in rows], 1) / len(rows)
+    model = timed(lambda: [model_row(row) for row in rows], 1) / len(rows)
+    outputs, hit = grid.lookup(rows)
+    _, X, _ = encoder.encode_rows(rows)
+    live = np.column_stack(engine.predict_stage(X))
+    rel_error = np.max(np.abs(outputs[hit] - live[hit]) / np.maximum(np.abs(live[hit]), 1.0))
+    print(f"grid lookup:            {lookup * 1e6:9.1f} us/row ({hit.sum()}/{len(rows)} rows inside the grid)")
+    print(f"encode + {args.engine:13s} {model * 1e6:9.1f} us/row")
+    print(f"max relative error on sampled training rows: {rel_error:.2e}")
+
+
+def bench_http(args):
+    """Replay the training CSV rows against the prediction endpoints of a running service."""
+    from common.loadtest import (LocalServer, MemorySampler, environment, get_json, json_request,
+                                 metrics_rss_bytes, print_result, run_load, write_results)
+
+    # Shuffled once with a fixed seed, and never repeated within a run of fewer
+    # requests than rows, so the prediction cache only sees new inputs
+    stage = json.loads(read_stage_features(DATA_DIR).sample(frac=1, random_state=args.seed).to_json(orient='records'))
+    building = json.loads(read_building_features(DATA_DIR).sample(frac=1, random_state=args.seed).to_json(orient='records'))
+    workloads = {
+        '/api/predict/stage': stage,
+        '/api/predict/building': building,
+        # Rows carrying both schemas' fields get both predictions; taken from the
+        # end of the shuffles so they are not the rows already sent above
+        '/api/predict/all': [{**s, **b} for s, b in zip(stage[::-1], building[::-1])],
+    }
+    server_env = dict(item.split('=', 1) for item in args.env)
+
+    with ExitStack() as stack:
+        if args.url:
+            base_url, startup_seconds = args.url.rstrip('/'), None
+            memory = MemorySampler(lambda: metrics_rss_bytes(base_url))
+        else:
+            server = stack.enter_context(LocalServer(BASE_DIR, '/test', server_env, args.server_log))
+            base_url, startup_seconds = server.url, server.startup_seconds
+            memory = MemorySampler(server.rss_bytes)
+        stack.callback(memory.stop)
+        idle_rss = memory.start().peak
+
+        results = []
+        for path, rows in workloads.items():
+            requests = itertools.cycle([json_request(path, row) for row in rows])
+            for concurrency in args.concurrency:
+                result = run_load(base_url, requests, concurrency, args.requests, args.warmup, memory=memory)
+                results.append({'workload': path, **result})
+                print_result(path, result)
+        server_stats = get_json(base_url + '/api/stats')
+
+    write_results(args.output, {
+        'service': 'cost_estimation',
+        'environment': environment(BASE_DIR, server_env),
+        'server_url': args.url,
+        'startup_seconds': round(startup_seconds, 3) if startup_seconds else None,
+        'idle_rss_bytes': int(idle_rss),
+        'server_stats': server_stats,
+        'results': results,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    encode = commands.add_parser('encode', help='per-row encode latency, FeatureEncoder vs pandas')
+    encode.add_argument('--rows', type=int, default=2000)
+    encode.set_defaults(func=bench_encode)
+
+    engines = commands.add_parser('engines', help='latency of each inference mode in inference.py')
+    engines.add_argument('--rows', type=int, default=256)
+    engines.add_argument('--repeat', type=int, default=50)
+    engines.set_defaults(func=bench_engines)
+
+    grid = commands.add_parser('grid', help='stage lookup grid latency and error vs the live model')
+    grid.add_argument('--rows', type=int, default=1000)
+    grid.add_argument('--engine', default='fused')
+    grid.set_defaults(func=bench_grid)
+
+    http = commands.add_parser('http', help='load test the prediction endpoints with the training CSV rows')
+    http.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    http.add_argument('--requests', type=int, default=500, help='measured requests per endpoint and concurrency')
+    http.add_argument('--warmup', type=int, default=20)
+    http.add_argument('--seed', type=int, default=0)
+    http.add_argument('--url', help='an already running service (default: start app.py on a free port)')
+    http.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                      help='environment for the started server, e.g. INFERENCE_MODE=numpy')
+    http.add_argument('--server-log', default=os.devnull)
+    http.add_argument('--output', default='loadtest_cost.json')
+    http.set_defaults(func=bench_http)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def model_fingerprint(model_dir):
+    """Return a cheap fingerprint (name, size, mtime) of every file under ``model_dir``."""
+    entries = []
+    for root, _, files in os.walk(model_dir):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            entries.append((os.path.relpath(os.path.join(root, name), model_dir), st.st_size, st.st_mtime_ns))
+    return tuple(sorted(entries))
+
+
+class PredictionCache:
+    """Bounded LRU cache of formatted predictions with per-entry TTL.
+
+    Keys are hashes of the encoded, scaled feature row, so requests that only
+    differ in formatting (``"3208"`` vs ``3208.0``, key order, unknown extra
+    fields) share an entry. When ``model_dir`` is given the cache clears
+    itself as soon as any file under it changes; the directory is re-checked
+    at most once every ``check_interval`` seconds.
+    """
+
+    def __init__(self, max_size=4096, ttl=600.0, model_dir=None, check_interval=1.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = model_fingerprint(model_dir) if model_dir else None
+        self._next_check = time.monotonic() + check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(schema, row):
+        return hashlib.blake2b(schema.encode() + row.tobytes(), digest_size=16).digest()
+
+    def _check_models(self, now):
+        if self.model_dir is None or now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        fingerprint = model_fingerprint(self.model_dir)
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._check_models(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
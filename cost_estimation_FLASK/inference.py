@@ -0,0 +1,106 @@
+import os
+import time
+
+from common.metrics import model_load_seconds, stage_timer
+
+STAGE_MODELS = ('stage_material', 'stage_time', 'stage_cost')
+BUILDING_MODELS = ('building_time', 'building_cost')
+INFERENCE_MODES = ('fused', 'per_model', 'numpy')
+
+# TensorFlow is imported inside the Keras engines only, so the 'numpy' mode
+# never pays for it at startup.
+
+
+def load_keras_models(model_dir, names):
+    from tensorflow.keras.models import load_model
+
+    models = []
+    for name in names:
+        start = time.perf_counter()
+        models.append(load_model(os.path.join(model_dir, f'{name}.h5'), compile=False))
+        model_load_seconds.set(time.perf_counter() - start, model=name)
+    return models
+
+
+class PerModelEngine:
+    """Runs each Keras model with its own ``predict`` call, as the API originally did."""
+
+    mode = 'per_model'
+
+    def __init__(self, stage_models, building_models):
+        self.stage_models = stage_models
+        self.building_models = building_models
+
+    @staticmethod
+    def _predict(name, model, X):
+        with stage_timer('predict', name):
+            return model.predict(X, verbose=0)
+
+    def predict_stage(self, X):
+        """Return (materials, days, cost) arrays for a scaled stage feature matrix."""
+        materials, days, cost = (self._predict(n, m, X) for n, m in zip(STAGE_MODELS, self.stage_models))
+        return materials, days[:, 0], cost[:, 0]
+
+    def predict_building(self, X):
+        """Return (days, cost) arrays for a scaled building feature matrix."""
+        days, cost = (self._predict(n, m, X) for n, m in zip(BUILDING_MODELS, self.building_models))
+        return days[:, 0], cost[:, 0]
+
+
+class FusedEngine:
+    """Runs all heads that share an input schema as one multi-output graph.
+
+    The stage models and the building models are each wrapped into a single
+    functional model and traced once into a ``tf.function``, so a request
+    costs one graph call per schema instead of one ``predict`` per model.
+    """
+
+    mode = 'fused'
+
+    def __init__(self, stage_models, building_models):
+        self._stage = self._fuse(stage_models)
+        self._building = self._fuse(building_models)
+
+    @staticmethod
+    def _fuse(models):
+        import tensorflow as tf
+
+        n_features = models[0].input_shape[-1]
+        inputs = tf.keras.Input(shape=(n_features,), dtype=tf.float32)
+        fused = tf.keras.Model(inputs, [model(inputs) for model in models])
+
+        @tf.function(input_signature=[tf.TensorSpec([None, n_features], tf.float32)])
+        def run(x):
+            return fused(x, training=False)
+
+        return run
+
+    @staticmethod
+    def _run(name, fn, X):
+        # One graph call covers every head of the schema, so it is timed as one model
+        with stage_timer('predict', name):
+            return [output.numpy() for output in fn(X.astype('float32', copy=False))]
+
+    def predict_stage(self, X):
+        """Return (materials, days, cost) arrays for a scaled stage feature matrix."""
+        materials, days, cost = self._run('stage_fused', self._stage, X)
+        return materials, days[:, 0], cost[:, 0]
+
+    def predict_building(self, X):
+        """Return (days, cost) arrays for a scaled building feature matrix."""
+        days, cost = self._run('building_fused', self._building, X)
+        return days[:, 0], cost[:, 0]
+
+
+def load_engine(model_dir, mode='fused'):
+    """Load the cost models from ``model_dir`` behind the engine selected by ``mode``."""
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode '{mode}', expected one of {INFERENCE_MODES}")
+    if mode == 'numpy':
+        from numpy_engine import load_numpy_engine
+
+        return load_numpy_engine(model_dir)
+    stage_models = load_keras_models(model_dir, STAGE_MODELS)
+    building_models = load_keras_models(model_dir, BUILDING_MODELS)
+    engine_cls = FusedEngine if mode == 'fused' else PerModelEngine
+    return engine_cls(stage_models, building_models)
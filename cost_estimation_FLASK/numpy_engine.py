@@ -0,0 +1,204 @@
+"""Pure NumPy forward pass for the cost models, so serving needs no TensorFlow.
+
+Usage:
+    python numpy_engine.py export   # write models/<name>.npz next to each .h5
+    python numpy_engine.py check    # compare against Keras on the CSVs in data/
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from inference import STAGE_MODELS, BUILDING_MODELS
+from common.metrics import model_load_seconds, stage_timer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+NPZ_FORMAT_VERSION = 1
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _sigmoid(x):
+    return np.reciprocal(1 + np.exp(-x, out=x), out=x)
+
+
+def _softmax(x):
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': _relu,
+    'sigmoid': _sigmoid,
+    'tanh': lambda x: np.tanh(x, out=x),
+    'softmax': _softmax,
+}
+
+
+def _layer_weights(weights_group, name):
+    group = weights_group[name]
+    return [np.asarray(group[weight_name], dtype=np.float32)
+            for weight_name in (n.decode() if isinstance(n, bytes) else n for n in group.attrs['weight_names'])]
+
+
+def export_model(h5_path, npz_path):
+    """Extract the Dense stack of a Keras Sequential ``.h5`` into an ``.npz`` bundle.
+
+    Only the layers the cost models use are supported: Dense (with its
+    activation), standalone Activation, and Dropout/InputLayer which are
+    no-ops at inference time.
+    """
+    import h5py
+
+    with h5py.File(h5_path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        if config['class_name'] != 'Sequential':
+            raise ValueError(f"{h5_path}: only Sequential models can be exported")
+        layer_configs = config['config']['layers'] if isinstance(config['config'], dict) else config['config']
+
+        kernels, biases, activations = [], [], []
+        for layer in layer_configs:
+            kind, layer_config = layer['class_name'], layer['config']
+            if kind in ('InputLayer', 'Dropout'):
+                continue
+            if kind == 'Activation' and activations and activations[-1] == 'linear':
+                activations[-1] = layer_config['activation']
+                continue
+            if kind != 'Dense':
+                raise ValueError(f"{h5_path}: unsupported layer {kind}")
+            weights = _layer_weights(f['model_weights'], layer_config['name'])
+            kernel = weights[0]
+            bias = weights[1] if layer_config.get('use_bias', True) else np.zeros(kernel.shape[1], np.float32)
+            kernels.append(kernel)
+            biases.append(bias)
+            activations.append(layer_config.get('activation', 'linear'))
+
+    for activation in activations:
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"{h5_path}: unsupported activation {activation}")
+
+    arrays = {'format_version': np.array(NPZ_FORMAT_VERSION), 'activations': np.array(activations)}
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        arrays[f'kernel_{i}'] = kernel
+        arrays[f'bias_{i}'] = bias
+    np.savez(npz_path, **arrays)
+
+
+class NumpyModel:
+    """A Dense network loaded from an ``.npz`` bundle written by :func:`export_model`."""
+
+    def __init__(self, npz_path):
+        with np.load(npz_path, allow_pickle=False) as bundle:
+            if int(bundle['format_version']) != NPZ_FORMAT_VERSION:
+                raise ValueError(f"{npz_path}: unsupported bundle version {int(bundle['format_version'])}")
+            activations = [str(a) for a in bundle['activations']]
+            self.layers = [
+                (bundle[f'kernel_{i}'], bundle[f'bias_{i}'], ACTIVATIONS[activation])
+                for i, activation in enumerate(activations)
+            ]
+        self.n_features = self.layers[0][0].shape[0]
+
+    def predict(self, X):
+        x = np.asarray(X, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            x = activation(x @ kernel + bias)
+        return x
+
+
+class NumpyEngine:
+    """Same interface as the Keras engines in inference.py, evaluated with NumPy matmuls."""
+
+    mode = 'numpy'
+
+    def __init__(self, stage_models, building_models):
+        self.stage_models = stage_models
+        self.building_models = building_models
+
+    @staticmethod
+    def _predict(name, model, X):
+        with stage_timer('predict', name):
+            return model.predict(X)
+
+    def predict_stage(self, X):
+        """Return (materials, days, cost) arrays for a scaled stage feature matrix."""
+        materials, days, cost = (self._predict(n, m, X) for n, m in zip(STAGE_MODELS, self.stage_models))
+        return materials, days[:, 0], cost[:, 0]
+
+    def predict_building(self, X):
+        """Return (days, cost) arrays for a scaled building feature matrix."""
+        days, cost = (self._predict(n, m, X) for n, m in zip(BUILDING_MODELS, self.building_models))
+        return days[:, 0], cost[:, 0]
+
+
+def load_numpy_engine(model_dir):
+    def load(names):
+        paths = [os.path.join(model_dir, f'{name}.npz') for name in names]
+        missing = [p for p in paths if not os.path.exists(p)]
+        if missing:
+            raise FileNotFoundError(f"Missing NumPy model bundles {missing}; run 'python numpy_engine.py export'")
+        models = []
+        for name, path in zip(names, paths):
+            start = time.perf_counter()
+            models.append(NumpyModel(path))
+            model_load_seconds.set(time.perf_counter() - start, model=name)
+        return models
+    return NumpyEngine(load(STAGE_MODELS), load(BUILDING_MODELS))
+
+
+def export_all(args):
+    for name in STAGE_MODELS + BUILDING_MODELS:
+        h5_path = os.path.join(args.model_dir, f'{name}.h5')
+        npz_path = os.path.join(args.model_dir, f'{name}.npz')
+        export_model(h5_path, npz_path)
+        print(f"{h5_path} -> {npz_path} ({os.path.getsize(npz_path) // 1024} KB)")
+
+
+def check_parity(args):
+    from inference import load_engine
+    from preprocessing import fit_encoders, read_stage_features, read_building_features
+
+    keras_engine = load_engine(args.model_dir, 'fused')
+    numpy_engine = load_numpy_engine(args.model_dir)
+    encoders = fit_encoders(args.data_dir)
+
+    failed = False
+    for schema, features in (("stage", read_stage_features(args.data_dir)),
+                             ("building", read_building_features(args.data_dir))):
+        _, X, _ = encoders[schema].encode_rows(features.to_dict(orient='records'))
+
+        predict = 'predict_stage' if schema == 'stage' else 'predict_building'
+        names = STAGE_MODELS if schema == 'stage' else BUILDING_MODELS
+        for name, expected, actual in zip(names, getattr(keras_engine, predict)(X), getattr(numpy_engine, predict)(X)):
+            rel_error = float(np.max(np.abs(actual - expected) / np.maximum(np.abs(expected), 1.0)))
+            ok = rel_error <= args.rtol
+            failed |= not ok
+            print(f"{name:15s} {len(X)} rows  max relative error {rel_error:.2e}  {'ok' if ok else 'FAIL'}")
+
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('export', help='write an .npz bundle for every cost model').set_defaults(func=export_all)
+    check = commands.add_parser('check', help='parity of the NumPy engine against Keras')
+    check.add_argument('--rtol', type=float, default=1e-4)
+    check.set_defaults(func=check_parity)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
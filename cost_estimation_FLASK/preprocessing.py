@@ -0,0 +1,146 @@
+"""Versioned preprocessing artifact for the cost models.
+
+The artifact holds what the API needs to encode requests: column layouts,
+category maps and the StandardScaler mean/scale of each input schema. It
+lives in ``models/preprocessing/`` next to the models, so the service never
+reads the training CSVs at startup.
+
+Usage:
+    python preprocessing.py rebuild   # refit from data/ and rewrite the artifact
+    python preprocessing.py show      # print the stored schema
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from encoder import FeatureEncoder
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+DATA_DIR = os.path.join(BASE_DIR, "data")
+PREPROCESSING_DIR = os.path.join(MODEL_DIR, "preprocessing")
+
+FORMAT_VERSION = 1
+SCHEMA_FILE = 'schema.json'
+STAGE_DATA = 'construction_data.csv'
+BUILDING_DATA = 'construction_dataset_with_stage.csv'
+
+STAGE_TARGETS = [
+    'cement_bags', 'sand_cubic_meters', 'steel_kg', 'bricks_units',
+    'aggregates_cubic_meters', 'estimated_days', 'estimated_cost_inr'
+]
+BUILDING_TARGETS = ['TotalDays', 'ConstructionCost']
+
+
+def read_stage_features(data_dir):
+    import pandas as pd
+
+    df_stage = pd.read_csv(os.path.join(data_dir, STAGE_DATA))
+    return df_stage.drop(columns=STAGE_TARGETS)
+
+
+def read_building_features(data_dir):
+    import pandas as pd
+
+    df_building = pd.read_csv(os.path.join(data_dir, BUILDING_DATA))
+    df_building['StartDate'] = pd.to_datetime(df_building['StartDate'], dayfirst=True)
+    df_building['EndDate'] = pd.to_datetime(df_building['EndDate'], dayfirst=True)
+    df_building['TotalDays'] = (df_building['EndDate'] - df_building['StartDate']).dt.days
+    df_building.drop(columns=['StartDate', 'EndDate'], inplace=True)
+    return df_building.drop(columns=BUILDING_TARGETS)
+
+
+def fit_encoders(data_dir):
+    """Fit a StandardScaler per schema on the training CSVs and compile it into an encoder."""
+    import pandas as pd
+    from sklearn.preprocessing import StandardScaler
+
+    encoders = {}
+    for name, features in (("stage", read_stage_features(data_dir)),
+                           ("building", read_building_features(data_dir))):
+        scaler = StandardScaler()
+        scaler.fit(pd.get_dummies(features, drop_first=True))
+        encoders[name] = FeatureEncoder.from_frame(features, scaler)
+    return encoders
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def save_preprocessing(encoders, directory, sources=()):
+    """Write ``encoders`` to ``directory`` as schema.json plus one .npy per statistics vector."""
+    os.makedirs(directory, exist_ok=True)
+    schema = {
+        'format_version': FORMAT_VERSION,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'sources': {os.path.basename(path): _sha256(path) for path in sources},
+        'encoders': {},
+    }
+    for name, encoder in encoders.items():
+        np.save(os.path.join(directory, f'{name}_mean.npy'), encoder.mean)
+        np.save(os.path.join(directory, f'{name}_scale.npy'), encoder.scale)
+        schema['encoders'][name] = {
+            'columns': encoder.columns,
+            'numeric_cols': encoder.numeric_cols,
+            'categories': {feature: np.asarray(values).tolist() for feature, values in encoder.categories.items()},
+        }
+    with open(os.path.join(directory, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=2)
+
+
+def load_preprocessing(directory):
+    """Load the encoders saved by :func:`save_preprocessing`; statistics are memory-mapped."""
+    schema_path = os.path.join(directory, SCHEMA_FILE)
+    if not os.path.exists(schema_path):
+        raise FileNotFoundError(f"Missing preprocessing artifact {schema_path}; run 'python preprocessing.py rebuild'")
+    with open(schema_path) as f:
+        schema = json.load(f)
+    if schema.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"{schema_path}: unsupported format version {schema.get('format_version')}, "
+                         f"expected {FORMAT_VERSION}; run 'python preprocessing.py rebuild'")
+
+    encoders = {}
+    for name, spec in schema['encoders'].items():
+        mean = np.load(os.path.join(directory, f'{name}_mean.npy'), mmap_mode='r')
+        scale = np.load(os.path.join(directory, f'{name}_scale.npy'), mmap_mode='r')
+        encoders[name] = FeatureEncoder(spec['columns'], spec['numeric_cols'], spec['categories'], mean, scale)
+    return encoders
+
+
+def rebuild(args):
+    encoders = fit_encoders(args.data_dir)
+    sources = [os.path.join(args.data_dir, STAGE_DATA), os.path.join(args.data_dir, BUILDING_DATA)]
+    save_preprocessing(encoders, args.output, sources)
+    for name, encoder in encoders.items():
+        print(f"{name}: {encoder.n_features} features")
+    print(f"Wrote {args.output}")
+
+
+def show(args):
+    with open(os.path.join(args.output, SCHEMA_FILE)) as f:
+        print(f.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output', default=PREPROCESSING_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rebuild', help='refit scalers from the training CSVs').set_defaults(func=rebuild)
+    commands.add_parser('show', help='print the stored schema').set_defaults(func=show)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
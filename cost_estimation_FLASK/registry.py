@@ -0,0 +1,365 @@
+"""Versioned cost models that are reloaded from MODEL_DIR while serving.
+
+A version is a full set of the five model files (``.h5``, or ``.npz`` in
+the 'numpy' mode). The files directly in MODEL_DIR are the version named
+'default', and every directory under ``MODEL_DIR/versions/`` that holds a
+full set is a version named after the directory. Every version found is
+loaded, and a thread re-scans MODEL_DIR every ``interval`` seconds:
+
+- a new version, or one whose files changed, is loaded and warmed up in the
+  background once its files have stayed unchanged for one interval, then
+  swapped in with a single assignment. Requests in flight finish on the
+  engine they started with, and no request waits for a load;
+- the engine a version replaced is garbage collected as soon as the last
+  request using it returns, and so is a version whose files are removed.
+  Removing the active version hands over to the one ``active`` names among
+  those still loaded, so with 'latest' deleting the newest directory rolls
+  back to the next newest that loaded; only when no loaded version can take
+  over does the removed one keep serving;
+- a version that fails to load or warm up is logged and not retried until
+  its files change again, and any engine already loaded under its name keeps
+  serving.
+
+Unpinned requests use the ``active`` version: 'default', a directory name,
+or 'latest' for the last directory name in sorted order. A request can pin
+any loaded version. Either way it takes the :class:`ModelVersion` from
+:meth:`ModelRegistry.get` once and predicts with that object, so a swap
+midway never splits a request across versions. With a ``shadow`` version, a
+``shadow_rate`` fraction of the prediction calls served by the active
+version (whole batches when micro-batching) is repeated on it in a
+background thread, and the difference from the active outputs is recorded
+as drift. The shadow never delays or changes a response.
+"""
+import gc
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from inference import BUILDING_MODELS, STAGE_MODELS, load_engine
+from common.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = 'default'
+LATEST_VERSION = 'latest'
+VERSIONS_DIR = 'versions'
+OUTPUTS = {'stage': ('materials', 'days', 'cost'), 'building': ('days', 'cost')}
+
+model_loads = REGISTRY.counter('model_version_loads_total', 'Model version loads by version and outcome',
+                               ['version', 'outcome'])
+shadow_rows = REGISTRY.counter('shadow_rows_total', 'Rows predicted again by the shadow model', ['schema'])
+shadow_dropped = REGISTRY.counter('shadow_dropped_total', 'Sampled calls skipped because the shadow queue was full')
+shadow_drift = REGISTRY.histogram(
+    'shadow_relative_drift', 'Per row, the largest |shadow - active| / max(|active|, 1) over the columns of an output',
+    ['schema', 'output'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+
+class ModelVersion:
+    """An engine loaded from ``path``, and the fingerprint of the files it was loaded from."""
+
+    def __init__(self, name, path, fingerprint, engine, load_seconds):
+        self.name = name
+        self.path = path
+        self.fingerprint = fingerprint
+        self.engine = engine
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        # Changes whenever the files do, so predictions can be cached per key
+        self.key = f"{name}@{hashlib.blake2b(repr(fingerprint).encode(), digest_size=6).hexdigest()}"
+
+    def stats(self):
+        return {
+            "key": self.key,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+        }
+
+
+class DriftStats:
+    """Running difference between the shadow and active outputs, reset when the shadow version changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.shadow_key = None
+        self._outputs = {}
+
+    def record(self, schema, shadow_key, active, candidate):
+        rows = len(active[0])
+        with self._lock:
+            if shadow_key != self.shadow_key:
+                self.shadow_key = shadow_key
+                self._outputs = {}
+            for name, a, c in zip(OUTPUTS[schema], active, candidate):
+                a = np.asarray(a, dtype=np.float64).reshape(rows, -1)
+                difference = np.abs(np.asarray(c, dtype=np.float64).reshape(rows, -1) - a)
+                absolute = difference.max(axis=1)
+                relative = (difference / np.maximum(np.abs(a), 1.0)).max(axis=1)
+                entry = self._outputs.setdefault((schema, name), [0, 0.0, 0.0, 0.0, 0.0])
+                entry[0] += rows
+                entry[1] += float(absolute.sum())
+                entry[2] = max(entry[2], float(absolute.max()))
+                entry[3] += float(relative.sum())
+                entry[4] = max(entry[4], float(relative.max()))
+                for value in relative:
+                    shadow_drift.observe(float(value), schema=schema, output=name)
+        shadow_rows.inc(rows, schema=schema)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "shadow": self.shadow_key,
+                "outputs": {
+                    f"{schema}.{name}": {
+                        "rows": rows,
+                        "mean_abs": total_abs / rows,
+                        "max_abs": max_abs,
+                        "mean_relative": total_rel / rows,
+                        "max_relative": max_rel,
+                    }
+                    for (schema, name), (rows, total_abs, max_abs, total_rel, max_rel) in self._outputs.items()
+                },
+            }
+
+
+class ModelRegistry:
+    """The loaded versions of the cost models in ``model_dir``, for the inference ``mode``.
+
+    ``warmup(engine)`` runs on every newly loaded engine before it can
+    serve. The versions found at construction are loaded synchronously;
+    call :meth:`start` to watch for changes and run the shadow.
+    """
+
+    def __init__(self, model_dir, mode, warmup=None, active=DEFAULT_VERSION, shadow=None, shadow_rate=0.0,
+                 interval=5.0, max_shadow_queue=8):
+        self.model_dir = model_dir
+        self.mode = mode
+        self.warmup = warmup
+        self.active = active
+        self.shadow = shadow
+        self.shadow_rate = shadow_rate
+        self.interval = interval
+        self.max_shadow_queue = max_shadow_queue
+        self._extension = '.npz' if mode == 'numpy' else '.h5'
+
+        # Replaced, never mutated, so request threads read it without a lock
+        self._versions = {}
+        self._active = None
+        self._shadow = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._failed = {}
+        self._retired = []
+        # The removed active version kept serving because nothing could replace it
+        self._stranded = None
+        self._shadow_queue = queue.Queue(max_shadow_queue)
+        self.drift = DriftStats()
+
+        for name, (path, fingerprint) in self._discover().items():
+            self._load(name, path, fingerprint)
+        if self._active is None:
+            name = self._active_name(self._failed)
+            if name in self._failed:
+                raise RuntimeError(f"Failed to load model version '{name}': {self._failed[name][1]}")
+            raise FileNotFoundError(f"No complete '{active}' model version in {model_dir}")
+        if shadow is not None and self._shadow is None:
+            logger.warning(f"Shadow model version '{shadow}' is not loaded yet")
+
+    # Serving
+
+    def get(self, version=None):
+        """The active version, or the loaded version named ``version``."""
+        if version is None:
+            return self._active
+        model = self._versions.get(version)
+        if model is None:
+            raise ValueError(f"Unknown model version '{version}', expected one of {sorted(self._versions)}")
+        return model
+
+    def predict_stage(self, X, model=None):
+        """Return (materials, days, cost) from ``model``, a version from :meth:`get`, or the active one."""
+        return self._predict('stage', X, model)
+
+    def predict_building(self, X, model=None):
+        """Return (days, cost) from ``model``, a version from :meth:`get`, or the active one."""
+        return self._predict('building', X, model)
+
+    def _predict(self, schema, X, model):
+        model = model or self._active
+        outputs = getattr(model.engine, f'predict_{schema}')(X)
+        shadow = self._shadow
+        if model is self._active and shadow is not None and shadow is not model and random.random() < self.shadow_rate:
+            try:
+                self._shadow_queue.put_nowait((schema, shadow, X, outputs))
+            except queue.Full:
+                shadow_dropped.inc()
+        return outputs
+
+    def start(self):
+        """Start the watcher and shadow threads; call it again in a forked child, which has no threads."""
+        self._lock = threading.Lock()
+        self._shadow_queue = queue.Queue(self.max_shadow_queue)
+        if self.interval > 0:
+            threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+        if self.shadow is not None:
+            threading.Thread(target=self._run_shadow, name='model-shadow', daemon=True).start()
+
+    def stats(self):
+        versions = self._versions
+        return {
+            "mode": self.mode,
+            "active": self._active.key,
+            "shadow": self._shadow.key if self._shadow is not None else None,
+            "shadow_rate": self.shadow_rate if self.shadow is not None else None,
+            "versions": {name: version.stats() for name, version in sorted(versions.items())},
+            "pending": sorted(self._pending),
+            "failed": {name: error for name, (_, error) in self._failed.items()},
+            "retired_in_use": len(self._retired),
+            "drift": self.drift.stats() if self.shadow is not None else None,
+        }
+
+    # Watching
+
+    def _discover(self):
+        """Return {name: (path, fingerprint)} for every version with a full set of model files."""
+        candidates = [(DEFAULT_VERSION, self.model_dir)]
+        versions_dir = os.path.join(self.model_dir, VERSIONS_DIR)
+        if os.path.isdir(versions_dir):
+            candidates += [
+                (name, os.path.join(versions_dir, name)) for name in sorted(os.listdir(versions_dir))
+                if name not in (DEFAULT_VERSION, LATEST_VERSION) and os.path.isdir(os.path.join(versions_dir, name))
+            ]
+        found = {}
+        for name, path in candidates:
+            fingerprint = self._fingerprint(path)
+            if fingerprint is not None:
+                found[name] = (path, fingerprint)
+        return found
+
+    def _fingerprint(self, path):
+        entries = []
+        for model in STAGE_MODELS + BUILDING_MODELS:
+            try:
+                st = os.stat(os.path.join(path, model + self._extension))
+            except OSError:
+                return None
+            entries.append((model, st.st_size, st.st_mtime_ns))
+        return tuple(entries)
+
+    def poll(self):
+        """Load the new or changed versions whose files have settled, and drop the removed ones."""
+        found = self._discover()
+        if self._stranded in found:
+            self._stranded = None
+        for name, (path, fingerprint) in found.items():
+            current = self._versions.get(name)
+            if current is not None and current.fingerprint == fingerprint:
+                self._pending.pop(name, None)
+                continue
+            if name in self._failed and self._failed[name][0] == fingerprint:
+                continue
+            # Files still being copied show up as a fingerprint that keeps changing
+            if self._pending.get(name) != fingerprint:
+                self._pending[name] = fingerprint
+                continue
+            del self._pending[name]
+            self._load(name, path, fingerprint)
+
+        for name in set(self._versions) - set(found):
+            remaining = {n: version for n, version in self._versions.items() if n in found}
+            if name == self._active.name and self._active_name(remaining) not in remaining:
+                if self._stranded != name:
+                    logger.warning(f"Model version '{name}' was removed, but no other loaded version can replace it")
+                    self._stranded = name
+                continue
+            logger.info(f"Model version '{name}' was removed")
+            self._swap(name, None)
+        for name in set(self._pending) - set(found):
+            del self._pending[name]
+        self._collect()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Scanning for model versions failed")
+
+    def _load(self, name, path, fingerprint):
+        start = time.perf_counter()
+        try:
+            engine = load_engine(path, self.mode)
+            if self.warmup is not None:
+                self.warmup(engine)
+        except Exception as e:
+            self._failed[name] = (fingerprint, str(e))
+            model_loads.inc(version=name, outcome='error')
+            logger.exception(f"Failed to load model version '{name}' from {path}")
+            return
+        self._failed.pop(name, None)
+        version = ModelVersion(name, path, fingerprint, engine, time.perf_counter() - start)
+        self._swap(name, version)
+        model_loads.inc(version=name, outcome='loaded')
+        logger.info(f"Loaded model version {version.key} in {version.load_seconds:.2f}s")
+
+    def _active_name(self, versions):
+        if self.active != LATEST_VERSION:
+            return self.active
+        named = sorted(name for name in versions if name != DEFAULT_VERSION)
+        return named[-1] if named else DEFAULT_VERSION
+
+    def _swap(self, name, version):
+        with self._lock:
+            versions = dict(self._versions)
+            old = versions.pop(name, None)
+            if version is not None:
+                versions[name] = version
+            previous = self._active
+            self._versions = versions
+            self._active = versions.get(self._active_name(versions), self._active)
+            self._shadow = versions.get(self.shadow) if self.shadow is not None else None
+        if previous is not None and self._active is not previous:
+            logger.info(f"Serving model version {self._active.key} instead of {previous.key}")
+        if old is not None:
+            self._retired.append((old.key, weakref.ref(old.engine)))
+            del old
+            self._collect()
+
+    def _collect(self):
+        """Free the engines of replaced versions that no request holds any more."""
+        if not self._retired:
+            return
+        # Keras models reference themselves, so dropping the last reference is not enough
+        gc.collect()
+        retired = []
+        for key, engine in self._retired:
+            if engine() is None:
+                logger.info(f"Freed model version {key}")
+            else:
+                retired.append((key, engine))
+        self._retired = retired
+
+    # Shadow
+
+    def _run_shadow(self):
+        while True:
+            schema, shadow, X, outputs = self._shadow_queue.get()
+            key = shadow.key
+            try:
+                candidate = getattr(shadow.engine, f'predict_{schema}')(X)
+            except Exception:
+                logger.exception(f"Shadow prediction on model version {key} failed")
+                continue
+            finally:
+                # A replaced shadow version can be freed while the queue is idle
+                del shadow
+            self.drift.record(schema, key, outputs, candidate)
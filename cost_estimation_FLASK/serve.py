@@ -0,0 +1,80 @@
+"""Production entry point for the cost estimation API: ``python serve.py``.
+
+Serves app.py from WEB_WORKERS forked processes (see common/prefork.py) on PORT.
+Each worker runs INFERENCE_THREADS intra-op threads, by default the cores
+split evenly between the workers, so the workers don't oversubscribe them.
+
+INFERENCE_MODE defaults to 'numpy' here (app.py alone defaults to 'fused'):
+the master loads the .npz bundles and preprocessing once, and the workers
+share them copy-on-write; model versions then need their .npz files too
+(``python numpy_engine.py export``). The model watcher and batcher threads
+start in each worker rather than the master. TensorFlow can't be used across a fork once it
+has started, so with INFERENCE_MODE=fused or per_model nothing is shared:
+every worker loads its own copy of the models, after sizing its thread
+pools, and memory grows with WEB_WORKERS.
+
+Workers are recycled after WEB_MAX_REQUESTS requests (0 disables; plus up
+to WEB_MAX_REQUESTS_JITTER) or above WEB_MAX_RSS_MB of resident memory;
+``kill -HUP`` on the master replaces them all without dropping requests.
+GET /ready answers 200 once a worker has run its warm-up predictions.
+Metrics on /metrics are per worker, and each worker watches MODEL_DIR and
+swaps in new model versions on its own (see registry.py).
+"""
+import logging
+import os
+
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 2))
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+
+# BLAS sizes its thread pool when NumPy is first imported, so this comes
+# before anything that imports it
+for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(variable, str(INFERENCE_THREADS))
+
+from common.prefork import PreforkServer  # noqa: E402
+
+PRELOAD = os.environ.setdefault('INFERENCE_MODE', 'numpy') == 'numpy'
+if PRELOAD:
+    os.environ['DEFER_THREADS'] = '1'
+
+
+def load_app():
+    from app import app
+    return app
+
+
+def worker_init():
+    if PRELOAD:
+        import app
+        app.init_worker_process()
+    else:
+        # Must happen before TensorFlow starts, i.e. before app.py loads the models
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_THREADS)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def warmup():
+    import app
+    app.warmup()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    PreforkServer(
+        load_app,
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', 5001)),
+        workers=WEB_WORKERS,
+        preload=PRELOAD,
+        worker_init=worker_init,
+        warmup=warmup,
+        max_requests=int(os.environ.get('WEB_MAX_REQUESTS', 0)),
+        max_requests_jitter=int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 0)),
+        max_rss_bytes=int(float(os.environ.get('WEB_MAX_RSS_MB', 0)) * 2 ** 20),
+        graceful_timeout=float(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30)),
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
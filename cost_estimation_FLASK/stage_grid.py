@@ -0,0 +1,198 @@
+"""Precomputed lookup grid for the stage models.
+
+The stage models only see four categoricals plus ``area_sqft`` and
+``floors``, so their outputs can be tabulated for every category combination
+and integer floor count over a dense range of areas. Online lookups
+interpolate linearly over area; rows outside the grid go to the models.
+
+Usage:
+    python stage_grid.py build [--area-step 25] [--engine fused]
+    python stage_grid.py show
+"""
+import argparse
+import itertools
+import os
+import threading
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+GRID_PATH = os.path.join(MODEL_DIR, "stage_grid.npz")
+
+AREA = 'area_sqft'
+FLOORS = 'floors'
+OUTPUTS = [
+    'cement_bags', 'sand_cubic_meters', 'steel_kg', 'bricks_units',
+    'aggregates_cubic_meters', 'estimated_stage_days', 'estimated_stage_cost_inr'
+]
+
+
+def _stack(materials, days, cost):
+    return np.column_stack([materials, days, cost]).astype(np.float32)
+
+
+class StageGrid:
+    """Interpolating lookup over a grid written by ``python stage_grid.py build``."""
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as grid:
+            self.features = [str(f) for f in grid['features']]
+            self.categories = [[str(c) for c in grid[f'categories_{i}']] for i in range(len(self.features))]
+            self.floors = grid['floors']
+            self.areas = grid['areas']
+            self.values = grid['values']
+            self.max_abs_error = grid['max_abs_error']
+            self.max_rel_error = grid['max_rel_error']
+
+        self._category_index = [{value: i for i, value in enumerate(values)} for values in self.categories]
+        self._radix = [int(r) for r in np.cumprod([1] + [len(values) for values in self.categories[:0:-1]])[::-1]]
+        self._floor_index = {int(f): i for i, f in enumerate(self.floors)}
+        self._area_min = float(self.areas[0])
+        self._area_step = float(self.areas[1] - self.areas[0])
+        self._area_max = float(self.areas[-1])
+        self._last_interval = len(self.areas) - 2
+        # Rows of (combo, floor, area) flattened so a lookup is one gather
+        self._flat = self.values.reshape(-1, self.values.shape[-1])
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _cell(self, row):
+        """Return (flat index of the lower area node, weight of the upper one), or None outside the grid."""
+        try:
+            area = float(row.get(AREA))
+            floors = float(row.get(FLOORS))
+        except (TypeError, ValueError):
+            return None
+        if not self._area_min <= area <= self._area_max or not floors.is_integer():
+            return None
+        floor = self._floor_index.get(int(floors))
+        if floor is None:
+            return None
+        combo = 0
+        for feature, index, radix in zip(self.features, self._category_index, self._radix):
+            value = row.get(feature)
+            if not isinstance(value, str) or value not in index:
+                return None
+            combo += index[value] * radix
+        position = (area - self._area_min) / self._area_step
+        lo = min(int(position), self._last_interval)
+        return (combo * len(self.floors) + floor) * len(self.areas) + lo, position - lo
+
+    def lookup(self, rows):
+        """Return (outputs, hit) for a list of row dicts.
+
+        ``outputs`` is an (n, 7) array ordered like ``OUTPUTS``; rows where
+        ``hit`` is False fall outside the grid and are left as zeros.
+        """
+        cells = [self._cell(row) if isinstance(row, dict) else None for row in rows]
+        hit = np.array([cell is not None for cell in cells], dtype=bool)
+        inside = [cell for cell in cells if cell is not None]
+
+        outputs = np.zeros((len(rows), len(OUTPUTS)), dtype=np.float32)
+        if inside:
+            index, t = np.array(inside).T
+            index = index.astype(np.intp)
+            lower = self._flat[index]
+            upper = self._flat[index + 1]
+            outputs[hit] = lower + (upper - lower) * t[:, None].astype(np.float32)
+
+        with self._lock:
+            self.hits += len(inside)
+            self.fallbacks += len(rows) - len(inside)
+        return outputs, hit
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "area_range": [self._area_min, self._area_max],
+                "area_step": self._area_step,
+                "floors": [int(f) for f in self.floors],
+                "max_interpolation_abs_error": dict(zip(OUTPUTS, map(float, self.max_abs_error))),
+                "max_interpolation_rel_error": dict(zip(OUTPUTS, map(float, self.max_rel_error))),
+            }
+
+
+def build_grid(engine, encoder, areas, floors, path):
+    """Evaluate ``engine`` over the grid and write it to ``path``.
+
+    The interpolation error is measured against the live model at the
+    midpoint of every pair of neighbouring grid areas, where linear
+    interpolation is furthest from the nodes.
+    """
+    features = list(encoder.categories)
+    categories = [encoder.categories[feature] for feature in features]
+    combos = list(itertools.product(*categories))
+
+    def evaluate(area_values):
+        rows = [
+            {**dict(zip(features, combo)), FLOORS: int(floor), AREA: float(area)}
+            for combo in combos for floor in floors for area in area_values
+        ]
+        _, X, _ = encoder.encode_rows(rows)
+        out = _stack(*engine.predict_stage(X))
+        return out.reshape(len(combos), len(floors), len(area_values), len(OUTPUTS))
+
+    values = evaluate(areas)
+    midpoints = (areas[:-1] + areas[1:]) / 2
+    live = evaluate(midpoints)
+    interpolated = (values[:, :, :-1] + values[:, :, 1:]) / 2
+    abs_error = np.abs(interpolated - live)
+    max_abs_error = abs_error.max(axis=(0, 1, 2))
+    max_rel_error = (abs_error / np.maximum(np.abs(live), 1.0)).max(axis=(0, 1, 2))
+
+    arrays = {f'categories_{i}': np.array(values_) for i, values_ in enumerate(categories)}
+    np.savez(path, features=np.array(features), floors=np.asarray(floors), areas=np.asarray(areas, dtype=np.float64),
+             values=values, max_abs_error=max_abs_error, max_rel_error=max_rel_error, **arrays)
+    return max_abs_error, max_rel_error
+
+
+def build(args):
+    from inference import load_engine
+    from preprocessing import PREPROCESSING_DIR, load_preprocessing
+
+    engine = load_engine(args.model_dir, args.engine)
+    encoder = load_preprocessing(os.path.join(args.model_dir, os.path.basename(PREPROCESSING_DIR)))['stage']
+    areas = np.arange(args.area_min, args.area_max + args.area_step / 2, args.area_step, dtype=np.float64)
+    floors = np.arange(args.floors_min, args.floors_max + 1)
+
+    max_abs_error, max_rel_error = build_grid(engine, encoder, areas, floors, args.output)
+    print(f"Wrote {args.output} ({os.path.getsize(args.output) // 1024} KB): "
+          f"{len(areas)} areas x {len(floors)} floors per category combination")
+    print("Max interpolation error vs live model (absolute / relative):")
+    for name, abs_err, rel_err in zip(OUTPUTS, max_abs_error, max_rel_error):
+        print(f"  {name:25s} {abs_err:12.4f} / {rel_err:.2e}")
+
+
+def show(args):
+    stats = StageGrid(args.output).stats()
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--output', default=GRID_PATH)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='evaluate the stage models over the grid')
+    build_parser.add_argument('--engine', default='fused', help='inference mode used to fill the grid')
+    build_parser.add_argument('--area-min', type=float, default=500)
+    build_parser.add_argument('--area-max', type=float, default=5000)
+    build_parser.add_argument('--area-step', type=float, default=25)
+    build_parser.add_argument('--floors-min', type=int, default=1)
+    build_parser.add_argument('--floors-max', type=int, default=5)
+    build_parser.set_defaults(func=build)
+    commands.add_parser('show', help='print grid bounds and interpolation error').set_defaults(func=show)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
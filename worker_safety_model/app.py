@@ -1,16 +1,38 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.security import safe_join
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
+import base64
+import json
 import cv2
 import numpy as np
 import tempfile
+import shutil
 import uuid
 import logging
+import multiprocessing
+import threading
+import time
+from contextlib import ExitStack
 import torch
 from ultralytics import YOLO
 from ultralytics.nn.tasks import DetectionModel
 
+from association import ClassFilter, compliance
+from backends import INFERENCE_BACKENDS, load_backend, resolve_backend
+from dedup import MediaCache, settings_fingerprint
+from detection import DETECTION_MODES, Detector
+from jobs import JobProgress, JobQueue, JobQueueFull, JobStore
+from common.metrics import REGISTRY, instrument, model_load_seconds, queue_depth, stage_seconds, stage_timer
+from sampling import SAMPLING_POLICIES, FixedStride, SceneChange, TrackMotion
+from storage import OutputStore
+from stream import NETWORK_SCHEMES, StreamMonitor, is_file_source, parse_source
+from tracker import IoUTracker, stitch_reports
+from uploads import decode_image, encode_image, image_format, read_upload, spooling_request, upload_digest, video_path
+from video_chunks import ChunkPool, concat_segments, plan_chunks, segment_format
+from video_pipeline import VideoPipeline
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,20 +41,110 @@ logger = logging.getLogger(__name__)
 torch.serialization.add_safe_globals([DetectionModel])
 
 app = Flask(__name__)
+instrument(app)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:3000" , "https://edai-sy-sem-02.vercel.app/"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type"],
+        "expose_headers": ["X-Missing-Items"]
     }
 })
 
 # Configure upload folder and file size limit
-UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = 'outputs'
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', 'outputs')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'mp4', 'avi', 'mov'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Uploads are processed from memory. Videos larger than UPLOAD_SPOOL_MAX_BYTES
+# are spooled to a temp file in UPLOAD_SPOOL_DIR (the system temp directory by
+# default) instead; only queued jobs are written to UPLOAD_FOLDER
+UPLOAD_SPOOL_MAX_BYTES = int(os.environ.get('UPLOAD_SPOOL_MAX_BYTES', 4 * 1024 * 1024))
+UPLOAD_SPOOL_DIR = os.environ.get('UPLOAD_SPOOL_DIR') or None
+
+# How processed images are returned: written to OUTPUT_FOLDER ('file'),
+# base64 in the JSON results ('base64'), or as the response body ('inline',
+# single image only); chosen per request with the ``output`` parameter
+OUTPUT_MODES = ('file', 'base64', 'inline')
+
+# Number of images sent through each YOLO model per forward pass
+INFERENCE_BATCH_SIZE = int(os.environ.get('INFERENCE_BATCH_SIZE', 8))
+
+# How the person and PPE models are combined, one of DETECTION_MODES (see detection.py)
+DETECTION_MODE = os.environ.get('DETECTION_MODE', 'sequential')
+
+# CPU inference backend for both YOLO models, one of INFERENCE_BACKENDS (see
+# backends.py); exported models are cached in EXPORT_DIR. INFERENCE_INT8=1
+# quantizes the ONNX export to int8
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+INFERENCE_INT8 = os.environ.get('INFERENCE_INT8', '0') == '1'
+EXPORT_DIR = os.environ.get('EXPORT_DIR', 'exported')
+
+# Video analysis: every Nth frame is run through the models; the decode and
+# encode threads are decoupled from inference by queues of this many frames
+VIDEO_SAMPLE_EVERY = 5
+VIDEO_QUEUE_SIZE = int(os.environ.get('VIDEO_QUEUE_SIZE', 32))
+
+# While every tracked worker moves less than VIDEO_MOTION_THRESHOLD box heights
+# per frame, detection backs off to every VIDEO_MAX_SAMPLE_EVERY frames (set it
+# to VIDEO_SAMPLE_EVERY to disable); tracked boxes fill in the frames between
+VIDEO_MAX_SAMPLE_EVERY = int(os.environ.get('VIDEO_MAX_SAMPLE_EVERY', 15))
+VIDEO_MOTION_THRESHOLD = float(os.environ.get('VIDEO_MOTION_THRESHOLD', 0.01))
+
+# Which frames of an uploaded video go through detection, one of
+# SAMPLING_POLICIES (see sampling.py): 'stride' is every VIDEO_SAMPLE_EVERY-th
+# frame, 'motion' the back-off above, and 'scene' detects once the picture has
+# changed by VIDEO_SCENE_THRESHOLD since the last detection, at most every
+# VIDEO_MIN_INTERVAL and at least every VIDEO_MAX_INTERVAL seconds. Chunked
+# clips (VIDEO_WORKERS > 1) use the same policy, restarted in every range
+VIDEO_SAMPLING = os.environ.get('VIDEO_SAMPLING', 'motion')
+VIDEO_MIN_INTERVAL = float(os.environ.get('VIDEO_MIN_INTERVAL', 0.1))
+VIDEO_MAX_INTERVAL = float(os.environ.get('VIDEO_MAX_INTERVAL', 1.0))
+VIDEO_SCENE_THRESHOLD = float(os.environ.get('VIDEO_SCENE_THRESHOLD', 0.02))
+
+# Background jobs (/process-media?async=1): SQLite file holding job state, the
+# number of worker processes, and how many jobs may be queued or running
+JOBS_DB = os.environ.get('JOBS_DB', 'jobs.db')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 16))
+
+# Clips of at least 2 x VIDEO_MIN_CHUNK_FRAMES frames are split into ranges
+# processed by up to VIDEO_WORKERS processes, each with its own models. Every
+# range runs the VIDEO_SAMPLING policy from its own first frame, so only the
+# 'stride' policy picks exactly the frames of a sequential pass; 'motion' and
+# 'scene' restart at each range start and may sample differently around it
+VIDEO_WORKERS = int(os.environ.get('VIDEO_WORKERS', 1))
+VIDEO_MIN_CHUNK_FRAMES = int(os.environ.get('VIDEO_MIN_CHUNK_FRAMES', 250))
+
+# Live streams (/streams): analyzed frames per second, how many streams may
+# run at once, and whether local video files (paths and file:// URLs) are accepted
+STREAM_ANALYSIS_FPS = float(os.environ.get('STREAM_ANALYSIS_FPS', 2.0))
+STREAM_MAX = int(os.environ.get('STREAM_MAX', 4))
+STREAM_ALLOW_FILES = os.environ.get('STREAM_ALLOW_FILES', '0') == '1'
+
+# Processed media retention: OUTPUT_DB indexes OUTPUT_FOLDER; outputs older
+# than OUTPUT_MAX_AGE_HOURS are deleted, and the least recently used ones
+# while the folder is over OUTPUT_MAX_BYTES (0 disables either limit), by a
+# pass every OUTPUT_CLEANUP_INTERVAL seconds. Served outputs may be cached by
+# clients for OUTPUT_CACHE_MAX_AGE seconds
+OUTPUT_DB = os.environ.get('OUTPUT_DB', 'outputs.db')
+OUTPUT_MAX_AGE_HOURS = float(os.environ.get('OUTPUT_MAX_AGE_HOURS', 72))
+OUTPUT_MAX_BYTES = int(os.environ.get('OUTPUT_MAX_BYTES', 5 * 1024 ** 3))
+OUTPUT_CLEANUP_INTERVAL = float(os.environ.get('OUTPUT_CLEANUP_INTERVAL', 300))
+OUTPUT_CACHE_MAX_AGE = int(os.environ.get('OUTPUT_CACHE_MAX_AGE', 3600))
+
+# Repeated uploads of the same bytes reuse the earlier output while it is
+# stored; at most MEDIA_CACHE_SIZE results are remembered (0 disables)
+MEDIA_CACHE_SIZE = int(os.environ.get('MEDIA_CACHE_SIZE', 1000))
+
+# Output codecs in order of preference
+VIDEO_CODECS = [
+    ('avc1', 'H.264'),
+    ('mp4v', 'MPEG-4'),
+    ('XVID', 'XVID')
+]
+
 # Create necessary folders with proper permissions
 try:
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -51,12 +163,26 @@ if os.name != 'nt':  # Not Windows
     except Exception as e:
         logger.error(f"Error setting permissions: {str(e)}")
 
+PPE_WEIGHTS = 'yolov8s_custom.pt'
+HUMAN_WEIGHTS = 'yolov8n.pt'
+
 # Load models with error handling
 try:
     logger.info("Loading YOLO models...")
-    ppe_model = YOLO('yolov8s_custom.pt', weights_only=True)
-    human_model = YOLO('yolov8n.pt', weights_only=True)
-    logger.info("Models loaded successfully")
+    if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND must be one of {INFERENCE_BACKENDS}, got {INFERENCE_BACKEND!r}")
+    inference_backend = resolve_backend(INFERENCE_BACKEND, INFERENCE_INT8)
+
+    start = time.perf_counter()
+    ppe_model = YOLO(PPE_WEIGHTS, weights_only=True)
+    ppe_model = load_backend(ppe_model, PPE_WEIGHTS, inference_backend, EXPORT_DIR, int8=INFERENCE_INT8)
+    model_load_seconds.set(time.perf_counter() - start, model='ppe')
+
+    start = time.perf_counter()
+    human_model = YOLO(HUMAN_WEIGHTS, weights_only=True)
+    human_model = load_backend(human_model, HUMAN_WEIGHTS, inference_backend, EXPORT_DIR, int8=INFERENCE_INT8)
+    model_load_seconds.set(time.perf_counter() - start, model='human')
+    logger.info(f"Models loaded successfully ({inference_backend}{' int8' if INFERENCE_INT8 else ''} backend)")
 except Exception as e:
     logger.error(f"Error loading models: {str(e)}")
     raise
@@ -64,187 +190,327 @@ except Exception as e:
 # Safety gear list
 safety_items = ['Glass', 'Gloves', 'Helmet', 'Safety-Vest']
 
+if DETECTION_MODE not in DETECTION_MODES:
+    raise ValueError(f"DETECTION_MODE must be one of {DETECTION_MODES}, got {DETECTION_MODE!r}")
+if VIDEO_SAMPLING not in SAMPLING_POLICIES:
+    raise ValueError(f"VIDEO_SAMPLING must be one of {SAMPLING_POLICIES}, got {VIDEO_SAMPLING!r}")
+detector = Detector(human_model, ppe_model, DETECTION_MODE, INFERENCE_BATCH_SIZE, item_classes=safety_items)
+person_filter = ClassFilter(human_model.names, ['person'])
+item_filter = ClassFilter(ppe_model.names, safety_items)
+logger.info(f"Detection mode: {DETECTION_MODE}")
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def is_video_file(filename):
     return filename.lower().endswith(('.mp4', '.avi', '.mov'))
 
-def detect_humans(frame):
-    results = human_model(frame, verbose=False)
-    for r in results:
-        for c in r.boxes:
-            class_id = int(c.cls)
-            class_name = human_model.names[class_id]
-            if class_name == 'person':
-                return True
-    return False
-
-def process_image(image_path):
+app.request_class = spooling_request(UPLOAD_SPOOL_MAX_BYTES, UPLOAD_SPOOL_DIR, is_video_file)
+
+def associate(detections):
+    """Match safety items to people for each (person result, PPE result) pair.
+
+    Returns per frame None when no person was found, else a dict with the
+    person boxes, item boxes and item classes as arrays plus the boolean
+    (persons, safety_items) ``present`` matrix.
+    """
+    analyses = []
+    with stage_timer('association'):
+        for human, ppe in detections:
+            persons, _ = person_filter.select(human)
+            if not len(persons):
+                analyses.append(None)
+                continue
+            items, item_classes = item_filter.select(ppe)
+            analyses.append({
+                'persons': persons,
+                'items': items,
+                'item_classes': item_classes,
+                'present': compliance(persons, items, item_classes, len(safety_items))
+            })
+    return analyses
+
+def missing_items(present):
+    """Safety items missing on at least one person, in safety_items order."""
+    return [safety_items[j] for j in np.flatnonzero(~present.all(axis=0))]
+
+def status_message(missing):
+    if missing:
+        return f"❌ Missing: {', '.join(missing)}", (0, 0, 255)
+    return "✅ All Safety Gear Present", (0, 255, 0)
+
+def annotate_image(frame, analysis):
+    """Draw the people of ``analysis`` on ``frame`` and return (frame, missing items)."""
+    # Collect all missing items across all persons
+    all_missing = missing_items(analysis['present'])
+
+    # Draw only person boxes
+    for x1, y1, x2, y2 in analysis['persons'].astype(int).tolist():
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)  # Blue for person
+
+    # Draw a single message at the top
+    msg, color = status_message(all_missing)
+    cv2.putText(frame, msg, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+    return frame, all_missing
+
+def process_images(frames, batch_size=None):
+    """Annotate decoded images, running each YOLO model over the whole list in batches.
+
+    Returns one (frame, missing items) pair per input frame. Which model runs
+    on which frame depends on DETECTION_MODE.
+    """
+    # Detect persons and safety items, then match them up
+    analyses = associate(detector.detect(frames, batch_size))
+
+    outputs = []
+    with stage_timer('annotation'):
+        for frame, analysis in zip(frames, analyses):
+            if analysis is None:
+                cv2.putText(frame, "❌ No human detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+                outputs.append((frame, ["No human detected"]))
+            else:
+                outputs.append(annotate_image(frame, analysis))
+    return outputs
+
+def detect_video_frames(frames):
+    """Run both models over sampled video frames and match items to people (see associate)."""
+    return associate(detector.detect(frames))
+
+def draw_workers(frame, workers):
+    """Draw tracked worker boxes labelled with their ID and missing gear."""
+    for track, bbox in workers:
+        x1, y1, x2, y2 = map(int, bbox)
+        color = (0, 0, 255) if track.missing else (255, 0, 0)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        label = f"Worker {track.id}"
+        if track.missing:
+            label += f": no {', '.join(track.missing)}"
+        cv2.putText(frame, label, (x1, max(y1 - 10, 15)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+def open_video_writer(output_path, fps, size, codecs=VIDEO_CODECS):
+    """Return a cv2.VideoWriter for the first of ``codecs`` that opens, or None."""
+    for codec_name, codec_desc in codecs:
+        try:
+            fourcc = cv2.VideoWriter_fourcc(*codec_name)
+            out = cv2.VideoWriter(output_path, fourcc, fps, size)
+            if out.isOpened():
+                logger.info(f"Successfully initialized video writer with {codec_desc} codec")
+                return out
+        except Exception as e:
+            logger.warning(f"Failed to initialize video writer with {codec_desc} codec: {str(e)}")
+    return None
+
+video_frames = REGISTRY.counter(
+    'video_frames_total', 'Frames of uploaded videos by sampling policy and whether detection ran on them',
+    ['policy', 'analyzed']
+)
+
+def make_sampler(policy, fps, tracker):
+    """The frame selection policy named ``policy`` (one of SAMPLING_POLICIES) for a clip at ``fps``."""
+    if policy == 'scene':
+        return SceneChange(fps, VIDEO_MIN_INTERVAL, VIDEO_MAX_INTERVAL, VIDEO_SCENE_THRESHOLD)
+    if policy == 'motion':
+        return TrackMotion(tracker, VIDEO_SAMPLE_EVERY, VIDEO_MAX_SAMPLE_EVERY, VIDEO_MOTION_THRESHOLD)
+    return FixedStride(VIDEO_SAMPLE_EVERY)
+
+def annotate_video(cap, out, total_frames, adaptive=True, progress=None, first_index=0, max_frames=None):
+    """Detect, track and annotate frames of an open capture into ``out``.
+
+    With ``adaptive`` frames are picked by the VIDEO_SAMPLING policy;
+    otherwise every VIDEO_SAMPLE_EVERY-th frame (by absolute index) is
+    analyzed. Returns (sampled frames with people, missing item set, tracker).
+    """
+    processed_frames = 0
+    missing_items_set = set()
+    tracker = IoUTracker()
+    policy = VIDEO_SAMPLING if adaptive else 'stride'
+    select = make_sampler(policy, cap.get(cv2.CAP_PROP_FPS), tracker)
+    # Tracks outlive three of the longest gaps between detections
+    tracker.max_age = 3 * max(VIDEO_MAX_SAMPLE_EVERY, select.max_gap)
+    overlay = None
+
+    def analyze(chunk):
+        nonlocal processed_frames, overlay
+        detections = iter(detect_video_frames([frame for _, frame, selected in chunk if selected]))
+        start = time.perf_counter()
+        for index, frame, selected in chunk:
+            if selected:
+                analysis = next(detections)
+                if analysis is None:
+                    tracker.update(index, [], [])
+                    overlay = ("❌ No human detected", (0, 0, 255))
+                else:
+                    present = analysis['present']
+                    tracker.update(
+                        index,
+                        analysis['persons'],
+                        [[safety_items[j] for j in np.flatnonzero(~row)] for row in present]
+                    )
+
+                    for (x1, y1, x2, y2), item_class in zip(analysis['items'].astype(int).tolist(), analysis['item_classes'].tolist()):
+                        class_name = safety_items[item_class]
+                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                        cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+                    # Check for missing safety items, per person as in the image path
+                    missing = missing_items(present)
+                    overlay = status_message(missing)
+                    missing_items_set.update(missing)
+                    processed_frames += 1
+
+            # Frames between detections show the tracked boxes and the last message
+            workers = tracker.visible(index)
+            for track, _ in workers:
+                track.mark(index)
+            draw_workers(frame, workers)
+            if overlay:
+                cv2.putText(frame, overlay[0], (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, overlay[1], 2)
+        # Tracking and drawing over the whole chunk
+        stage_seconds.observe(time.perf_counter() - start, stage='annotation', model='')
+
+    pipeline = VideoPipeline(
+        cap, out, analyze,
+        select=select,
+        batch_size=INFERENCE_BATCH_SIZE,
+        queue_size=VIDEO_QUEUE_SIZE,
+        total_frames=total_frames,
+        progress=progress,
+        first_index=first_index,
+        max_frames=max_frames
+    )
+    pipeline.run()
+    stats = select.stats()
+    video_frames.inc(stats['selected'], policy=policy, analyzed='true')
+    video_frames.inc(stats['frames'] - stats['selected'], policy=policy, analyzed='false')
+    logger.info(f"Sampling ({policy}): {stats}")
+    return processed_frames, missing_items_set, tracker
+
+def process_video_range(video_path, start, end, segment_path, codecs, adaptive=True):
+    """Annotate frames [start, end) of a video into ``segment_path``; runs in a chunk worker process.
+
+    ``adaptive`` is passed on to annotate_video, so the range is sampled by
+    the VIDEO_SAMPLING policy started afresh at ``start``.
+
+    Returns (missing items, sampled frames with people, worker report, tracker
+    edges, metrics recorded in the worker).
+    """
+    cap = cv2.VideoCapture(video_path)
+    out = None
     try:
-        frame = cv2.imread(image_path)
-        if frame is None:
-            return None, "Error loading image"
-
-        # Detect all persons
-        human_results = human_model(frame, verbose=False)
-        person_boxes = []
-        for r in human_results:
-            for c in r.boxes:
-                class_id = int(c.cls)
-                class_name = human_model.names[class_id]
-                if class_name == 'person':
-                    x1, y1, x2, y2 = map(int, c.xyxy[0])
-                    person_boxes.append({'bbox': (x1, y1, x2, y2), 'items': []})
-
-        if not person_boxes:
-            cv2.putText(frame, "❌ No human detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-            return frame, ["No human detected"]
-
-        # Detect all safety items
-        ppe_results = ppe_model(frame, verbose=False)
-        item_boxes = []
-        for r in ppe_results:
-            for c in r.boxes:
-                class_id = int(c.cls)
-                class_name = ppe_model.names[class_id]
-                if class_name in safety_items:
-                    x1, y1, x2, y2 = map(int, c.xyxy[0])
-                    item_boxes.append({'bbox': (x1, y1, x2, y2), 'class': class_name, 'center': ((x1 + x2) // 2, (y1 + y2) // 2)})
-
-        # Associate items to persons
-        for item in item_boxes:
-            icx, icy = item['center']
-            best_idx = -1
-            for idx, person in enumerate(person_boxes):
-                px1, py1, px2, py2 = person['bbox']
-                if px1 <= icx <= px2 and py1 <= icy <= py2:
-                    best_idx = idx
-                    break
-            if best_idx != -1:
-                person_boxes[best_idx]['items'].append(item['class'])
-
-        # Collect all missing items across all persons
-        all_missing = set()
-        for person in person_boxes:
-            present = set(person['items'])
-            missing = [item for item in safety_items if item not in present]
-            all_missing.update(missing)
-
-        # Draw only person boxes
-        for person in person_boxes:
-            x1, y1, x2, y2 = person['bbox']
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 0, 0), 2)  # Blue for person
-
-        # Draw a single message at the top
-        if all_missing:
-            msg = f"❌ Missing: {', '.join(sorted(all_missing))}"
-            color = (0, 0, 255)
-        else:
-            msg = "✅ All Safety Gear Present"
-            color = (0, 255, 0)
-        cv2.putText(frame, msg, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+        if not cap.isOpened():
+            raise IOError(f"Error opening video file {video_path}")
+        fps = int(cap.get(cv2.CAP_PROP_FPS))
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        out = open_video_writer(segment_path, fps, size, codecs)
+        if out is None:
+            raise IOError("Error creating video segment")
+        # Only Motion JPEG segments have a quality setting; others ignore it
+        out.set(cv2.VIDEOWRITER_PROP_QUALITY, 100)
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        processed_frames, missing, tracker = annotate_video(
+            cap, out, total_frames=end - start if end is not None else 0, adaptive=adaptive,
+            first_index=start, max_frames=end - start if end is not None else None
+        )
+        report = tracker.report(cap.get(cv2.CAP_PROP_FPS))
+        return sorted(missing), processed_frames, report, tracker.edges(), REGISTRY.drain()
+    finally:
+        cap.release()
+        if out:
+            out.release()
 
-        return frame, sorted(all_missing)
-    except Exception as e:
-        return None, str(e)
+def process_video_chunked(video_path, output_path, chunks, fps, size, progress=None, adaptive=True):
+    """Process ``chunks`` of a video on the chunk pool and stitch the segments into ``output_path``."""
+    if adaptive and VIDEO_SAMPLING != 'stride':
+        logger.info(f"Sampling ({VIDEO_SAMPLING}) restarts at each of the {len(chunks)} ranges")
+    segment_dir = tempfile.mkdtemp(prefix='segments_', dir=OUTPUT_FOLDER)
+    try:
+        extension, codecs = segment_format(VIDEO_CODECS)
+        segment_paths = [os.path.join(segment_dir, f"{i:04d}{extension}") for i in range(len(chunks))]
+        starts, ends = zip(*chunks)
+        parts = chunk_pool.map(
+            process_video_range,
+            [video_path] * len(chunks), starts, ends, segment_paths, [codecs] * len(chunks),
+            [adaptive] * len(chunks)
+        )
+        if progress:
+            progress(sum((end if end is not None else start) - start for start, end in chunks))
 
-def process_video(video_path):
+        concat_segments(segment_paths, output_path, lambda: open_video_writer(output_path, fps, size))
+        for part in parts:
+            REGISTRY.merge(part[4])
+        missing_items_set = set().union(*(missing for missing, _, _, _, _ in parts))
+        processed_frames = sum(count for _, count, _, _, _ in parts)
+        workers = stitch_reports([(report, edges) for _, _, report, edges, _ in parts])
+        logger.info(f"Processed {len(chunks)} ranges in parallel ({processed_frames} sampled frames with people)")
+        return sorted(missing_items_set), workers
+    finally:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+
+def process_video(video_path, progress=None, workers=None, adaptive=True, output_name=None):
+    """Annotate a video and return (output path, missing items, workers).
+
+    ``workers`` lists every tracked person with the frame (and time) ranges
+    during which each safety item was missing. On failure the output path is
+    None and the second value is the error message. ``progress`` is called
+    with the number of frames handled as the video is processed.
+
+    With more than one worker process (VIDEO_WORKERS unless given) a long
+    clip is split into frame ranges processed in parallel, each sampled like
+    the sequential pass (see VIDEO_WORKERS). With ``adaptive=False`` both use
+    the fixed stride and report the same missing items. The output is named
+    after ``output_name`` (by default the input file name).
+    """
     try:
         cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             logger.error(f"Failed to open video file: {video_path}")
-            return None, "Error opening video file"
+            return None, "Error opening video file", []
 
         # Get video properties
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
+        frame_rate = cap.get(cv2.CAP_PROP_FPS)
+        fps = int(frame_rate)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         
         logger.info(f"Video properties: {width}x{height} @ {fps}fps, {total_frames} frames")
         
         # Always use MP4 output with H.264 codec
-        output_path = os.path.join(OUTPUT_FOLDER, f"processed_{os.path.basename(video_path)}")
+        output_path = os.path.join(OUTPUT_FOLDER, f"processed_{output_name or os.path.basename(video_path)}")
         output_path = output_path.replace('.avi', '.mp4').replace('.mov', '.mp4')
-        
-        # Try different codecs in order of preference
-        codecs = [
-            ('avc1', 'H.264'),
-            ('mp4v', 'MPEG-4'),
-            ('XVID', 'XVID')
-        ]
-        
-        out = None
-        for codec_name, codec_desc in codecs:
+
+        workers = workers or VIDEO_WORKERS
+        chunks = [(0, None)]
+        if workers > 1:
+            chunks = plan_chunks(total_frames, workers, VIDEO_SAMPLE_EVERY, VIDEO_MIN_CHUNK_FRAMES)
+        if len(chunks) > 1:
+            cap.release()
             try:
-                fourcc = cv2.VideoWriter_fourcc(*codec_name)
-                out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-                if out.isOpened():
-                    logger.info(f"Successfully initialized video writer with {codec_desc} codec")
-                    break
+                missing, report = process_video_chunked(
+                    video_path, output_path, chunks, fps, (width, height), progress, adaptive
+                )
             except Exception as e:
-                logger.warning(f"Failed to initialize video writer with {codec_desc} codec: {str(e)}")
-                continue
-        
-        if not out or not out.isOpened():
+                logger.error(f"Error during video processing: {str(e)}")
+                return None, f"Error during video processing: {str(e)}", []
+            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                return output_path, missing, report
+            logger.error("Output video file was not created properly")
+            return None, "Error: Output video file was not created properly", []
+
+        # Try different codecs in order of preference
+        out = open_video_writer(output_path, fps, (width, height))
+        if out is None:
+            cap.release()
             logger.error("Failed to initialize video writer with any codec")
-            return None, "Error creating output video file"
+            return None, "Error creating output video file", []
 
-        frame_count = 0
-        processed_frames = 0
-        missing_items_set = set()
-        
         try:
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # Process every 5th frame to save processing time
-                if frame_count % 5 == 0:
-                    # Check for human presence
-                    if detect_humans(frame):
-                        results = ppe_model(frame, verbose=False)
-                        detected_classes = []
-
-                        for r in results:
-                            for c in r.boxes:
-                                class_id = int(c.cls)
-                                class_name = ppe_model.names[class_id]
-                                if class_name in safety_items:
-                                    detected_classes.append(class_name)
-                                    x1, y1, x2, y2 = map(int, c.xyxy[0])
-                                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                                    cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-                        # Check for missing safety items
-                        missing = [item for item in safety_items if item not in detected_classes]
-                        missing_items_set.update(missing)
-                        
-                        if missing:
-                            msg = f"❌ Missing: {', '.join(missing)}"
-                            color = (0, 0, 255)
-                        else:
-                            msg = "✅ All Safety Gear Present"
-                            color = (0, 255, 0)
-
-                        # Overlay message
-                        cv2.putText(frame, msg, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-                        processed_frames += 1
-                    else:
-                        cv2.putText(frame, "❌ No human detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-
-                out.write(frame)
-                frame_count += 1
-
-                # Log progress every 100 frames
-                if frame_count % 100 == 0:
-                    logger.info(f"Processed {frame_count}/{total_frames} frames")
-
+            processed_frames, missing_items_set, tracker = annotate_video(cap, out, total_frames, adaptive, progress)
         except Exception as e:
             logger.error(f"Error during video processing: {str(e)}")
-            return None, f"Error during video processing: {str(e)}"
+            return None, f"Error during video processing: {str(e)}", []
         finally:
             cap.release()
             if out:
@@ -252,21 +518,78 @@ def process_video(video_path):
         
         # Verify the output file exists and has content
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-            logger.info("Video processing completed successfully")
-            return output_path, sorted(list(missing_items_set))
+            logger.info(f"Video processing completed successfully ({processed_frames} sampled frames with people)")
+            return output_path, sorted(list(missing_items_set)), tracker.report(frame_rate)
         else:
             logger.error("Output video file was not created properly")
-            return None, "Error: Output video file was not created properly"
+            return None, "Error: Output video file was not created properly", []
             
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
-        return None, str(e)
+        return None, str(e), []
+
+def make_stream_analyzer():
+    """Analysis callback for one live stream.
+
+    Tracks workers across analyzed frames and returns events when a worker
+    appears, starts or stops missing gear, or leaves the scene.
+    """
+    tracker = IoUTracker(max_age=3)
+    reported = {}  # worker id -> missing items last published
+    step = 0
+
+    def analyze(frame, timestamp):
+        nonlocal step
+        step += 1
+        analysis = detect_video_frames([frame])[0]
+        if analysis is None:
+            tracker.update(step, [], [])
+            cv2.putText(frame, "❌ No human detected", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        else:
+            present = analysis['present']
+            tracker.update(step, analysis['persons'], [[safety_items[j] for j in np.flatnonzero(~row)] for row in present])
+            draw_workers(frame, tracker.visible(step))
+            msg, color = status_message(missing_items(present))
+            cv2.putText(frame, msg, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+        events = []
+        alive = {track.id for track in tracker.tracks}
+        for worker_id in sorted(reported.keys() - alive):
+            events.append({'type': 'worker_left', 'worker_id': worker_id, 'missing': sorted(reported.pop(worker_id))})
+        for track, _ in tracker.visible(step):
+            missing = set(track.missing)
+            if track.id not in reported:
+                events.append({'type': 'worker_entered', 'worker_id': track.id, 'missing': sorted(missing)})
+            else:
+                before = reported[track.id]
+                if missing - before:
+                    events.append({'type': 'violation', 'worker_id': track.id, 'items': sorted(missing - before), 'missing': sorted(missing)})
+                if before - missing:
+                    events.append({'type': 'resolved', 'worker_id': track.id, 'items': sorted(before - missing), 'missing': sorted(missing)})
+            reported[track.id] = missing
+        return events
+
+    return analyze
+
+streams = {}
+streams_lock = threading.Lock()
+
+def get_stream(stream_id):
+    with streams_lock:
+        return streams.get(stream_id)
 
 @app.route('/test', methods=['GET'])
 def test():
     logger.info("Test endpoint called")
     return jsonify({'message': 'Server is running'}), 200
 
+# Readiness probe for load balancers: fails until warmup() has run in this process
+@app.route('/ready', methods=['GET'])
+def ready():
+    if not warmed_up:
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True, 'pid': os.getpid()}), 200
+
 @app.route('/health', methods=['GET'])
 def health_check():
     logger.info("Health check endpoint called")
@@ -274,17 +597,257 @@ def health_check():
         return jsonify({
             'status': 'healthy',
             'models_loaded': bool(ppe_model and human_model),
+            'inference_backend': inference_backend,
             'upload_folder_exists': os.path.exists(UPLOAD_FOLDER),
             'output_folder_exists': os.path.exists(OUTPUT_FOLDER),
             'upload_folder_writable': os.access(UPLOAD_FOLDER, os.W_OK),
-            'output_folder_writable': os.access(OUTPUT_FOLDER, os.W_OK)
+            'output_folder_writable': os.access(OUTPUT_FOLDER, os.W_OK),
+            'output_storage': output_store.usage(),
+            'media_cache': media_cache.stats()
         })
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({'status': 'unhealthy', 'error': str(e)}), 500
 
+def count_work_units(entries):
+    """Progress units for uploads saved to disk: one per video frame, one per image."""
+    total = 0
+    for _, filename, _, input_path in entries:
+        if is_video_file(filename):
+            cap = cv2.VideoCapture(input_path)
+            total += max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+            cap.release()
+        else:
+            total += 1
+    return total
+
+def process_uploads(entries, results, progress=None, output='file', cache_keys=None):
+    """Process uploads and fill in their slot of ``results``.
+
+    ``entries`` are (slot, filename, unique_filename, source) tuples where
+    ``source`` is a path for videos and, for images, either a path or the
+    encoded image bytes. Videos are processed one at a time; images are
+    decoded and run through the models together, then written to
+    OUTPUT_FOLDER or, with ``output='base64'``, returned in the result.
+    ``progress`` is called with the number of frames (or images) finished.
+    Results written to OUTPUT_FOLDER are remembered in the media cache under
+    ``cache_keys[slot]``.
+    """
+    cache_keys = cache_keys or {}
+    pending_images = []  # (slot, filename, unique_filename, frame)
+
+    for slot, filename, unique_filename, source in entries:
+        try:
+            if is_video_file(filename):
+                logger.info(f"Processing video: {filename}")
+                output_path, missing_items, workers = process_video(source, progress, output_name=unique_filename)
+                if output_path:
+                    output_store.add(os.path.basename(output_path))
+                    results[slot] = {
+                        'original_filename': filename,
+                        'processed_filename': os.path.basename(output_path),
+                        'status': 'success',
+                        'type': 'video',
+                        'missing_items': missing_items,
+                        'workers': workers
+                    }
+                    remember_result(cache_keys.get(slot), results[slot])
+                    logger.info(f"Video processed successfully: {filename}")
+                else:
+                    logger.error(f"Video processing failed: {filename}")
+                    results[slot] = {
+                        'original_filename': filename,
+                        'error': missing_items,
+                        'status': 'error'
+                    }
+            else:
+                # Images are decoded now and run through the models together below
+                with stage_timer('decode'):
+                    frame = decode_image(source) if isinstance(source, bytes) else cv2.imread(source)
+                if frame is not None:
+                    pending_images.append((slot, filename, unique_filename, frame))
+                else:
+                    logger.error(f"Image processing failed: {filename}")
+                    results[slot] = {
+                        'original_filename': filename,
+                        'error': "Error loading image",
+                        'status': 'error'
+                    }
+        except Exception as e:
+            logger.error(f"Error processing file {filename}: {str(e)}")
+            results[slot] = {
+                'original_filename': filename,
+                'error': str(e),
+                'status': 'error'
+            }
+
+    if pending_images:
+        logger.info(f"Processing {len(pending_images)} images in batches of {INFERENCE_BATCH_SIZE}")
+        try:
+            processed = process_images([frame for _, _, _, frame in pending_images])
+        except Exception as e:
+            logger.error(f"Error processing images: {str(e)}")
+            processed = [(None, str(e))] * len(pending_images)
+
+        for (slot, filename, unique_filename, _), (processed_frame, missing) in zip(pending_images, processed):
+            if processed_frame is not None:
+                results[slot] = {
+                    'original_filename': filename,
+                    'missing_items': missing,
+                    'status': 'success',
+                    'type': 'image'
+                }
+                if output == 'base64':
+                    with stage_timer('encode'):
+                        data, mimetype = encode_image(processed_frame, filename)
+                    results[slot]['mimetype'] = mimetype
+                    results[slot]['image_base64'] = base64.b64encode(data).decode('ascii')
+                else:
+                    with stage_timer('encode'):
+                        cv2.imwrite(os.path.join(OUTPUT_FOLDER, unique_filename), processed_frame)
+                    output_store.add(unique_filename)
+                    results[slot]['processed_filename'] = unique_filename
+                    remember_result(cache_keys.get(slot), results[slot])
+                logger.info(f"Image processed successfully: {filename}")
+            else:
+                logger.error(f"Image processing failed: {filename}")
+                results[slot] = {
+                    'original_filename': filename,
+                    'error': missing,
+                    'status': 'error'
+                }
+        if progress:
+            progress(len(pending_images))
+    return results
+
+def remember_result(key, result):
+    if key is not None:
+        media_cache.put(key, result['processed_filename'], {k: v for k, v in result.items() if k != 'original_filename'})
+
+def cached_result(key, filename, output='file'):
+    """The stored result for an upload seen before, or None."""
+    hit = media_cache.get(key, exists=lambda name: os.path.isfile(os.path.join(OUTPUT_FOLDER, name)))
+    if hit is None:
+        return None
+    name, result = hit
+    output_store.touch(name)
+    result = {'original_filename': filename, **result, 'cached': True}
+    if output == 'base64' and result.get('type') == 'image':
+        with open(os.path.join(OUTPUT_FOLDER, name), 'rb') as f:
+            result['image_base64'] = base64.b64encode(f.read()).decode('ascii')
+        result['mimetype'] = image_format(name)[1]
+        del result['processed_filename']
+    logger.info(f"Reusing the result for an identical upload of {filename}")
+    return result
+
+def init_worker_process(threads):
+    """Runs once in each job, chunk or serving worker process; splits the cores between the workers."""
+    torch.set_num_threads(threads)
+    # Serving workers are forked from a master whose warm-up already started the detector's threads
+    detector.after_fork()
+
+warmed_up = False
+
+def warmup():
+    """Run both models once on a blank frame, then report ready on /ready."""
+    global warmed_up
+    process_images([np.zeros((480, 640, 3), dtype=np.uint8)])
+    warmed_up = True
+
+def run_job(job_id, entries, results, cache_keys=None):
+    """Process a queued /process-media upload in a job worker process.
+
+    Returns the metrics recorded while doing so, which the job queue merges
+    into the server's registry.
+    """
+    logger.info(f"Job {job_id} started")
+    try:
+        job_store.update(job_id, status='running')
+        progress = JobProgress(job_store, job_id, job_store.get(job_id)['total_frames'])
+        process_uploads(entries, results, progress.advance, cache_keys=cache_keys)
+        job_store.update(job_id, status='finished', progress=100.0, results=results)
+        logger.info(f"Job {job_id} finished")
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {str(e)}")
+        job_store.update(job_id, status='failed', error=str(e))
+    finally:
+        remove_inputs(entries)
+    return REGISTRY.drain()
+
+def remove_inputs(entries):
+    """Delete the files a queued job saved in UPLOAD_FOLDER."""
+    for _, _, _, input_path in entries:
+        if os.path.exists(input_path):
+            os.remove(input_path)
+            logger.info(f"Cleaned up input file: {input_path}")
+
+output_store = OutputStore(
+    OUTPUT_FOLDER, OUTPUT_DB,
+    max_age=OUTPUT_MAX_AGE_HOURS * 3600,
+    max_bytes=OUTPUT_MAX_BYTES
+)
+# Job and chunk worker processes import this module too; only the server cleans up
+media_cache = MediaCache(
+    OUTPUT_DB,
+    settings_fingerprint([PPE_WEIGHTS, HUMAN_WEIGHTS], {
+        'backend': inference_backend,
+        'int8': INFERENCE_INT8,
+        'detection_mode': DETECTION_MODE,
+        'imgsz': detector.imgsz,
+        'batch_size': INFERENCE_BATCH_SIZE,
+        'safety_items': safety_items,
+        'video_sample_every': VIDEO_SAMPLE_EVERY,
+        'video_max_sample_every': VIDEO_MAX_SAMPLE_EVERY,
+        'video_motion_threshold': VIDEO_MOTION_THRESHOLD,
+        'video_sampling': VIDEO_SAMPLING,
+        'video_min_interval': VIDEO_MIN_INTERVAL,
+        'video_max_interval': VIDEO_MAX_INTERVAL,
+        'video_scene_threshold': VIDEO_SCENE_THRESHOLD,
+        'video_workers': VIDEO_WORKERS,
+        'video_min_chunk_frames': VIDEO_MIN_CHUNK_FRAMES,
+    }),
+    max_entries=MEDIA_CACHE_SIZE
+)
+output_store.on_evict(media_cache.forget)
+if multiprocessing.parent_process() is None:
+    output_store.start(OUTPUT_CLEANUP_INTERVAL)
+
+job_store = JobStore(JOBS_DB)
+job_queue = JobQueue(
+    job_store, run_job,
+    max_workers=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    initializer=init_worker_process,
+    initargs=(max(1, (os.cpu_count() or 1) // JOB_WORKERS),),
+    on_result=REGISTRY.merge
+)
+queue_depth.set_function(lambda: job_queue.stats()['pending'], queue='jobs')
+REGISTRY.gauge('streams_running', 'Live streams being monitored').set_function(
+    lambda: sum(monitor.running for monitor in list(streams.values()))
+)
+chunk_pool = ChunkPool(
+    VIDEO_WORKERS,
+    initializer=init_worker_process,
+    initargs=(max(1, (os.cpu_count() or 1) // VIDEO_WORKERS),)
+)
+
 @app.route('/process-media', methods=['POST'])
 def process_media():
+    """Process uploaded images and videos.
+
+    Uploads are processed from memory (see uploads.py). ``output`` picks how
+    processed images come back (one of OUTPUT_MODES): ``inline`` answers a
+    single image upload with the annotated image itself and its missing
+    items, as JSON, in the ``X-Missing-Items`` header.
+
+    With ``async=1`` (query string or form field) the uploads are saved to
+    UPLOAD_FOLDER and queued as a job and the response is 202 with a job ID
+    to poll at /jobs/<job_id>.
+
+    Uploads identical to one processed before with the same models and
+    settings are answered from the media cache (marked ``cached``) without
+    running the models.
+    """
     logger.info("Processing media request received")
     try:
         if 'files' not in request.files:
@@ -296,83 +859,76 @@ def process_media():
             logger.error("Empty files list")
             return jsonify({'error': 'No files selected'}), 400
 
+        output = request.values.get('output', 'file').lower()
+        if output not in OUTPUT_MODES:
+            return jsonify({'error': f"output must be one of {', '.join(OUTPUT_MODES)}"}), 400
+        run_async = request.values.get('async', '').lower() in ('1', 'true', 'yes')
+        if run_async and output != 'file':
+            return jsonify({'error': 'Queued jobs can only write their output to files'}), 400
+
+        if output == 'inline':
+            return process_inline_image(files)
+
         logger.info(f"Processing {len(files)} files")
-        results = []
-        
-        for file in files:
-            if file and allowed_file(file.filename):
-                try:
-                    # Generate unique filename
-                    filename = secure_filename(file.filename)
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    input_path = os.path.join(UPLOAD_FOLDER, unique_filename)
-                    
-                    logger.info(f"Processing file: {filename}")
-                    
-                    # Save uploaded file
-                    file.save(input_path)
-                    logger.info(f"Saved file to: {input_path}")
-                    
-                    if is_video_file(filename):
-                        logger.info(f"Processing video: {filename}")
-                        output_path, missing_items = process_video(input_path)
-                        if output_path:
-                            results.append({
-                                'original_filename': filename,
-                                'processed_filename': os.path.basename(output_path),
-                                'status': 'success',
-                                'type': 'video',
-                                'missing_items': missing_items
-                            })
-                            logger.info(f"Video processed successfully: {filename}")
-                        else:
-                            logger.error(f"Video processing failed: {filename}")
-                            results.append({
-                                'original_filename': filename,
-                                'error': missing_items,
-                                'status': 'error'
-                            })
-                    else:
-                        logger.info(f"Processing image: {filename}")
-                        processed_frame, missing = process_image(input_path)
-                        if processed_frame is not None:
-                            output_path = os.path.join(OUTPUT_FOLDER, unique_filename)
-                            cv2.imwrite(output_path, processed_frame)
-                            results.append({
-                                'original_filename': filename,
-                                'processed_filename': unique_filename,
-                                'missing_items': missing,
-                                'status': 'success',
-                                'type': 'image'
-                            })
-                            logger.info(f"Image processed successfully: {filename}")
+        results = [None] * len(files)
+        entries = []  # (slot, filename, unique_filename, source)
+        cache_keys = {}  # slot -> media cache key
+
+        with ExitStack() as spooled:
+            for slot, file in enumerate(files):
+                if file and allowed_file(file.filename):
+                    try:
+                        # Generate unique filename
+                        filename = secure_filename(file.filename)
+                        unique_filename = f"{uuid.uuid4()}_{filename}"
+
+                        logger.info(f"Processing file: {filename}")
+
+                        if media_cache.enabled:
+                            cache_keys[slot] = media_cache.key(upload_digest(file), filename)
+                            results[slot] = cached_result(cache_keys[slot], filename, output)
+                            if results[slot] is not None:
+                                continue
+
+                        if run_async:
+                            # The job outlives this request, so its inputs go to disk
+                            source = os.path.join(UPLOAD_FOLDER, unique_filename)
+                            file.save(source)
+                            logger.info(f"Saved file to: {source}")
+                        elif is_video_file(filename):
+                            source = spooled.enter_context(video_path(file))
                         else:
-                            logger.error(f"Image processing failed: {filename}")
-                            results.append({
-                                'original_filename': filename,
-                                'error': missing,
-                                'status': 'error'
-                            })
-                    
-                    # Clean up input file
-                    if os.path.exists(input_path):
-                        os.remove(input_path)
-                        logger.info(f"Cleaned up input file: {input_path}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing file {file.filename}: {str(e)}")
-                    results.append({
+                            source = read_upload(file)
+                        entries.append((slot, filename, unique_filename, source))
+                    except Exception as e:
+                        logger.error(f"Error processing file {file.filename}: {str(e)}")
+                        results[slot] = {
+                            'original_filename': file.filename,
+                            'error': str(e),
+                            'status': 'error'
+                        }
+                else:
+                    logger.error(f"Invalid file type: {file.filename}")
+                    results[slot] = {
                         'original_filename': file.filename,
-                        'error': str(e),
+                        'error': 'Invalid file type',
                         'status': 'error'
-                    })
-            else:
-                logger.error(f"Invalid file type: {file.filename}")
-                results.append({
-                    'original_filename': file.filename,
-                    'error': 'Invalid file type',
-                    'status': 'error'
-                })
+                    }
+
+            if run_async:
+                job_id = str(uuid.uuid4())
+                job_store.create(job_id, count_work_units(entries))
+                try:
+                    job_queue.submit(job_id, entries, results, cache_keys)
+                except JobQueueFull as e:
+                    logger.error(f"Rejecting job {job_id}: {str(e)}")
+                    job_store.update(job_id, status='failed', error='Job queue is full')
+                    remove_inputs(entries)
+                    return jsonify({'error': 'Too many jobs in progress, try again later'}), 503
+                logger.info(f"Queued job {job_id} with {len(entries)} files")
+                return jsonify({'job_id': job_id, 'status': 'queued', 'status_url': f"/jobs/{job_id}"}), 202
+
+            process_uploads(entries, results, output=output, cache_keys=cache_keys)
 
         logger.info("Processing completed")
         return jsonify({
@@ -382,40 +938,151 @@ def process_media():
         logger.error(f"Global error in process_media: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def process_inline_image(files):
+    """Answer /process-media?output=inline with the annotated image as the response body."""
+    if len(files) != 1 or not allowed_file(files[0].filename) or is_video_file(files[0].filename):
+        return jsonify({'error': 'output=inline takes exactly one image'}), 400
+    filename = secure_filename(files[0].filename)
+    if media_cache.enabled:
+        cached = cached_result(media_cache.key(upload_digest(files[0]), filename), filename)
+        if cached is not None:
+            with open(os.path.join(OUTPUT_FOLDER, cached['processed_filename']), 'rb') as f:
+                return inline_image(f.read(), image_format(filename)[1], filename, cached['missing_items'])
+    with stage_timer('decode'):
+        frame = decode_image(read_upload(files[0]))
+    if frame is None:
+        logger.error(f"Image processing failed: {filename}")
+        return jsonify({'error': 'Error loading image'}), 400
+    processed_frame, missing = process_images([frame])[0]
+    with stage_timer('encode'):
+        data, mimetype = encode_image(processed_frame, filename)
+    logger.info(f"Image processed successfully: {filename}")
+    return inline_image(data, mimetype, filename, missing)
+
+def inline_image(data, mimetype, filename, missing):
+    return Response(data, mimetype=mimetype, headers={
+        'X-Missing-Items': json.dumps(missing),
+        'Content-Disposition': f'inline; filename="processed_{filename}"'
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'total_frames': job['total_frames'],
+        'created': job['created'],
+        'updated': job['updated'],
+        'results': job['results'],
+        'error': job['error']
+    })
+
+@app.route('/streams', methods=['POST'])
+def start_stream():
+    """Start monitoring a cv2.VideoCapture source: {"source": url or device, "target_fps": 2, "loop": false}."""
+    body = request.get_json(silent=True) or {}
+    source = parse_source(body.get('source'))
+    if source is None or source == '':
+        return jsonify({'error': 'source is required'}), 400
+    if is_file_source(source) and not STREAM_ALLOW_FILES:
+        return jsonify({'error': f'Only device indexes and {", ".join(NETWORK_SCHEMES)} URLs are accepted; '
+                                 'set STREAM_ALLOW_FILES=1 to allow files'}), 400
+    try:
+        target_fps = float(body.get('target_fps', STREAM_ANALYSIS_FPS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'target_fps must be a number'}), 400
+
+    with streams_lock:
+        # Forget streams that have ended so they don't count against the limit
+        for stream_id in [i for i, m in streams.items() if not m.running]:
+            del streams[stream_id]
+        if len(streams) >= STREAM_MAX:
+            return jsonify({'error': f'At most {STREAM_MAX} streams can run at once'}), 503
+        stream_id = str(uuid.uuid4())
+        monitor = StreamMonitor(stream_id, source, make_stream_analyzer(), target_fps, loop=bool(body.get('loop')))
+        streams[stream_id] = monitor
+    monitor.start()
+    logger.info(f"Started stream {stream_id} from {source} at {target_fps} analysis fps")
+    return jsonify({
+        'stream_id': stream_id,
+        'events_url': f"/streams/{stream_id}/events",
+        'preview_url': f"/streams/{stream_id}/preview"
+    }), 201
+
+@app.route('/streams', methods=['GET'])
+def list_streams():
+    with streams_lock:
+        monitors = list(streams.values())
+    return jsonify({'streams': [monitor.stats() for monitor in monitors]})
+
+@app.route('/streams/<stream_id>', methods=['GET'])
+def stream_status(stream_id):
+    monitor = get_stream(stream_id)
+    if monitor is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return jsonify(monitor.stats())
+
+@app.route('/streams/<stream_id>', methods=['DELETE'])
+def stop_stream(stream_id):
+    with streams_lock:
+        monitor = streams.pop(stream_id, None)
+    if monitor is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    monitor.stop()
+    logger.info(f"Stopped stream {stream_id}")
+    return jsonify(monitor.stats())
+
+@app.route('/streams/<stream_id>/events', methods=['GET'])
+def stream_events(stream_id):
+    """Server-Sent Events: worker_entered, violation, resolved and worker_left."""
+    monitor = get_stream(stream_id)
+    if monitor is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return Response(monitor.events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/streams/<stream_id>/preview', methods=['GET'])
+def stream_preview(stream_id):
+    """Annotated frames as an MJPEG stream, viewable in an <img> tag."""
+    monitor = get_stream(stream_id)
+    if monitor is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    return Response(monitor.preview(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/get-processed-media/<filename>', methods=['GET'])
 def get_processed_media(filename):
+    """Serve a processed output; supports Range requests and conditional GETs by ETag."""
     try:
-        file_path = os.path.join(OUTPUT_FOLDER, filename)
-        if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
+        file_path = safe_join(OUTPUT_FOLDER, filename)
+        if file_path is None or not os.path.isfile(file_path):
+            logger.error(f"File not found: {filename}")
             return jsonify({'error': 'File not found'}), 404
-            
-        # Determine the correct mimetype
-        if filename.lower().endswith(('.jpg', '.jpeg')):
-            mimetype = 'image/jpeg'
-        elif filename.lower().endswith('.png'):
-            mimetype = 'image/png'
-        elif filename.lower().endswith('.mp4'):
-            mimetype = 'video/mp4'
-        elif filename.lower().endswith('.avi'):
-            mimetype = 'video/x-msvideo'
-        elif filename.lower().endswith('.mov'):
-            mimetype = 'video/quicktime'
-        else:
-            mimetype = 'application/octet-stream'
-            
-        logger.info(f"Sending file {filename} with mimetype {mimetype}")
+
+        record = output_store.get(filename) or output_store.add(filename)
+        output_store.touch(filename)
+        logger.info(f"Sending file {filename}")
+        # Outputs never change under their name, so clients may cache them and
+        # seek with Range requests; the mimetype is guessed from the extension
         return send_file(
-            file_path,
-            mimetype=mimetype,
+            os.path.abspath(file_path),
             as_attachment=False,  # Changed to False to allow inline playback
-            download_name=filename
+            download_name=filename,
+            conditional=True,
+            etag=record['etag'],
+            last_modified=record['created'],
+            max_age=OUTPUT_CACHE_MAX_AGE
         )
     except Exception as e:
         logger.error(f"Error sending file {filename}: {str(e)}")
         return jsonify({'error': str(e)}), 404
 
 if __name__ == '__main__':
+    warmup()
     logger.info("Starting server...")
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=True, host='0.0.0.0', port=port) 
\ No newline at end of file
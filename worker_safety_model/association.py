@@ -0,0 +1,84 @@
+"""Vectorized matching of PPE items to people.
+
+Boxes stay as float32 ``(n, 4)`` xyxy arrays taken straight from
+``result.boxes.xyxy``; every pairwise score is computed in one broadcast so
+crowded frames cost a handful of NumPy calls rather than a Python loop per
+item and person.
+"""
+import numpy as np
+
+
+class ClassFilter:
+    """Selects the boxes of a YOLO result whose class name is in ``wanted``.
+
+    Class ids are mapped to their position in ``wanted`` (or -1) through a
+    lookup table built once per model.
+    """
+
+    def __init__(self, names, wanted):
+        self.wanted = list(wanted)
+        self.lookup = np.full(max(names) + 1 if names else 0, -1, dtype=np.intp)
+        for class_id, name in names.items():
+            if name in self.wanted:
+                self.lookup[class_id] = self.wanted.index(name)
+
+    def select(self, result):
+        """Return (xyxy float32 (n, 4), index into ``wanted`` (n,)) of the matching boxes."""
+        if result is None or not len(result.boxes):
+            return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.intp)
+        classes = self.lookup[result.boxes.cls.cpu().numpy().astype(np.intp)]
+        keep = classes >= 0
+        return result.boxes.xyxy.cpu().numpy().astype(np.float32, copy=False)[keep], classes[keep]
+
+    def any(self, result):
+        return bool(len(result.boxes)) and bool((self.lookup[result.boxes.cls.cpu().numpy().astype(np.intp)] >= 0).any())
+
+
+def _intersection(a, b):
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+    h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+    return a, b, np.clip(w, 0, None) * np.clip(h, 0, None)
+
+
+def _area(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def iou_matrix(a, b):
+    """IoU of every box in ``a`` (n, 4) against every box in ``b`` (m, 4), as xyxy."""
+    a, b, inter = _intersection(a, b)
+    union = _area(a)[:, None] + _area(b)[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def containment_matrix(outer, inner):
+    """Fraction of each ``inner`` box (m) lying inside each ``outer`` box (n), shape (n, m)."""
+    outer, inner, inter = _intersection(outer, inner)
+    return inter / np.maximum(_area(inner), 1e-9)[None, :]
+
+
+def assign(persons, items, min_containment=0.5):
+    """Index of the person each item belongs to, or -1.
+
+    An item goes to the person box containing the largest fraction of it,
+    ties broken by IoU so an item is given to the tighter of two nested
+    boxes. Items less than ``min_containment`` inside every person are
+    left unassigned.
+    """
+    if not len(persons) or not len(items):
+        return np.full(len(items), -1, dtype=np.intp)
+    score = containment_matrix(persons, items) + 1e-3 * iou_matrix(persons, items)
+    best = score.argmax(axis=0)
+    best[score[best, np.arange(len(items))] < min_containment] = -1
+    return best
+
+
+def compliance(persons, items, item_classes, n_classes, min_containment=0.5):
+    """Boolean (persons, n_classes) matrix of which item classes each person wears."""
+    present = np.zeros((len(persons), n_classes), dtype=bool)
+    owner = assign(persons, items, min_containment)
+    worn = owner >= 0
+    present[owner[worn], np.asarray(item_classes)[worn]] = True
+    return present
@@ -0,0 +1,216 @@
+"""Exported CPU inference backends for the YOLO models.
+
+``torch``
+    The PyTorch weights as loaded by ultralytics (the original path).
+``onnx``
+    The model exported once to ONNX with dynamic batch and image size and
+    run by ONNX Runtime. With ``int8`` the weights are quantized to 8 bits
+    with ONNX Runtime's dynamic quantization (no calibration data needed).
+``openvino``
+    The model exported once to OpenVINO IR and run by OpenVINO.
+``auto``
+    OpenVINO if it is installed, else ONNX Runtime, else PyTorch. With
+    ``int8`` OpenVINO is skipped, since only the ONNX path quantizes.
+
+Exports are cached in EXPORT_DIR under a name that includes a digest of the
+weights, so new weights are exported again and existing artifacts are reused
+across restarts and by worker processes. Either way the result is callable
+like an ultralytics model, so Detector works with it unchanged.
+
+Usage:
+    python backends.py export [--backend onnx] [--int8]
+    python backends.py check [--backend onnx] [--int8] [--clips CLIP ...]
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from dedup import file_digest
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKENDS = ('torch', 'onnx', 'openvino', 'auto')
+
+
+def available_backends():
+    """The backends whose runtime is importable, best first."""
+    backends = []
+    if importlib.util.find_spec('openvino') is not None:
+        backends.append('openvino')
+    if importlib.util.find_spec('onnxruntime') is not None:
+        backends.append('onnx')
+    return backends + ['torch']
+
+
+def resolve_backend(backend, int8=False):
+    """The concrete backend for ``backend`` (resolving ``auto``); raises ValueError if it can't be used."""
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+    available = available_backends()
+    if backend == 'auto':
+        return next(b for b in available if not (int8 and b == 'openvino'))
+    if backend not in available:
+        raise ValueError(f"Inference backend {backend!r} is not installed (available: {', '.join(available)})")
+    if int8 and backend != 'onnx':
+        raise ValueError("int8 quantization is only supported by the onnx backend")
+    return backend
+
+
+def artifact_path(weights, backend, export_dir, imgsz=640, int8=False):
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    name = f"{stem}-{file_digest(weights)[:12]}-{imgsz}"
+    if backend == 'openvino':
+        # ultralytics recognizes OpenVINO models by this directory suffix
+        return os.path.join(export_dir, f"{name}_openvino_model")
+    return os.path.join(export_dir, f"{name}{'-int8' if int8 else ''}.onnx")
+
+
+def _quantize(source, target):
+    """Write an int8 dynamically quantized copy of the ONNX model ``source`` to ``target``."""
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    # Keep the class names and other ultralytics metadata of the original export
+    original, quantized = onnx.load(source), onnx.load(target)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(original.metadata_props)
+    onnx.save(quantized, target)
+
+
+def export(weights, backend, export_dir, imgsz=640, int8=False):
+    """Export ``weights`` for ``backend`` unless a cached artifact exists; returns its path."""
+    from ultralytics import YOLO
+
+    target = artifact_path(weights, backend, export_dir, imgsz, int8)
+    if os.path.exists(target):
+        return target
+    os.makedirs(export_dir, exist_ok=True)
+    logger.info(f"Exporting {weights} to {backend}{' int8' if int8 else ''}, this runs once")
+    # ultralytics writes next to the weights, so export a copy in a scratch directory
+    scratch = tempfile.mkdtemp(prefix='export_', dir=export_dir)
+    try:
+        copy = os.path.join(scratch, os.path.basename(weights))
+        shutil.copy(weights, copy)
+        exported = YOLO(copy).export(format='openvino' if backend == 'openvino' else 'onnx', imgsz=imgsz,
+                                     dynamic=True, verbose=False)
+        if int8:
+            quantized = os.path.join(scratch, 'int8.onnx')
+            _quantize(exported, quantized)
+            exported = quantized
+        # Another process may have exported the same weights meanwhile; either copy will do
+        try:
+            os.replace(exported, target)
+        except OSError:
+            if not os.path.exists(target):
+                raise
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    logger.info(f"Exported {weights} to {target}")
+    return target
+
+
+class ExportedModel:
+    """An exported YOLO model, called like the ultralytics model it came from.
+
+    ``names`` is taken from the PyTorch model, so class filters built on the
+    original and the exported model agree.
+    """
+
+    def __init__(self, path, names, backend):
+        from ultralytics import YOLO
+
+        self.path = path
+        self.backend = backend
+        self.names = dict(names)
+        self._model = YOLO(path, task='detect')
+
+    def __call__(self, source, **kwargs):
+        return self._model(source, **kwargs)
+
+
+def load_backend(model, weights, backend, export_dir, imgsz=640, int8=False):
+    """Return ``model`` itself for the torch backend, else an :class:`ExportedModel` of it."""
+    backend = resolve_backend(backend, int8)
+    if backend == 'torch':
+        return model
+    return ExportedModel(export(weights, backend, export_dir, imgsz, int8), model.names, backend)
+
+
+def _load_models(args, backend):
+    from ultralytics import YOLO
+
+    models = {}
+    for weights in args.weights:
+        model = YOLO(weights)
+        models[weights] = load_backend(model, weights, backend, args.export_dir, args.imgsz, args.int8)
+    return models
+
+
+def export_all(args):
+    for weights, model in _load_models(args, args.backend).items():
+        path = getattr(model, 'path', weights)
+        print(f"{weights} -> {path}")
+
+
+def check_parity(args):
+    """Compare the boxes of the exported models against PyTorch on sample frames."""
+    from association import iou_matrix
+    from benchmark import load_clip_frames, load_images
+
+    frames = load_clip_frames(args.clips, 5, args.frames) if args.clips else load_images(None, args.frames)
+    reference = _load_models(argparse.Namespace(**{**vars(args), 'int8': False}), 'torch')
+    exported = _load_models(args, args.backend)
+    failed = False
+    for weights in args.weights:
+        matched = total_reference = total_exported = 0
+        for frame in frames:
+            expected = reference[weights](frame, verbose=False, conf=args.conf)[0].boxes
+            actual = exported[weights](frame, verbose=False, conf=args.conf)[0].boxes
+            total_reference += len(expected)
+            total_exported += len(actual)
+            if not len(expected) or not len(actual):
+                continue
+            iou = iou_matrix(expected.xyxy.cpu().numpy(), actual.xyxy.cpu().numpy())
+            same_class = expected.cls.cpu().numpy()[:, None] == actual.cls.cpu().numpy()[None, :]
+            matched += int(((iou >= args.iou) & same_class).any(axis=1).sum())
+        recall = matched / total_reference if total_reference else 1.0
+        ok = recall >= args.min_recall and abs(total_exported - total_reference) <= max(1, 0.05 * total_reference)
+        failed |= not ok
+        print(f"{weights:20s} {len(frames)} frames  {total_reference} torch boxes  {total_exported} exported boxes  "
+              f"matched {recall:.1%} at IoU {args.iou}  {'ok' if ok else 'FAIL'}")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, func, help_text in (
+        ('export', export_all, 'export and cache both models for a backend'),
+        ('check', check_parity, 'box parity of the exported models against PyTorch'),
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--backend', default='onnx', choices=INFERENCE_BACKENDS)
+        command.add_argument('--int8', action='store_true', help='int8 dynamic quantization (onnx only)')
+        command.add_argument('--export-dir', default=os.environ.get('EXPORT_DIR', 'exported'))
+        command.add_argument('--imgsz', type=int, default=640)
+        command.add_argument('--weights', nargs='+', default=['yolov8s_custom.pt', 'yolov8n.pt'])
+        command.set_defaults(func=func)
+    check = commands.choices['check']
+    check.add_argument('--clips', nargs='+', help='video files (default: the ultralytics sample images)')
+    check.add_argument('--frames', type=int, default=32)
+    check.add_argument('--conf', type=float, default=0.25)
+    check.add_argument('--iou', type=float, default=0.9, help='IoU for a box to count as reproduced')
+    check.add_argument('--min-recall', type=float, default=0.95)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
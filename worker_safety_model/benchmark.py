@@ -0,0 +1,438 @@
+"""Offline benchmarks for the worker safety service.
+
+Run from this directory so the YOLO weights resolve the same way as in app.py.
+
+Usage:
+    python benchmark.py images [--images 32] [--batch-sizes 1 4 8 16] [--source DIR]
+    python benchmark.py modes [--clips CLIP ...] [--sample-every 5] [--frames 64]
+    python benchmark.py video-scaling CLIP [--workers 1 2 4 8] [--min-chunk-frames 250]
+    python benchmark.py backends [--backends torch onnx openvino] [--int8] [--clips CLIP ...]
+    python benchmark.py sampling CLIP [CLIP ...] [--thresholds 0.01 0.02 0.04] [--min-interval 0.1] [--max-interval 1.0]
+    python benchmark.py http [--concurrency 1 2 4] [--requests 100] [--clip-requests 10] [--url URL] [--output FILE]
+"""
+import argparse
+import glob
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from contextlib import ExitStack
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_images(source, count):
+    """Return ``count`` decoded images cycled from ``source`` (or the ultralytics sample images)."""
+    if source:
+        paths = sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(source, ext)))
+    else:
+        from ultralytics.utils import ASSETS
+        paths = sorted(str(p) for ext in IMAGE_EXTENSIONS for p in ASSETS.glob(ext))
+    images = [image for image in (cv2.imread(p) for p in paths) if image is not None]
+    if not images:
+        raise SystemExit(f"No images found in {source or 'ultralytics assets'}")
+    return [images[i % len(images)] for i in range(count)]
+
+
+def load_clip_frames(clips, sample_every, count):
+    """Return every ``sample_every``-th frame of each clip, up to ``count`` per clip."""
+    frames = []
+    for clip in clips:
+        cap = cv2.VideoCapture(clip)
+        index, taken = 0, 0
+        while taken < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if index % sample_every == 0:
+                frames.append(frame)
+                taken += 1
+            index += 1
+        cap.release()
+    if not frames:
+        raise SystemExit(f"No frames read from {clips}")
+    return frames
+
+
+def summarize(detections):
+    """Per frame: None without a person, else the missing items over all people."""
+    from app import associate, missing_items
+
+    return [tuple(missing_items(a['present'])) if a is not None else None for a in associate(detections)]
+
+
+def bench_modes(args):
+    from app import human_model, ppe_model, safety_items
+    from detection import DETECTION_MODES, Detector
+
+    frames = load_clip_frames(args.clips, args.sample_every, args.frames) if args.clips else load_images(None, args.frames)
+    print(f"{len(frames)} frames, CPU, batch size {args.batch_size}; agreement is against 'sequential'")
+    print(f"{'mode':>12s} {'frames/s':>10s} {'person':>8s} {'missing':>8s}")
+    reference = None
+    for mode in DETECTION_MODES:
+        detector = Detector(human_model, ppe_model, mode, args.batch_size, item_classes=safety_items)
+        detector.detect(frames[:args.batch_size])
+        start = time.perf_counter()
+        detections = detector.detect(frames)
+        elapsed = time.perf_counter() - start
+        summary = summarize(detections)
+        if reference is None:
+            reference = summary
+        person = sum((a is None) == (b is None) for a, b in zip(summary, reference)) / len(frames)
+        missing = sum(a == b for a, b in zip(summary, reference)) / len(frames)
+        print(f"{mode:>12s} {len(frames) / elapsed:10.2f} {person:8.1%} {missing:8.1%}")
+
+
+def bench_backends(args):
+    from ultralytics import YOLO
+
+    from app import DETECTION_MODE, EXPORT_DIR, HUMAN_WEIGHTS, PPE_WEIGHTS, safety_items
+    from backends import available_backends, load_backend
+    from detection import Detector
+
+    frames = load_clip_frames(args.clips, args.sample_every, args.frames) if args.clips else load_images(None, args.frames)
+    backends = args.backends or available_backends()[::-1]
+    variants = [(backend, False) for backend in backends] + ([('onnx', True)] if args.int8 else [])
+    print(f"{len(frames)} frames, CPU, {DETECTION_MODE} mode, batch size {args.batch_size}; agreement is against 'torch'")
+    print(f"{'backend':>10s} {'frames/s':>10s} {'ms/frame':>10s} {'person':>8s} {'missing':>8s}")
+    torch_human, torch_ppe = YOLO(HUMAN_WEIGHTS), YOLO(PPE_WEIGHTS)
+    reference = summarize(Detector(torch_human, torch_ppe, DETECTION_MODE, args.batch_size, item_classes=safety_items).detect(frames))
+    for backend, int8 in variants:
+        human = load_backend(torch_human, HUMAN_WEIGHTS, backend, EXPORT_DIR, int8=int8)
+        ppe = load_backend(torch_ppe, PPE_WEIGHTS, backend, EXPORT_DIR, int8=int8)
+        detector = Detector(human, ppe, DETECTION_MODE, args.batch_size, item_classes=safety_items)
+        detector.detect(frames[:args.batch_size])
+        start = time.perf_counter()
+        detections = detector.detect(frames)
+        elapsed = time.perf_counter() - start
+        summary = summarize(detections)
+        person = sum((a is None) == (b is None) for a, b in zip(summary, reference)) / len(frames)
+        missing = sum(a == b for a, b in zip(summary, reference)) / len(frames)
+        name = f"{backend}{'-int8' if int8 else ''}"
+        print(f"{name:>10s} {len(frames) / elapsed:10.2f} {elapsed / len(frames) * 1e3:10.1f} {person:8.1%} {missing:8.1%}")
+
+
+def bench_video_scaling(args):
+    import app
+    from video_chunks import ChunkPool
+
+    app.VIDEO_MIN_CHUNK_FRAMES = args.min_chunk_frames
+    cap = cv2.VideoCapture(args.clip)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    print(f"{args.clip}: {total_frames} frames, {os.cpu_count()} CPUs; 1 worker is the sequential path at the fixed stride")
+    print(f"{'workers':>7s} {'ranges':>6s} {'seconds':>9s} {'frames/s':>9s} {'speedup':>8s} {'same missing':>12s}")
+    baseline = None
+    for workers in args.workers:
+        app.chunk_pool = ChunkPool(workers, app.init_worker_process, (max(1, (os.cpu_count() or 1) // workers),))
+        ranges = len(app.plan_chunks(total_frames, workers, app.VIDEO_SAMPLE_EVERY, args.min_chunk_frames))
+        # The first call starts the pool and loads the models in every worker
+        app.process_video(args.clip, workers=workers, adaptive=False)
+        start = time.perf_counter()
+        output_path, missing, _ = app.process_video(args.clip, workers=workers, adaptive=False)
+        elapsed = time.perf_counter() - start
+        app.chunk_pool.shutdown()
+        if output_path is None:
+            raise SystemExit(f"Processing failed with {workers} workers: {missing}")
+        if baseline is None:
+            baseline = (elapsed, missing)
+        print(f"{workers:7d} {ranges:6d} {elapsed:9.2f} {total_frames / elapsed:9.1f} "
+              f"{baseline[0] / elapsed:7.2f}x {str(missing == baseline[1]):>12s}")
+
+
+def bench_images(args):
+    from app import process_images
+
+    images = load_images(args.source, args.images)
+    print(f"{len(images)} images, CPU, both YOLO models per image")
+    print(f"{'batch':>5s} {'images/s':>10s} {'ms/image':>10s}")
+    for batch_size in args.batch_sizes:
+        # Warm up with one batch; frames are copied because annotation draws in place
+        process_images([image.copy() for image in images[:batch_size]], batch_size)
+        frames = [image.copy() for image in images]
+        start = time.perf_counter()
+        process_images(frames, batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"{batch_size:5d} {len(images) / elapsed:10.2f} {elapsed / len(images) * 1e3:10.1f}")
+
+
+def violation_events(labels):
+    """(start, end) frame ranges over which some person is missing an item."""
+    events, start = [], None
+    for i, label in enumerate(labels + [None]):
+        if label and start is None:
+            start = i
+        elif not label and start is not None:
+            events.append((start, i))
+            start = None
+    return events
+
+
+def score_sampling(dense, selected):
+    """Compare what a policy reports on every frame with detection on every frame.
+
+    Between detections the output shows the result of the last analyzed
+    frame, so that result stands for every frame up to the next one.
+    """
+    held, current, picks = [], None, iter(selected + [None])
+    pick = next(picks)
+    for i, label in enumerate(dense):
+        if i == pick:
+            current, pick = label, next(picks)
+        held.append(current)
+    violations = [i for i, label in enumerate(dense) if label]
+    people = [i for i, label in enumerate(dense) if label is not None]
+    events = violation_events(dense)
+    chosen = set(selected)
+    return {
+        'inferences': len(selected),
+        'violation_recall': sum(bool(held[i]) for i in violations) / len(violations) if violations else None,
+        'person_recall': sum(held[i] is not None for i in people) / len(people) if people else None,
+        'event_recall': sum(any(dense[i] and i in chosen for i in range(a, b)) for a, b in events) / len(events)
+        if events else None,
+        'agreement': sum(h == d for h, d in zip(held, dense)) / len(dense) if dense else None,
+    }
+
+
+def bench_sampling(args):
+    """Inferences saved and recall lost by the scene-change policy against the fixed stride."""
+    from app import DETECTION_MODE, VIDEO_SAMPLE_EVERY, human_model, ppe_model, safety_items
+    from detection import Detector
+    from sampling import FixedStride, SceneChange
+
+    detector = Detector(human_model, ppe_model, DETECTION_MODE, args.batch_size, item_classes=safety_items)
+    print(f"Reference: detection on every frame (up to {args.max_frames} per clip); recall of frames and of "
+          f"violation events against it, fixed stride is every {VIDEO_SAMPLE_EVERY} frames")
+    print(f"{'clip':>20s} {'policy':>12s} {'inferences':>10s} {'saved':>7s} {'violations':>10s} {'events':>7s} "
+          f"{'people':>7s} {'agree':>7s} {'us/frame':>9s}")
+    totals = {}
+    for clip in args.clips:
+        cap = cv2.VideoCapture(clip)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        policies = [('stride', FixedStride(VIDEO_SAMPLE_EVERY))] + [
+            (f'scene {threshold:g}', SceneChange(fps, args.min_interval, args.max_interval, threshold))
+            for threshold in args.thresholds
+        ]
+        selected = {name: [] for name, _ in policies}
+        select_seconds = dict.fromkeys(selected, 0.0)
+        dense, batch, index = [], [], 0
+        while index < args.max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            for name, policy in policies:
+                start = time.perf_counter()
+                if policy(index, frame):
+                    selected[name].append(index)
+                select_seconds[name] += time.perf_counter() - start
+            batch.append(frame)
+            if len(batch) == args.batch_size:
+                dense += summarize(detector.detect(batch))
+                batch = []
+            index += 1
+        cap.release()
+        if batch:
+            dense += summarize(detector.detect(batch))
+        if not dense:
+            raise SystemExit(f"No frames read from {clip}")
+
+        stride_inferences = len(selected['stride'])
+        for name, _ in policies:
+            result = score_sampling(dense, selected[name])
+            total = totals.setdefault(name, {'inferences': 0, 'frames': 0, 'results': []})
+            total['inferences'] += result['inferences']
+            total['frames'] += len(dense)
+            total['results'].append(result)
+            saved = 1 - result['inferences'] / stride_inferences if stride_inferences else 0.0
+            print(f"{os.path.basename(clip)[-20:]:>20s} {name:>12s} {result['inferences']:10d} {saved:7.1%} "
+                  f"{_percent(result['violation_recall']):>10s} {_percent(result['event_recall']):>7s} "
+                  f"{_percent(result['person_recall']):>7s} {_percent(result['agreement']):>7s} "
+                  f"{select_seconds[name] / len(dense) * 1e6:9.1f}")
+
+    if len(args.clips) > 1:
+        stride_total = totals['stride']['inferences']
+        for name, total in totals.items():
+            def mean(key):
+                values = [r[key] for r in total['results'] if r[key] is not None]
+                return sum(values) / len(values) if values else None
+            saved = 1 - total['inferences'] / stride_total if stride_total else 0.0
+            print(f"{'all clips (mean)':>20s} {name:>12s} {total['inferences']:10d} {saved:7.1%} "
+                  f"{_percent(mean('violation_recall')):>10s} {_percent(mean('event_recall')):>7s} "
+                  f"{_percent(mean('person_recall')):>7s} {_percent(mean('agreement')):>7s}")
+
+
+def _percent(value):
+    return f"{value:.1%}" if value is not None else 'n/a'
+
+
+def synthetic_corpus(directory, images, clips, seed=0, size=(640, 480), clip_seconds=3, fps=10):
+    """Write (once) ``images`` JPEGs and ``clips`` MP4s of random moving shapes; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    width, height = size
+
+    def scene(shapes, t=0.0):
+        frame = np.empty((height, width, 3), np.uint8)
+        frame[:] = np.linspace(40, 200, width, dtype=np.uint8)[None, :, None]
+        for (x, y, w, h, dx, dy), color in shapes:
+            x0, y0 = int(x + dx * t) % width, int(y + dy * t) % height
+            cv2.rectangle(frame, (x0, y0), (x0 + w, y0 + h), color, -1)
+        return frame
+
+    def random_shapes():
+        return [((rng.integers(0, width), rng.integers(0, height), rng.integers(20, 160), rng.integers(40, 240),
+                  rng.integers(-60, 60), rng.integers(-30, 30)), tuple(int(c) for c in rng.integers(0, 255, 3)))
+                for _ in range(rng.integers(3, 12))]
+
+    image_paths = [os.path.join(directory, f'image_{i:03d}.jpg') for i in range(images)]
+    clip_paths = [os.path.join(directory, f'clip_{i:03d}.mp4') for i in range(clips)]
+    for path in image_paths:
+        shapes = random_shapes()
+        if not os.path.exists(path):
+            cv2.imwrite(path, scene(shapes))
+    for path in clip_paths:
+        shapes = random_shapes()
+        if not os.path.exists(path):
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+            for i in range(clip_seconds * fps):
+                writer.write(scene(shapes, i / fps))
+            writer.release()
+    return image_paths, clip_paths
+
+
+def bench_http(args):
+    """Drive /process-media of a running service with a synthetic corpus of images and clips."""
+    from common.loadtest import (LocalServer, MemorySampler, environment, get_json, metrics_rss_bytes,
+                                 multipart_request, print_result, run_load, write_results)
+
+    image_paths, clip_paths = synthetic_corpus(args.corpus, args.images, args.clips, args.seed)
+
+    def uploads(paths, mimetype, fields=()):
+        requests = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                upload = ('files', os.path.basename(path), f.read(), mimetype)
+            requests.append(multipart_request('/process-media', fields, [upload]))
+        return itertools.cycle(requests)
+
+    workloads = [
+        ('process-media image', uploads(image_paths, 'image/jpeg'), args.requests),
+        ('process-media image inline', uploads(image_paths, 'image/jpeg', [('output', 'inline')]), args.requests),
+        ('process-media clip', uploads(clip_paths, 'video/mp4'), args.clip_requests),
+    ]
+
+    with ExitStack() as stack:
+        if args.url:
+            base_url, startup_seconds, server_env = args.url.rstrip('/'), None, {}
+            memory = MemorySampler(lambda: metrics_rss_bytes(base_url))
+        else:
+            # Outputs and indexes go to a scratch directory, and the corpus
+            # repeats, so the media cache is off unless asked for
+            scratch = tempfile.mkdtemp(prefix='loadtest_')
+            stack.callback(shutil.rmtree, scratch, ignore_errors=True)
+            server_env = {
+                'UPLOAD_FOLDER': os.path.join(scratch, 'uploads'),
+                'OUTPUT_FOLDER': os.path.join(scratch, 'outputs'),
+                'JOBS_DB': os.path.join(scratch, 'jobs.db'),
+                'OUTPUT_DB': os.path.join(scratch, 'outputs.db'),
+                'MEDIA_CACHE_SIZE': '0',
+                **dict(item.split('=', 1) for item in args.env),
+            }
+            server = stack.enter_context(LocalServer(os.path.dirname(os.path.abspath(__file__)), '/health',
+                                                     server_env, args.server_log))
+            base_url, startup_seconds = server.url, server.startup_seconds
+            memory = MemorySampler(server.rss_bytes)
+        stack.callback(memory.stop)
+        idle_rss = memory.start().peak
+
+        results = []
+        for name, requests, count in workloads:
+            for concurrency in args.concurrency:
+                result = run_load(base_url, requests, concurrency, count, args.warmup, timeout=args.timeout,
+                                  memory=memory)
+                results.append({'workload': name, **result})
+                print_result(name, result)
+        health = get_json(base_url + '/health')
+
+    write_results(args.output, {
+        'service': 'worker_safety',
+        'environment': environment(os.path.dirname(os.path.abspath(__file__)), server_env),
+        'server_url': args.url,
+        'corpus': {'images': len(image_paths), 'clips': len(clip_paths), 'seed': args.seed},
+        'startup_seconds': round(startup_seconds, 3) if startup_seconds else None,
+        'idle_rss_bytes': int(idle_rss),
+        'server_health': health,
+        'results': results,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    images = commands.add_parser('images', help='images/second of process_images at several batch sizes')
+    images.add_argument('--images', type=int, default=32)
+    images.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    images.add_argument('--source', help='directory of sample images')
+    images.set_defaults(func=bench_images)
+
+    modes = commands.add_parser('modes', help='frames/second and agreement of each DETECTION_MODE')
+    modes.add_argument('--clips', nargs='+', help='video files (default: the ultralytics sample images)')
+    modes.add_argument('--sample-every', type=int, default=5)
+    modes.add_argument('--frames', type=int, default=64, help='frames per clip')
+    modes.add_argument('--batch-size', type=int, default=8)
+    modes.set_defaults(func=bench_modes)
+
+    scaling = commands.add_parser('video-scaling', help='process_video wall time with 1..N range workers')
+    scaling.add_argument('clip')
+    scaling.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    scaling.add_argument('--min-chunk-frames', type=int, default=250)
+    scaling.set_defaults(func=bench_video_scaling)
+
+    backends = commands.add_parser('backends', help='frames/second and agreement of each inference backend')
+    backends.add_argument('--backends', nargs='+', choices=['torch', 'onnx', 'openvino'],
+                          help='default: every installed backend')
+    backends.add_argument('--int8', action='store_true', help='also run the int8 ONNX model')
+    backends.add_argument('--clips', nargs='+', help='video files (default: the ultralytics sample images)')
+    backends.add_argument('--sample-every', type=int, default=5)
+    backends.add_argument('--frames', type=int, default=64, help='frames per clip')
+    backends.add_argument('--batch-size', type=int, default=8)
+    backends.set_defaults(func=bench_backends)
+
+    sampling = commands.add_parser('sampling', help='inferences saved and recall of scene-change sampling vs the stride')
+    sampling.add_argument('clips', nargs='+')
+    sampling.add_argument('--thresholds', type=float, nargs='+', default=[0.01, 0.02, 0.04],
+                          help='VIDEO_SCENE_THRESHOLD values to compare')
+    sampling.add_argument('--min-interval', type=float, default=0.1, help='seconds')
+    sampling.add_argument('--max-interval', type=float, default=1.0, help='seconds')
+    sampling.add_argument('--max-frames', type=int, default=900, help='frames read per clip')
+    sampling.add_argument('--batch-size', type=int, default=8)
+    sampling.set_defaults(func=bench_sampling)
+
+    http = commands.add_parser('http', help='load test /process-media with synthetic images and clips')
+    http.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    http.add_argument('--requests', type=int, default=100, help='measured image requests per workload and concurrency')
+    http.add_argument('--clip-requests', type=int, default=10, help='measured clip requests per concurrency')
+    http.add_argument('--warmup', type=int, default=2)
+    http.add_argument('--images', type=int, default=32, help='synthetic images in the corpus')
+    http.add_argument('--clips', type=int, default=4, help='synthetic 3 second clips in the corpus')
+    http.add_argument('--seed', type=int, default=0)
+    http.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'safety_loadtest_corpus'))
+    http.add_argument('--timeout', type=float, default=300)
+    http.add_argument('--url', help='an already running service (default: start app.py on a free port)')
+    http.add_argument('--env', nargs='*', default=[], metavar='KEY=VALUE',
+                      help='environment for the started server, e.g. DETECTION_MODE=shared')
+    http.add_argument('--server-log', default=os.devnull)
+    http.add_argument('--output', default='loadtest_safety.json')
+    http.set_defaults(func=bench_http)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Reusing earlier results for media that was already processed.
+
+Results are keyed on the SHA-256 of the uploaded bytes, the output format
+(file extension) and a fingerprint of everything else that decides the
+output: the model weights and the detection settings. Changing either
+invalidates every entry. The table lives next to the output index
+(storage.py), points at the stored output, and loses an entry when that
+output is evicted; beyond ``max_entries`` the least recently used entries
+are dropped.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_fingerprint(weight_paths, params):
+    """Digest of the model weight files and a JSON-serializable dict of detection parameters."""
+    digest = hashlib.sha256()
+    for path in weight_paths:
+        digest.update(file_digest(path).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class MediaCache:
+    """Upload digest -> (output name, result dict) in a SQLite table; ``max_entries`` of 0 disables it."""
+
+    def __init__(self, path, fingerprint, max_entries=1000):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS media_cache ('
+                'key TEXT PRIMARY KEY, output TEXT NOT NULL, result TEXT NOT NULL, '
+                'created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS media_cache_output ON media_cache (output)')
+            db.execute('CREATE INDEX IF NOT EXISTS media_cache_accessed ON media_cache (accessed)')
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def key(self, content_digest, filename):
+        extension = os.path.splitext(filename)[1].lower()
+        return hashlib.sha256(f"{content_digest}:{extension}:{self.fingerprint}".encode()).hexdigest()
+
+    def get(self, key, exists=None):
+        """Return (output name, result) for ``key``, or None.
+
+        An entry whose output fails ``exists(name)`` is dropped and counts as
+        a miss.
+        """
+        if not self.enabled:
+            return None
+        with self._connect() as db:
+            row = db.execute('SELECT output, result FROM media_cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and exists is not None and not exists(row[0]):
+                db.execute('DELETE FROM media_cache WHERE key = ?', (key,))
+                row = None
+            if row is not None:
+                db.execute('UPDATE media_cache SET accessed = ? WHERE key = ?', (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, key, output, result):
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO media_cache (key, output, result, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, output, json.dumps(result), now, now)
+            )
+            db.execute(
+                'DELETE FROM media_cache WHERE key IN '
+                '(SELECT key FROM media_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def forget(self, outputs):
+        """Drop the entries pointing at ``outputs``; registered as an OutputStore eviction hook."""
+        if not outputs:
+            return
+        with self._connect() as db:
+            db.executemany('DELETE FROM media_cache WHERE output = ?', [(name,) for name in outputs])
+
+    def stats(self):
+        with self._connect() as db:
+            entries = db.execute('SELECT COUNT(*) FROM media_cache').fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
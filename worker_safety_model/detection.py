@@ -0,0 +1,117 @@
+"""Ways of running the person and PPE models over a batch of frames.
+
+``sequential``
+    The original path: the person model runs on every frame and the PPE
+    model only on frames where a person was found. Each model letterboxes
+    and normalizes the frames itself.
+``shared``
+    Frames are letterboxed and normalized once into a single tensor that
+    both models run on concurrently.
+``ppe_gated``
+    The PPE model runs on every frame and the person model only on frames
+    with at least one safety item. Frames without any gear are reported as
+    having no person, so a worker wearing nothing is missed; use the
+    ``modes`` benchmark to check the agreement on your footage.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from ultralytics.data.augment import LetterBox
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
+
+from association import ClassFilter
+from common.metrics import stage_timer
+
+DETECTION_MODES = ('sequential', 'shared', 'ppe_gated')
+
+
+class Detector:
+    """Runs ``human_model`` and ``ppe_model`` over frames according to ``mode``.
+
+    :meth:`detect` returns one ``(person result, PPE result)`` pair per frame
+    with boxes in frame coordinates. A result is None where the mode skipped
+    that model for the frame.
+
+    An ultralytics model keeps per-call state in its predictor, so calls into
+    each model are serialized; requests and live streams can share a detector.
+    """
+
+    def __init__(self, human_model, ppe_model, mode='sequential', batch_size=8, imgsz=640,
+                 person_class='person', item_classes=()):
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode {mode!r}, expected one of {DETECTION_MODES}")
+        self.human_model = human_model
+        self.ppe_model = ppe_model
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.imgsz = imgsz
+        self._person_filter = ClassFilter(human_model.names, [person_class])
+        self._item_filter = ClassFilter(ppe_model.names, item_classes)
+        self._stage_names = {id(human_model): 'human', id(ppe_model): 'ppe'}
+        self.after_fork()
+
+    def after_fork(self):
+        """Replace the thread pool and locks, whose threads don't exist in a child forked from this process."""
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='detect') if self.mode == 'shared' else None
+        self._locks = {id(self.human_model): threading.Lock(), id(self.ppe_model): threading.Lock()}
+
+    def _predict(self, model, source):
+        with self._locks[id(model)], stage_timer('inference', self._stage_names[id(model)]):
+            return model(source, verbose=False)
+
+    def _run(self, model, frames, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        results = []
+        for start in range(0, len(frames), batch_size):
+            results.extend(self._predict(model, frames[start:start + batch_size]))
+        return results
+
+    def _gated(self, first, second, frames, keep, batch_size):
+        """Run ``first`` on all frames and ``second`` only where ``keep(result)`` holds."""
+        first_results = self._run(first, frames, batch_size)
+        selected = [i for i, result in enumerate(first_results) if keep(result)]
+        second_results = dict(zip(selected, self._run(second, [frames[i] for i in selected], batch_size)))
+        return first_results, [second_results.get(i) for i in range(len(frames))]
+
+    def _tensor(self, frames):
+        """Letterbox, BGR->RGB and scale a list of frames into one BCHW float tensor."""
+        # Like the ultralytics predictor, only pad to the stride when every frame has the same shape
+        letterbox = LetterBox((self.imgsz, self.imgsz), auto=len({frame.shape for frame in frames}) == 1, stride=32)
+        batch = np.stack([letterbox(image=frame) for frame in frames])
+        batch = batch[..., ::-1].transpose(0, 3, 1, 2)
+        return torch.from_numpy(np.ascontiguousarray(batch)).float().div_(255)
+
+    def _rescale(self, results, frames, shape):
+        """Map boxes predicted on a tensor of ``shape`` (h, w) back onto the original frames."""
+        rescaled = []
+        for result, frame in zip(results, frames):
+            boxes = result.boxes.data.clone()
+            boxes[:, :4] = ops.scale_boxes(shape, boxes[:, :4], frame.shape)
+            rescaled.append(Results(frame, path=result.path, names=result.names, boxes=boxes))
+        return rescaled
+
+    def _shared(self, frames, batch_size):
+        batch_size = batch_size or self.batch_size
+        humans, ppe = [], []
+        for start in range(0, len(frames), batch_size):
+            chunk = frames[start:start + batch_size]
+            tensor = self._tensor(chunk)
+            human_future = self._pool.submit(self._predict, self.human_model, tensor)
+            ppe_results = self._predict(self.ppe_model, tensor)
+            humans.extend(self._rescale(human_future.result(), chunk, tensor.shape[2:]))
+            ppe.extend(self._rescale(ppe_results, chunk, tensor.shape[2:]))
+        return humans, ppe
+
+    def detect(self, frames, batch_size=None):
+        if not frames:
+            return []
+        if self.mode == 'shared':
+            humans, ppe = self._shared(frames, batch_size)
+        elif self.mode == 'ppe_gated':
+            ppe, humans = self._gated(self.ppe_model, self.human_model, frames, self._item_filter.any, batch_size)
+        else:
+            humans, ppe = self._gated(self.human_model, self.ppe_model, frames, self._person_filter.any, batch_size)
+        return list(zip(humans, ppe))
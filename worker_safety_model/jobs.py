@@ -0,0 +1,179 @@
+"""Background processing of /process-media uploads.
+
+Jobs are recorded in a local SQLite database so their status survives the
+request that created them and can be read from any web worker. The work
+itself runs on a bounded process pool, so inference in one job neither holds
+a web thread nor competes for the GIL with the others.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'finished', 'failed')
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """Job rows in a SQLite file; every call opens its own connection so it is safe across threads and processes."""
+
+    _COLUMNS = ('id', 'status', 'progress', 'total_frames', 'created', 'updated', 'owner_pid', 'results', 'error')
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, '
+                'total_frames INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, updated REAL NOT NULL, '
+                'owner_pid INTEGER, results TEXT, error TEXT)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, job_id, total_frames):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                'INSERT INTO jobs (id, status, total_frames, created, updated, owner_pid) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, 'queued', total_frames, now, now, os.getpid())
+            )
+
+    def update(self, job_id, **fields):
+        if 'results' in fields:
+            fields['results'] = json.dumps(fields['results'])
+        fields['updated'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as db:
+            db.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as db:
+            row = db.execute(f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        job['results'] = json.loads(job['results']) if job['results'] else None
+        return job
+
+    def counts(self):
+        with self._connect() as db:
+            return dict(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def fail_orphans(self):
+        """Mark unfinished jobs whose owning process is gone as failed."""
+        with self._connect() as db:
+            rows = db.execute("SELECT id, owner_pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        for job_id, pid in rows:
+            if pid and _pid_alive(pid):
+                continue
+            self.update(job_id, status='failed', error='Interrupted by a server restart')
+            logger.warning(f"Job {job_id} was interrupted by a restart")
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobProgress:
+    """Turns work units (frames, or one per image) into a throttled percentage on the job row."""
+
+    def __init__(self, store, job_id, total, interval=0.5):
+        self.store = store
+        self.job_id = job_id
+        self.total = max(total, 1)
+        self.interval = interval
+        self.done = 0
+        self._next_write = 0.0
+
+    def advance(self, units=1):
+        self.done += units
+        now = time.monotonic()
+        if now >= self._next_write:
+            self._next_write = now + self.interval
+            # Frame counts from the container are estimates, so stop short of 100 until the job is finished
+            self.store.update(self.job_id, progress=round(min(99.9, 100.0 * self.done / self.total), 1))
+
+
+class JobQueue:
+    """Runs ``worker(job_id, *args)`` on a process pool of ``max_workers``.
+
+    At most ``max_pending`` jobs may be queued or running; :meth:`submit`
+    raises :class:`JobQueueFull` beyond that. Worker processes are spawned
+    rather than forked, so torch's thread pools are never copied mid-use; the
+    pool starts on the first submission. ``on_result``, if given, is called
+    in this process with whatever the worker returned.
+    """
+
+    def __init__(self, store, worker, max_workers=2, max_pending=16, initializer=None, initargs=(), on_result=None):
+        self.store = store
+        self.worker = worker
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.initializer = initializer
+        self.initargs = initargs
+        self.on_result = on_result
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            self.store.fail_orphans()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=self.initializer,
+                initargs=self.initargs
+            )
+        return self._executor
+
+    def submit(self, job_id, *args):
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                raise JobQueueFull(f"{len(self._pending)} jobs already queued or running")
+            try:
+                future = self._pool().submit(self.worker, job_id, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._executor = None
+                future = self._pool().submit(self.worker, job_id, *args)
+            self._pending.add(job_id)
+        future.add_done_callback(lambda f: self._done(job_id, f))
+
+    def _done(self, job_id, future):
+        with self._lock:
+            self._pending.discard(job_id)
+        # The worker records its own outcome; this only catches crashed or broken workers
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Job {job_id} worker failed: {error}")
+            self.store.update(job_id, status='failed', error=str(error))
+        elif self.on_result is not None:
+            self.on_result(future.result())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': len(self._pending),
+            }
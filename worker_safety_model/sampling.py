@@ -0,0 +1,156 @@
+"""Policies deciding which video frames go through detection.
+
+Every policy is called as ``select(index, frame)`` for each frame in order
+and returns True for the frames to analyze; the tracker carries the boxes
+and the last message over the frames in between. :meth:`stats` reports how
+many frames were selected and why. Selected frames are detected in batches,
+so a policy that reads analysis results reports through :meth:`waiting`
+when its next choice needs the frames still pending.
+
+``stride``
+    Every ``every``-th frame by absolute index, whatever the clip.
+``motion``
+    The stride backs off from ``every`` to ``max_every`` frames while every
+    tracked worker moves less than ``threshold`` box heights per frame.
+    Backing off waits for the last selected frame to be tracked, so a
+    worker who has just started moving is not skipped for ``max_every``.
+``scene``
+    A cheap change score: the mean absolute difference between the frame
+    and the last analyzed one, both downscaled to grayscale thumbnails, as
+    a fraction of full scale. A frame is analyzed once the score reaches
+    ``threshold``, but never sooner than ``min_interval`` seconds after the
+    last analyzed frame and never later than ``max_interval`` seconds, so
+    static footage is still checked and fast scenes are sampled more
+    densely than the fixed stride.
+"""
+import cv2
+import numpy as np
+
+SAMPLING_POLICIES = ('stride', 'motion', 'scene')
+
+
+class _Policy:
+    # The most frames that can pass between two analyzed frames
+    max_gap = 1
+
+    def __init__(self):
+        self.frames = 0
+        self.reasons = {}
+
+    def _select(self, index, frame):
+        raise NotImplementedError
+
+    def __call__(self, index, frame):
+        self.frames += 1
+        reason = self._select(index, frame)
+        if reason:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return bool(reason)
+
+    def waiting(self, index):
+        """True when choosing frame ``index`` needs the pending selected frames analyzed first."""
+        return False
+
+    def stats(self):
+        selected = sum(self.reasons.values())
+        return {
+            'frames': self.frames,
+            'selected': selected,
+            'selected_fraction': round(selected / self.frames, 4) if self.frames else None,
+            'reasons': dict(self.reasons),
+        }
+
+
+class FixedStride(_Policy):
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.max_gap = every
+
+    def _select(self, index, frame):
+        return 'stride' if index % self.every == 0 else None
+
+
+class TrackMotion(_Policy):
+    """Backs off to ``max_every`` while ``tracker.motion()`` stays under ``threshold``."""
+
+    def __init__(self, tracker, every, max_every, threshold):
+        super().__init__()
+        self.tracker = tracker
+        self.every = every
+        self.max_every = max_every
+        self.threshold = threshold
+        self.max_gap = max_every
+        self._last = None
+
+    def _still(self):
+        motion = self.tracker.motion()
+        return motion is not None and motion < self.threshold
+
+    def waiting(self, index):
+        # Only backing off can skip frames; motion read before the last
+        # selected frame was tracked may already be out of date
+        if self._last is None or index - self._last < self.every or not self._still():
+            return False
+        return self.tracker.last_update is None or self.tracker.last_update < self._last
+
+    def _select(self, index, frame):
+        if self._last is None:
+            self._last = index
+            return 'first'
+        still = self._still()
+        if index - self._last >= (self.max_every if still else self.every):
+            self._last = index
+            return 'still' if still else 'stride'
+        return None
+
+
+def thumbnail(frame, size=(64, 36)):
+    """Grayscale ``size`` thumbnail of a BGR frame as float32; area averaging keeps it robust to noise."""
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.float32)
+
+
+class SceneChange(_Policy):
+    """Analyzes a frame when it differs enough from the last analyzed one, within an interval in seconds."""
+
+    def __init__(self, fps, min_interval=0.1, max_interval=1.0, threshold=0.02, size=(64, 36)):
+        super().__init__()
+        fps = fps if fps and fps > 0 else 30.0
+        self.min_frames = max(1, round(min_interval * fps))
+        self.max_frames = max(self.min_frames, round(max_interval * fps))
+        self.max_gap = self.max_frames
+        self.threshold = threshold
+        self.size = size
+        self.last_score = None
+        self._reference = None
+        self._last = None
+        self._scores = 0.0
+        self._scored = 0
+
+    def _select(self, index, frame):
+        if self._last is not None and index - self._last < self.min_frames:
+            return None
+        small = thumbnail(frame, self.size)
+        if self._last is None:
+            reason = 'first'
+        else:
+            self.last_score = float(np.mean(np.abs(small - self._reference))) / 255.0
+            self._scores += self.last_score
+            self._scored += 1
+            if self.last_score >= self.threshold:
+                reason = 'change'
+            elif index - self._last >= self.max_frames:
+                reason = 'max_interval'
+            else:
+                return None
+        self._reference = small
+        self._last = index
+        return reason
+
+    def stats(self):
+        stats = super().stats()
+        stats['min_frames'] = self.min_frames
+        stats['max_frames'] = self.max_frames
+        stats['mean_score'] = round(self._scores / self._scored, 5) if self._scored else None
+        return stats
@@ -0,0 +1,61 @@
+"""Production entry point for the worker safety API: ``python serve.py``.
+
+The master loads both YOLO models and runs them once (single-threaded, so
+torch's thread pool is never copied into a fork), then serves app.py from
+WEB_WORKERS forked processes (see common/prefork.py) on PORT that share the
+weights copy-on-write. Each worker runs INFERENCE_THREADS torch threads, by
+default the cores split evenly between the workers.
+
+Workers are recycled after WEB_MAX_REQUESTS requests (0 disables; plus up
+to WEB_MAX_REQUESTS_JITTER) or above WEB_MAX_RSS_MB of resident memory;
+``kill -HUP`` on the master replaces them all without dropping requests.
+GET /ready answers 200 once a worker has run its warm-up inference.
+
+Each worker keeps its own job and chunk process pools, and output cleanup
+runs in the master. Live streams and /metrics are per worker, so route the
+/streams endpoints to a single worker (or run WEB_WORKERS=1) when using them.
+"""
+import logging
+import os
+
+from common.prefork import PreforkServer
+
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', 2))
+INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or max(1, (os.cpu_count() or 1) // WEB_WORKERS)
+
+
+def load_app():
+    import app
+    app.init_worker_process(1)
+    app.warmup()
+    return app.app
+
+
+def worker_init():
+    import app
+    app.init_worker_process(INFERENCE_THREADS)
+
+
+def warmup():
+    import app
+    app.warmup()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    PreforkServer(
+        load_app,
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', 5000)),
+        workers=WEB_WORKERS,
+        worker_init=worker_init,
+        warmup=warmup,
+        max_requests=int(os.environ.get('WEB_MAX_REQUESTS', 0)),
+        max_requests_jitter=int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 0)),
+        max_rss_bytes=int(float(os.environ.get('WEB_MAX_RSS_MB', 0)) * 2 ** 20),
+        graceful_timeout=float(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30)),
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
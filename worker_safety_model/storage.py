@@ -0,0 +1,191 @@
+"""Bookkeeping and retention for processed media in OUTPUT_FOLDER.
+
+Every output is recorded with its size, creation time and last access in a
+local SQLite index shared by the web process and the job workers. A
+background thread removes outputs older than ``max_age`` and, while the
+folder is over ``max_bytes``, the least recently accessed ones. Files that
+appear in the folder without a record (written before the index existed)
+are adopted on the next cleanup pass.
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class OutputStore:
+    """Index of the files in ``folder``; every call opens its own connection like JobStore.
+
+    ``max_age`` (seconds) and ``max_bytes`` of 0 disable the corresponding
+    limit. Outputs younger than ``grace`` seconds are never evicted for size,
+    so a client always gets a chance to fetch what it was just given.
+    """
+
+    _COLUMNS = ('name', 'size', 'created', 'accessed', 'etag')
+
+    def __init__(self, folder, path, max_age=0, max_bytes=0, grace=300, touch_interval=60):
+        self.folder = folder
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.grace = grace
+        self.touch_interval = touch_interval
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self.last_cleanup = None
+        self._evict_hooks = []
+        self._stop = threading.Event()
+        self._thread = None
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS outputs ('
+                'name TEXT PRIMARY KEY, size INTEGER NOT NULL, created REAL NOT NULL, '
+                'accessed REAL NOT NULL, etag TEXT NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS outputs_accessed ON outputs (accessed)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def file_path(self, name):
+        return os.path.join(self.folder, name)
+
+    def add(self, name, created=None):
+        """Record a file just written to the folder and return its row."""
+        stat = os.stat(self.file_path(name))
+        created = created or time.time()
+        # Output names are unique, so size and modification time identify the content
+        record = {
+            'name': name,
+            'size': stat.st_size,
+            'created': created,
+            'accessed': created,
+            'etag': f"{stat.st_size:x}-{int(stat.st_mtime_ns):x}",
+        }
+        with self._connect() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO outputs (name, size, created, accessed, etag) VALUES (?, ?, ?, ?, ?)',
+                tuple(record[column] for column in self._COLUMNS)
+            )
+        return record
+
+    def get(self, name):
+        with self._connect() as db:
+            row = db.execute(f"SELECT {', '.join(self._COLUMNS)} FROM outputs WHERE name = ?", (name,)).fetchone()
+        return dict(zip(self._COLUMNS, row)) if row else None
+
+    def touch(self, name):
+        """Mark an output as used now; writes at most once per ``touch_interval``."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute('UPDATE outputs SET accessed = ? WHERE name = ? AND accessed < ?',
+                       (now, name, now - self.touch_interval))
+
+    def on_evict(self, hook):
+        """Call ``hook(names)`` with the names of outputs removed by :meth:`cleanup`."""
+        self._evict_hooks.append(hook)
+
+    def _remove(self, names):
+        removed = []
+        for name in names:
+            try:
+                os.remove(self.file_path(name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove output {name}: {str(e)}")
+                continue
+            removed.append(name)
+        with self._connect() as db:
+            db.executemany('DELETE FROM outputs WHERE name = ?', [(name,) for name in removed])
+        for hook in self._evict_hooks:
+            hook(removed)
+        return removed
+
+    def _sync(self):
+        """Adopt untracked files and forget records whose file is gone."""
+        with self._connect() as db:
+            known = {name for name, in db.execute('SELECT name FROM outputs')}
+        present = set()
+        for entry in os.scandir(self.folder):
+            # Directories are in-progress video segments
+            if not entry.is_file():
+                continue
+            present.add(entry.name)
+            if entry.name not in known:
+                self.add(entry.name, created=entry.stat().st_mtime)
+        gone = known - present
+        if gone:
+            self._remove(sorted(gone))
+
+    def cleanup(self):
+        """Apply the age and size limits once; returns (files removed, bytes removed)."""
+        self._sync()
+        now = time.time()
+        expired = []
+        with self._connect() as db:
+            if self.max_age:
+                expired = db.execute('SELECT name, size FROM outputs WHERE created < ?', (now - self.max_age,)).fetchall()
+            over_quota = []
+            if self.max_bytes:
+                total = db.execute('SELECT COALESCE(SUM(size), 0) FROM outputs').fetchone()[0]
+                total -= sum(size for _, size in expired)
+                expired_names = {name for name, _ in expired}
+                for name, size in db.execute(
+                    'SELECT name, size FROM outputs WHERE created < ? ORDER BY accessed', (now - self.grace,)
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    if name in expired_names:
+                        continue
+                    over_quota.append((name, size))
+                    total -= size
+        evicted = expired + over_quota
+        if evicted:
+            removed = set(self._remove([name for name, _ in evicted]))
+            evicted = [(name, size) for name, size in evicted if name in removed]
+            freed = sum(size for _, size in evicted)
+            self.evicted_files += len(evicted)
+            self.evicted_bytes += freed
+            logger.info(f"Evicted {len(evicted)} outputs ({freed} bytes): {len(expired)} expired, {len(over_quota)} over quota")
+        self.last_cleanup = now
+        return len(evicted), sum(size for _, size in evicted)
+
+    def start(self, interval=300):
+        """Run :meth:`cleanup` every ``interval`` seconds on a daemon thread."""
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.cleanup()
+                except Exception as e:
+                    logger.error(f"Output cleanup failed: {str(e)}")
+                self._stop.wait(interval)
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=run, name='output-cleanup', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def usage(self):
+        with self._connect() as db:
+            files, total = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outputs').fetchone()
+        disk = shutil.disk_usage(self.folder)
+        return {
+            'files': files,
+            'bytes': total,
+            'max_bytes': self.max_bytes or None,
+            'max_age_hours': round(self.max_age / 3600, 2) if self.max_age else None,
+            'evicted_files': self.evicted_files,
+            'evicted_bytes': self.evicted_bytes,
+            'last_cleanup': self.last_cleanup,
+            'disk_total_bytes': disk.total,
+            'disk_free_bytes': disk.free,
+        }
@@ -0,0 +1,263 @@
+"""Live monitoring of a cv2.VideoCapture source (RTSP/HTTP URL, device or file).
+
+A capture thread reads frames as fast as the source delivers them and keeps
+only the latest one, so a slow analysis never builds up latency: frames that
+arrive while the models are busy are dropped and counted. An analysis
+thread runs ``analyze`` on the latest frame at most ``target_fps`` times a
+second and publishes the annotated frame (for MJPEG preview) and any events
+(for Server-Sent Events subscribers).
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+# URL schemes read as live network streams; anything else given as a string,
+# file:// URLs included, is a local file to cv2
+NETWORK_SCHEMES = ('rtsp', 'rtsps', 'rtmp', 'rtmps', 'http', 'https')
+
+
+def parse_source(source):
+    """Device indexes arrive as strings from JSON/forms; cv2 wants them as ints."""
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+
+def is_file_source(source):
+    """True for a path or any URL that isn't one of NETWORK_SCHEMES; False for devices and network streams."""
+    if not isinstance(source, str):
+        return False
+    scheme, separator, _ = source.partition('://')
+    return not separator or scheme.lower() not in NETWORK_SCHEMES
+
+
+class StreamMonitor:
+    """Reads ``source`` and calls ``analyze(frame, timestamp)`` on the latest frame.
+
+    ``analyze`` annotates the frame in place and returns a list of event
+    dicts. File sources are read at their native frame rate (and restarted
+    at the end with ``loop``) so they behave like a live camera.
+    """
+
+    def __init__(self, stream_id, source, analyze, target_fps=2.0, loop=False, jpeg_quality=80,
+                 reconnect_delay=2.0, max_subscriber_backlog=100):
+        self.id = stream_id
+        self.source = parse_source(source)
+        self.analyze = analyze
+        self.target_fps = target_fps
+        self.loop = loop
+        self.jpeg_quality = jpeg_quality
+        self.reconnect_delay = reconnect_delay
+        self.max_subscriber_backlog = max_subscriber_backlog
+
+        self.started = time.time()
+        self.error = None
+        self.frames_read = 0
+        self.frames_analyzed = 0
+        self.frames_dropped = 0
+        self.events_published = 0
+        self.source_fps = 0.0
+
+        self._latest = None  # (sequence, frame, timestamp)
+        self._latest_lock = threading.Condition()
+        self._preview = None  # (sequence, jpeg bytes)
+        self._preview_cond = threading.Condition()
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._capture, name=f'stream-{stream_id}-capture', daemon=True),
+            threading.Thread(target=self._analyze, name=f'stream-{stream_id}-analyze', daemon=True),
+        ]
+
+    @property
+    def running(self):
+        return not self._stop.is_set()
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._latest_lock:
+            self._latest_lock.notify_all()
+        with self._preview_cond:
+            self._preview_cond.notify_all()
+        self._broadcast(None)
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            raise IOError(f"Could not open stream source {self.source!r}")
+        self.source_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        return cap
+
+    def _capture(self):
+        is_file = is_file_source(self.source)
+        sequence = 0
+        cap = None
+        try:
+            while not self._stop.is_set():
+                if cap is None:
+                    try:
+                        cap = self._open()
+                        self.error = None
+                        pace = 1.0 / self.source_fps if is_file and self.source_fps else 0.0
+                        next_frame = time.monotonic()
+                    except IOError as e:
+                        self.error = str(e)
+                        logger.error(self.error)
+                        if is_file:
+                            return
+                        self._stop.wait(self.reconnect_delay)
+                        continue
+
+                ret, frame = cap.read()
+                if not ret:
+                    cap.release()
+                    cap = None
+                    if is_file and not self.loop:
+                        logger.info(f"Stream {self.id}: end of {self.source}")
+                        return
+                    if not is_file:
+                        self.error = 'Source stopped delivering frames, reconnecting'
+                        self._stop.wait(self.reconnect_delay)
+                    continue
+
+                sequence += 1
+                self.frames_read += 1
+                with self._latest_lock:
+                    self._latest = (sequence, frame, time.time() - self.started)
+                    self._latest_lock.notify_all()
+
+                if pace:
+                    # Files are paced to their frame rate so they behave like a live camera
+                    next_frame += pace
+                    delay = next_frame - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    else:
+                        next_frame = time.monotonic()
+        finally:
+            if cap is not None:
+                cap.release()
+            self._stop.set()
+            with self._latest_lock:
+                self._latest_lock.notify_all()
+
+    def _analyze(self):
+        interval = 1.0 / self.target_fps if self.target_fps > 0 else 0.0
+        last_sequence = 0
+        next_run = time.monotonic()
+        while True:
+            with self._latest_lock:
+                while not self._stop.is_set() and (self._latest is None or self._latest[0] == last_sequence):
+                    self._latest_lock.wait(0.5)
+                if self._latest is None or self._latest[0] == last_sequence:
+                    break
+                sequence, frame, timestamp = self._latest
+            # Everything the capture thread read since the last analyzed frame was skipped
+            self.frames_dropped += sequence - last_sequence - 1
+            last_sequence = sequence
+
+            try:
+                events = self.analyze(frame, timestamp)
+            except Exception as e:
+                logger.error(f"Stream {self.id}: analysis failed: {str(e)}")
+                self.error = str(e)
+                events = []
+            self.frames_analyzed += 1
+
+            ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                with self._preview_cond:
+                    self._preview = (sequence, jpeg.tobytes())
+                    self._preview_cond.notify_all()
+            for event in events:
+                self._broadcast({'stream_id': self.id, 'frame': sequence, 'timestamp': round(timestamp, 3), **event})
+
+            next_run = max(next_run + interval, time.monotonic())
+            self._stop.wait(max(0.0, next_run - time.monotonic()))
+            if self._stop.is_set():
+                break
+        self._broadcast(None)
+
+    def _broadcast(self, event):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        if event is not None:
+            self.events_published += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A stalled client loses its oldest events rather than blocking the stream
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def events(self, keepalive=15.0):
+        """Yield Server-Sent Events lines until the stream stops or the client goes away."""
+        subscriber = queue.Queue(maxsize=self.max_subscriber_backlog)
+        with self._subscribers_lock:
+            self._subscribers.add(subscriber)
+        try:
+            yield f"event: hello\ndata: {json.dumps(self.stats())}\n\n"
+            while self.running or not subscriber.empty():
+                try:
+                    event = subscriber.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: {event.get('type', 'message')}\ndata: {json.dumps(event)}\n\n"
+            yield f"event: end\ndata: {json.dumps(self.stats())}\n\n"
+        finally:
+            with self._subscribers_lock:
+                self._subscribers.discard(subscriber)
+
+    def preview(self, boundary='frame'):
+        """Yield multipart/x-mixed-replace parts with each new annotated JPEG."""
+        last = None
+        while self.running or (self._preview is not None and self._preview[0] != last):
+            with self._preview_cond:
+                while self.running and (self._preview is None or self._preview[0] == last):
+                    self._preview_cond.wait(1.0)
+                if self._preview is None or self._preview[0] == last:
+                    break
+                last, jpeg = self._preview
+            yield (f"--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+
+    def stats(self):
+        with self._subscribers_lock:
+            subscribers = len(self._subscribers)
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            'id': self.id,
+            'source': str(self.source),
+            'running': self.running,
+            'error': self.error,
+            'source_fps': self.source_fps,
+            'target_fps': self.target_fps,
+            'analysis_fps': round(self.frames_analyzed / elapsed, 2),
+            'frames_read': self.frames_read,
+            'frames_analyzed': self.frames_analyzed,
+            'frames_dropped': self.frames_dropped,
+            'events_published': self.events_published,
+            'subscribers': subscribers,
+        }
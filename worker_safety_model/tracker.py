@@ -0,0 +1,236 @@
+"""Lightweight SORT-style tracker for the person boxes of a video.
+
+Detections only arrive on sampled frames. Between them each track is moved
+along a constant-velocity estimate so every frame can be annotated, and each
+track keeps the PPE state of its last detection. Detections are matched to
+tracks greedily by IoU against the predicted boxes, falling back to centroid
+distance for small, fast-moving boxes that no longer overlap.
+"""
+import numpy as np
+
+from association import iou_matrix
+
+
+class Track:
+    """One worker: box, velocity, current PPE state and missing-gear intervals."""
+
+    def __init__(self, track_id, bbox, frame_index, missing):
+        self.id = track_id
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.first_bbox = self.bbox
+        self.velocity = np.zeros(4, dtype=np.float32)
+        self.first_frame = frame_index
+        self.last_detection = frame_index
+        self.last_frame = frame_index
+        self.hits = 1
+        self.misses = 0
+        self.missing = []
+        # item -> list of [start_frame, end_frame]; the last one is open while the item is missing
+        self.intervals = {}
+        self.set_missing(frame_index, missing)
+
+    def predict(self, frame_index):
+        """Box extrapolated to ``frame_index`` from the last detection."""
+        return self.bbox + self.velocity * (frame_index - self.last_detection)
+
+    def update(self, frame_index, bbox, missing, smoothing=0.5):
+        bbox = np.asarray(bbox, dtype=np.float32)
+        elapsed = frame_index - self.last_detection
+        if elapsed > 0:
+            velocity = (bbox - self.bbox) / elapsed
+            self.velocity = smoothing * velocity + (1 - smoothing) * self.velocity
+        self.bbox = bbox
+        self.last_detection = frame_index
+        self.hits += 1
+        self.misses = 0
+        self.set_missing(frame_index, missing)
+
+    def set_missing(self, frame_index, missing):
+        for item in missing:
+            if item not in self.missing:
+                self.intervals.setdefault(item, []).append([frame_index, frame_index])
+        self.missing = list(missing)
+        self.mark(frame_index)
+
+    def mark(self, frame_index):
+        """Record that the track was shown on ``frame_index`` with its current state."""
+        self.last_frame = max(self.last_frame, frame_index)
+        for item in self.missing:
+            self.intervals[item][-1][1] = frame_index
+
+    def speed(self):
+        """Centre displacement per frame relative to the box height."""
+        dx = (self.velocity[0] + self.velocity[2]) / 2
+        dy = (self.velocity[1] + self.velocity[3]) / 2
+        height = max(float(self.bbox[3] - self.bbox[1]), 1.0)
+        return float(np.hypot(dx, dy)) / height
+
+    def report(self, fps):
+        intervals = []
+        for item, spans in sorted(self.intervals.items()):
+            for start, end in spans:
+                interval = {'item': item, 'start_frame': start, 'end_frame': end}
+                if fps:
+                    interval['start_time'] = round(start / fps, 3)
+                    interval['end_time'] = round((end + 1) / fps, 3)
+                intervals.append(interval)
+        intervals.sort(key=lambda interval: (interval['start_frame'], interval['item']))
+        return {
+            'id': self.id,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'missing_intervals': intervals,
+        }
+
+
+class IoUTracker:
+    """Assigns stable IDs to person detections across sampled frames.
+
+    ``update`` must be called with frames in increasing order. A track is
+    dropped once it has gone unmatched for more than ``max_age`` frames.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=0.5, max_age=30):
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_age = max_age
+        self.tracks = []
+        self.finished = []
+        self.first_update = None
+        self.last_update = None
+        self._next_id = 1
+
+    def _match(self, predicted, boxes):
+        """Greedy assignment; returns {detection index: track index}."""
+        matches = {}
+        if not len(predicted) or not len(boxes):
+            return matches
+        iou = iou_matrix(predicted, boxes)
+        for t, d in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+            if iou[t, d] < self.iou_threshold:
+                break
+            if d not in matches and t not in matches.values():
+                matches[d] = t
+
+        # Centroid fallback for detections the IoU pass left unmatched
+        centers_t = (predicted[:, :2] + predicted[:, 2:]) / 2
+        centers_d = (boxes[:, :2] + boxes[:, 2:]) / 2
+        scale = np.maximum(predicted[:, 3] - predicted[:, 1], 1.0)
+        distance = np.linalg.norm(centers_t[:, None] - centers_d[None], axis=2) / scale[:, None]
+        for t, d in zip(*np.unravel_index(np.argsort(distance, axis=None), distance.shape)):
+            if distance[t, d] > self.max_distance:
+                break
+            if d not in matches and t not in matches.values():
+                matches[d] = t
+        return matches
+
+    def update(self, frame_index, boxes, missing):
+        """Match detections on ``frame_index`` and return their tracks in input order.
+
+        ``boxes`` are xyxy person boxes and ``missing`` the missing items of
+        each one.
+        """
+        if self.first_update is None:
+            self.first_update = frame_index
+        self.last_update = frame_index
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        predicted = np.array([t.predict(frame_index) for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+        matches = self._match(predicted, boxes)
+
+        assigned = []
+        for d, box in enumerate(boxes):
+            if d in matches:
+                track = self.tracks[matches[d]]
+                track.update(frame_index, box, missing[d])
+            else:
+                track = Track(self._next_id, box, frame_index, missing[d])
+                self._next_id += 1
+                self.tracks.append(track)
+            assigned.append(track)
+
+        matched = set(matches.values())
+        alive = []
+        for t, track in enumerate(self.tracks[:len(predicted)]):
+            if t not in matched:
+                track.misses += 1
+                if frame_index - track.last_detection > self.max_age:
+                    self.finished.append(track)
+                    continue
+            alive.append(track)
+        self.tracks = alive + self.tracks[len(predicted):]
+        return assigned
+
+    def visible(self, frame_index):
+        """(track, predicted box) for tracks seen on the most recent detection."""
+        return [(track, track.predict(frame_index)) for track in self.tracks if track.misses == 0]
+
+    def motion(self):
+        """Fastest relative speed among visible tracks, or None when none has a velocity yet."""
+        speeds = [track.speed() for track in self.tracks if track.misses == 0 and track.hits > 1]
+        return max(speeds) if speeds else None
+
+    def report(self, fps):
+        tracks = sorted(self.finished + self.tracks, key=lambda track: track.id)
+        return [track.report(fps) for track in tracks]
+
+    def edges(self):
+        """What :func:`stitch_reports` needs to join this tracker's IDs to a neighbouring frame range."""
+        return {
+            'first_update': self.first_update,
+            'last_update': self.last_update,
+            'tracks': {
+                track.id: (track.first_frame, track.first_bbox.tolist(), track.last_detection, track.bbox.tolist())
+                for track in self.finished + self.tracks
+            },
+        }
+
+
+def _extend(worker, continuation):
+    """Append the report of ``continuation`` to ``worker``, joining intervals that touch."""
+    worker['last_frame'] = max(worker['last_frame'], continuation['last_frame'])
+    for interval in continuation['missing_intervals']:
+        for existing in worker['missing_intervals']:
+            if existing['item'] == interval['item'] and existing['end_frame'] + 1 >= interval['start_frame']:
+                existing['end_frame'] = interval['end_frame']
+                if 'end_time' in interval:
+                    existing['end_time'] = interval['end_time']
+                break
+        else:
+            worker['missing_intervals'].append(dict(interval))
+    worker['missing_intervals'].sort(key=lambda interval: (interval['start_frame'], interval['item']))
+
+
+def stitch_reports(chunks, iou_threshold=0.3):
+    """Merge the worker reports of consecutive frame ranges tracked separately.
+
+    ``chunks`` holds one (report, edges) pair per range, in order. A track
+    that starts on the first detection of a range continues a track of the
+    previous range that was still detected on its last one when their boxes
+    overlap by ``iou_threshold``; it keeps the earlier ID and its missing
+    intervals extend the earlier ones.
+    """
+    workers = {}
+    next_id = 1
+    previous = []  # (stitched id, box) of tracks on the previous range's last detection
+    for report, edges in chunks:
+        tracks = edges['tracks']
+        starts = [local for local, edge in tracks.items() if edge[0] == edges['first_update']]
+        mapping = {}
+        if previous and starts:
+            iou = iou_matrix([box for _, box in previous], [tracks[local][1] for local in starts])
+            for p, s in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[p, s] < iou_threshold:
+                    break
+                if starts[s] not in mapping and previous[p][0] not in mapping.values():
+                    mapping[starts[s]] = previous[p][0]
+
+        for worker in report:
+            if worker['id'] in mapping:
+                _extend(workers[mapping[worker['id']]], worker)
+                continue
+            mapping[worker['id']] = next_id
+            workers[next_id] = {**worker, 'id': next_id, 'missing_intervals': [dict(i) for i in worker['missing_intervals']]}
+            next_id += 1
+
+        previous = [(mapping[local], edge[3]) for local, edge in tracks.items() if edge[2] == edges['last_update']]
+    return [workers[worker_id] for worker_id in sorted(workers)]
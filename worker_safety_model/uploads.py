@@ -0,0 +1,183 @@
+"""Holding /process-media uploads without a trip through UPLOAD_FOLDER.
+
+Images are buffered in memory and decoded with ``cv2.imdecode``. Videos stay
+in memory up to a size threshold and roll over to a named temporary file in
+a local spool directory above it. cv2.VideoCapture only opens paths, so an
+in-memory clip is written to a RAM-backed directory (/dev/shm where present)
+just for the time it is decoded. Every upload is hashed while it is received,
+for the result cache in dedup.py.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from flask import Request
+
+MEMORY_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+IMAGE_FORMATS = {
+    'png': ('.png', 'image/png'),
+    'jpg': ('.jpg', 'image/jpeg'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+}
+
+
+class SpooledUpload(io.RawIOBase):
+    """A writable upload buffer that moves to a named temp file past ``max_size`` bytes.
+
+    Unlike tempfile.SpooledTemporaryFile the rolled-over file has a path
+    (:attr:`path`), so a video can be decoded from it without another copy.
+    With ``max_size`` None it never leaves memory. The SHA-256 of everything
+    written is kept up to date in :meth:`hexdigest`.
+    """
+
+    def __init__(self, max_size=None, directory=None, suffix=''):
+        self.max_size = max_size
+        self.directory = directory
+        self.suffix = suffix
+        self._file = io.BytesIO()
+        self._rolled = False
+        self._hash = hashlib.sha256()
+
+    @property
+    def rolled(self):
+        return self._rolled
+
+    @property
+    def path(self):
+        """Path of the rolled-over temp file, or None while the data is in memory."""
+        if not self._rolled:
+            return None
+        self._file.flush()
+        return self._file.name
+
+    def _rollover(self):
+        spooled = tempfile.NamedTemporaryFile(prefix='upload_', suffix=self.suffix, dir=self.directory)
+        spooled.write(self._file.getbuffer())
+        spooled.seek(self._file.tell())
+        self._file = spooled
+        self._rolled = True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        if not self._rolled and self.max_size is not None and self._file.tell() + len(data) > self.max_size:
+            self._rollover()
+        # The parser only appends, so hashing here covers the upload exactly once
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def getvalue(self):
+        """The whole upload as bytes (only while it is held in memory)."""
+        return self._file.getvalue()
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def spooling_request(max_size, directory=None, is_video=None):
+    """A flask Request class whose file uploads are kept in memory rather than on disk.
+
+    Uploads for which ``is_video(filename)`` holds go into a
+    :class:`SpooledUpload` of ``max_size`` bytes; everything else (images,
+    bounded by MAX_CONTENT_LENGTH) stays in memory.
+    """
+
+    class SpoolingRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            if filename and is_video is not None and is_video(filename):
+                return SpooledUpload(max_size, directory, suffix=os.path.splitext(filename)[1])
+            return SpooledUpload()
+
+    return SpoolingRequest
+
+
+def upload_digest(file):
+    """SHA-256 hex digest of an uploaded file, computed while it was received where possible."""
+    stream = file.stream
+    if isinstance(stream, SpooledUpload):
+        return stream.hexdigest()
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(1 << 20), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def read_upload(file):
+    """The bytes of a werkzeug FileStorage, without copying an in-memory buffer twice."""
+    stream = file.stream
+    if isinstance(stream, (io.BytesIO, SpooledUpload)) and not getattr(stream, 'rolled', False):
+        return stream.getvalue()
+    stream.seek(0)
+    return stream.read()
+
+
+def decode_image(data):
+    """Decode an encoded image held in memory into a BGR frame, or None."""
+    if not data:
+        return None
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def image_format(filename):
+    """(cv2 encoding suffix, mimetype) for an output image named ``filename``; JPEG unless it is a PNG."""
+    return IMAGE_FORMATS.get(filename.rsplit('.', 1)[-1].lower(), IMAGE_FORMATS['jpg'])
+
+
+def encode_image(frame, filename, jpeg_quality=95):
+    """Encode ``frame`` in the format of ``filename``; returns (bytes, mimetype)."""
+    suffix, mimetype = image_format(filename)
+    params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if suffix == '.jpg' else []
+    ok, encoded = cv2.imencode(suffix, frame, params)
+    if not ok:
+        raise ValueError(f"Could not encode {filename}")
+    return encoded.tobytes(), mimetype
+
+
+@contextmanager
+def video_path(file, directory=MEMORY_DIR):
+    """Yield a path cv2.VideoCapture can open for an uploaded video.
+
+    A rolled-over :class:`SpooledUpload` is used in place; an upload still in
+    memory is written to a temp file in ``directory`` that is removed
+    afterwards.
+    """
+    stream = file.stream
+    if isinstance(stream, SpooledUpload) and stream.rolled:
+        yield stream.path
+        return
+    suffix = os.path.splitext(file.filename or '')[1]
+    with tempfile.NamedTemporaryFile(prefix='upload_', suffix=suffix, dir=directory) as spooled:
+        spooled.write(read_upload(file))
+        spooled.flush()
+        yield spooled.name
@@ -0,0 +1,117 @@
+"""Splitting one video across worker processes.
+
+The clip is cut into contiguous frame ranges that start on a sampling
+boundary, each range is annotated into its own segment file by a worker
+process with its own models, and the segments are concatenated back in
+order.
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def plan_chunks(total_frames, workers, align=1, min_frames=1):
+    """Split ``total_frames`` into at most ``workers`` (start, end) ranges.
+
+    Every start is a multiple of ``align`` so a fixed sampling stride lands
+    on the same frames as a sequential pass, and no range is shorter than
+    ``min_frames``. The last range ends at None (read to the end) because
+    container frame counts are estimates. A count of 0 or less (unknown, as
+    with streamed or badly muxed containers) gives a single range.
+    """
+    min_frames = max(min_frames, 1)
+    if workers <= 1 or total_frames < 2 * min_frames:
+        return [(0, None)]
+    count = min(workers, total_frames // min_frames)
+    size = -(-total_frames // count)
+    size = -(-size // align) * align
+    starts = list(range(0, total_frames, size))[:count] or [0]
+    return [(start, end) for start, end in zip(starts, starts[1:] + [None])]
+
+
+class ChunkPool:
+    """A lazily started spawn-context process pool for range workers."""
+
+    def __init__(self, max_workers, initializer=None, initargs=()):
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def map(self, fn, *iterables):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                    initargs=self.initargs
+                )
+            executor = self._executor
+        return list(executor.map(fn, *iterables))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def segment_format(codecs):
+    """(file extension, codecs) for range segments.
+
+    With ffmpeg the segments use the final codecs and are joined without
+    re-encoding. Without it they are decoded and encoded once more when
+    joined, so they are written as Motion JPEG at full quality to keep that
+    extra generation close to lossless.
+    """
+    if shutil.which('ffmpeg'):
+        return '.mp4', codecs
+    return '.avi', [('MJPG', 'Motion JPEG')]
+
+
+def concat_segments(segment_paths, output_path, open_writer):
+    """Join ``segment_paths`` into ``output_path`` in order.
+
+    Uses ``ffmpeg -c copy`` when ffmpeg is on the PATH, which does not touch
+    the encoded frames. Otherwise the segments are decoded and written
+    through ``open_writer()``, which must return an opened cv2.VideoWriter.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as listing:
+            for path in segment_paths:
+                listing.write(f"file '{os.path.abspath(path)}'\n")
+        try:
+            subprocess.run(
+                [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', listing.name, '-c', 'copy', output_path],
+                check=True
+            )
+            return
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"ffmpeg concat failed, re-encoding segments instead: {str(e)}")
+        finally:
+            os.remove(listing.name)
+
+    out = open_writer()
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        out.release()
@@ -0,0 +1,194 @@
+import logging
+import queue
+import threading
+import time
+
+from common.metrics import queue_depth, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class StageStats:
+    """Frame count and busy time of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+
+    @property
+    def fps(self):
+        return self.frames / self.busy if self.busy else 0.0
+
+
+class VideoPipeline:
+    """Overlaps decode, inference and encode of a video on separate threads.
+
+    A decoder thread reads frames from ``cap`` into a bounded queue. The
+    calling thread pulls frames in order, asks ``select(index, frame)``
+    whether each one should be analyzed, and hands ``analyze`` a chunk of
+    ``(index, frame, selected)`` tuples once ``batch_size`` selected frames
+    have been gathered (or ``queue_size`` frames are pending), so detection
+    can run batched. A ``select`` with a ``waiting(index)`` method (see
+    sampling.py) gets the pending chunk analyzed first whenever it returns
+    True. ``analyze`` annotates the frames in place. An encoder
+    thread writes the chunk to ``writer`` from a second bounded queue, which
+    keeps memory flat on long clips.
+
+    Per-stage throughput and queue occupancy are logged every
+    ``log_interval`` seconds and once more at the end. ``progress``, if
+    given, is called with the number of frames in each analyzed chunk.
+
+    Frame indexes start at ``first_index`` (the capture's current position)
+    and at most ``max_frames`` frames are read, so a worker can process one
+    range of a longer video.
+    """
+
+    def __init__(self, cap, writer, analyze, select, batch_size=8, queue_size=32,
+                 total_frames=0, log_interval=5.0, progress=None, first_index=0, max_frames=None):
+        self.cap = cap
+        self.writer = writer
+        self.analyze = analyze
+        self.select = select
+        self._waiting = getattr(select, 'waiting', None)
+        self.batch_size = max(1, batch_size)
+        self.max_chunk = max(self.batch_size, queue_size)
+        self.total_frames = total_frames
+        self.log_interval = log_interval
+        self.progress = progress
+        self.first_index = first_index
+        self.max_frames = max_frames
+
+        self.decode_queue = queue.Queue(maxsize=queue_size)
+        self.encode_queue = queue.Queue(maxsize=queue_size)
+        self.decode_stats = StageStats('decode')
+        self.infer_stats = StageStats('inference')
+        self.encode_stats = StageStats('encode')
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        # Give up once the pipeline is stopping so a blocked producer can exit
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode(self):
+        index = self.first_index
+        try:
+            while not self._stop.is_set():
+                if self.max_frames is not None and index - self.first_index >= self.max_frames:
+                    break
+                start = time.perf_counter()
+                ret, frame = self.cap.read()
+                elapsed = time.perf_counter() - start
+                self.decode_stats.busy += elapsed
+                if not ret:
+                    break
+                stage_seconds.observe(elapsed, stage='decode', model='')
+                self.decode_stats.frames += 1
+                if not self._put(self.decode_queue, (index, frame)):
+                    return
+                index += 1
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            self._put(self.decode_queue, _END)
+
+    def _encode(self):
+        try:
+            while True:
+                item = self.encode_queue.get()
+                if item is _END:
+                    return
+                start = time.perf_counter()
+                self.writer.write(item)
+                elapsed = time.perf_counter() - start
+                self.encode_stats.busy += elapsed
+                self.encode_stats.frames += 1
+                stage_seconds.observe(elapsed, stage='encode', model='')
+        except Exception as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _log(self, final=False):
+        stages = ', '.join(f"{s.name} {s.fps:.1f} fps" for s in (self.decode_stats, self.infer_stats, self.encode_stats))
+        logger.info(
+            f"{'Finished' if final else 'Processed'} {self.encode_stats.frames}/{self.total_frames} frames | "
+            f"{stages} | decode queue {self.decode_queue.qsize()}/{self.decode_queue.maxsize}, "
+            f"encode queue {self.encode_queue.qsize()}/{self.encode_queue.maxsize}"
+        )
+
+    def _flush(self, chunk):
+        queue_depth.set(self.decode_queue.qsize(), queue='video_decode')
+        queue_depth.set(self.encode_queue.qsize(), queue='video_encode')
+        start = time.perf_counter()
+        self.analyze(chunk)
+        self.infer_stats.busy += time.perf_counter() - start
+        self.infer_stats.frames += len(chunk)
+        if self.progress:
+            self.progress(len(chunk))
+        for _, frame, _ in chunk:
+            if not self._put(self.encode_queue, frame):
+                break
+
+    def run(self):
+        """Process the whole video; returns the number of frames written."""
+        decoder = threading.Thread(target=self._decode, name='video-decode', daemon=True)
+        encoder = threading.Thread(target=self._encode, name='video-encode', daemon=True)
+        decoder.start()
+        encoder.start()
+
+        next_log = time.monotonic() + self.log_interval
+        chunk, selected = [], 0
+        try:
+            while not self._stop.is_set():
+                # A failed encoder stops the decoder before it can queue the end marker
+                try:
+                    item = self.decode_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    break
+                index, frame = item
+                if selected and self._waiting and self._waiting(index):
+                    self._flush(chunk)
+                    chunk, selected = [], 0
+                start = time.perf_counter()
+                is_selected = bool(self.select(index, frame))
+                self.infer_stats.busy += time.perf_counter() - start
+                chunk.append((index, frame, is_selected))
+                selected += is_selected
+                if selected >= self.batch_size or len(chunk) >= self.max_chunk:
+                    self._flush(chunk)
+                    chunk, selected = [], 0
+
+                if time.monotonic() >= next_log:
+                    self._log()
+                    next_log = time.monotonic() + self.log_interval
+            if chunk and not self._stop.is_set():
+                self._flush(chunk)
+        except Exception:
+            self._stop.set()
+            raise
+        finally:
+            # The encoder drains whatever was queued before it sees the end marker
+            while encoder.is_alive():
+                try:
+                    self.encode_queue.put(_END, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            decoder.join()
+            encoder.join()
+
+        if self._errors:
+            raise self._errors[0]
+        self._log(final=True)
+        return self.encode_stats.frames